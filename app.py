@@ -2,16 +2,29 @@ import sqlite3
 import json
 import os
 import sys 
+import re
+import time
+import hashlib
+import random
+import queue
+import threading
+import base64
 import functools
+import ipaddress
 import click
 import io
-import csv
-import webbrowser
-from flask import Flask, render_template, request, redirect, url_for, g, flash, jsonify, session, Response, send_from_directory
+import zlib
+import secrets
+import signal
+from flask import Flask, render_template, request, redirect, url_for, g, flash, jsonify, session, Response, has_request_context
+from flask import before_render_template, template_rendered, has_app_context
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
 from werkzeug.security import check_password_hash, generate_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, send_file
+from urllib.parse import quote
 from datetime import date, timedelta, datetime
-from collections import Counter
+from collections import Counter, OrderedDict
 
 # --- App Configuration ---
 app = Flask(__name__)
@@ -21,15 +34,110 @@ app.secret_key = os.environ.get('SECRET_KEY', 'a-super-secret-key-that-you-shoul
 UPLOAD_FOLDER = os.path.join(app.root_path, 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# ไฟล์ใหม่ถูกเก็บแบบ content-addressed ใน blobs/<2 ตัวแรกของ hash>/<2 ตัวถัดไป>/<sha256>.<ext>
+app.config['BLOB_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'blobs')
+# ให้ front-end server ส่งไฟล์แทนหลังตรวจสิทธิ์แล้ว: '' (Python ส่งเอง), 'x-sendfile' (Apache/lighttpd) หรือ 'x-accel-redirect' (nginx)
+app.config['UPLOAD_SENDFILE'] = os.environ.get('UPLOAD_SENDFILE', '').lower()
+app.config['UPLOAD_ACCEL_PREFIX'] = os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')  # internal location ที่ชี้ไปยัง UPLOAD_FOLDER
+app.config['RENDITION_CACHE_MAX_AGE'] = int(os.environ.get('RENDITION_CACHE_MAX_AGE', 86400))  # วินาที
+
+# Configuration for Image Renditions (ต้องติดตั้ง Pillow ถ้าไม่มีจะใช้ไฟล์ต้นฉบับแทน)
+IMAGE_RENDITIONS = {'thumb': 320, 'medium': 1280}  # ความยาวด้านที่ยาวที่สุด (px)
+app.config['RENDITION_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'renditions')
+app.config['RENDITION_QUALITY'] = int(os.environ.get('RENDITION_QUALITY', 82))
 
 DATABASE = os.path.join(app.instance_path, 'maintenance.db')
 
+# Configuration for List Pagination
+app.config['ASSETS_PER_PAGE'] = int(os.environ.get('ASSETS_PER_PAGE', 50))
+app.config['MAX_PER_PAGE'] = int(os.environ.get('MAX_PER_PAGE', 500))
+app.config['COUNT_CACHE_TTL'] = int(os.environ.get('COUNT_CACHE_TTL', 60))  # วินาที
+app.config['COUNT_CACHE_SIZE'] = int(os.environ.get('COUNT_CACHE_SIZE', 256))  # จำนวนคิวรีนับแถวที่ cache ไว้ต่อ process
+app.config['PM_EVENTS_CACHE_SIZE'] = int(os.environ.get('PM_EVENTS_CACHE_SIZE', 64))  # จำนวนช่วงวันที่ที่ cache ไว้ต่อ process
+app.config['PM_SCHEDULE_HORIZON_DAYS'] = int(os.environ.get('PM_SCHEDULE_HORIZON_DAYS', 365))  # ช่วงที่คำนวณกำหนดการ PM ล่วงหน้า
+app.config['PM_SCHEDULE_INLINE_MAX'] = int(os.environ.get('PM_SCHEDULE_INLINE_MAX', 200))  # สินทรัพย์/จุดที่เปลี่ยนมากสุดที่คำนวณใหม่ระหว่าง request
+app.config['PARTS_FORECAST_WINDOW_DAYS'] = int(os.environ.get('PARTS_FORECAST_WINDOW_DAYS', 90))  # ช่วงย้อนหลังที่ใช้คำนวณอัตราการใช้อะไหล่
+app.config['PARTS_LEAD_TIME_DAYS'] = int(os.environ.get('PARTS_LEAD_TIME_DAYS', 14))  # เวลารอของหลังสั่งซื้อ
+app.config['PARTS_REVIEW_DAYS'] = int(os.environ.get('PARTS_REVIEW_DAYS', 30))  # ช่วงเวลาที่แต่ละรอบการสั่งซื้อควรพอใช้
+
+# Configuration for Background Jobs (flask worker)
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))  # วินาทีที่รอเมื่อคิวว่าง
+app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+app.config['JOB_RETRY_BASE_SECONDS'] = float(os.environ.get('JOB_RETRY_BASE_SECONDS', 10))  # รอ 10, 20, 40, ... วินาที
+app.config['JOB_RETRY_MAX_SECONDS'] = float(os.environ.get('JOB_RETRY_MAX_SECONDS', 3600))
+app.config['JOB_LOCK_TIMEOUT'] = int(os.environ.get('JOB_LOCK_TIMEOUT', 900))  # งานที่ทำนานกว่านี้ถือว่า worker ตายแล้ว
+app.config['EXPORT_FOLDER'] = os.path.join(app.instance_path, 'exports')  # ไฟล์ส่งออกที่สร้างโดย worker
+
+# Configuration for SQLite Connections
+# แต่ละ profile คือชุด PRAGMA ที่จะถูกตั้งค่าครั้งเดียวตอนสร้าง connection
+SQLITE_PRAGMA_PROFILES = {
+    'default': {
+        'journal_mode': 'WAL',          # ผู้อ่านไม่ถูกบล็อกโดยผู้เขียน
+        'synchronous': 'NORMAL',        # ปลอดภัยเมื่อใช้ร่วมกับ WAL และเร็วกว่า FULL
+        'busy_timeout': 5000,           # รอ lock แทนการ error "database is locked" ทันที
+        'foreign_keys': 'ON',
+        'cache_size': -16000,           # ~16MB ต่อ connection
+        'mmap_size': 268435456,         # 256MB
+        'temp_store': 'MEMORY',
+    },
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 10000,
+        'foreign_keys': 'ON',
+        'cache_size': -16000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    },
+    'low-memory': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'foreign_keys': 'ON',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    },
+}
+app.config['SQLITE_PRAGMA_PROFILE'] = os.environ.get('SQLITE_PRAGMA_PROFILE', 'default')
+app.config['DB_POOL_READERS'] = int(os.environ.get('DB_POOL_READERS', 8))
+app.config['DB_POOL_WRITERS'] = int(os.environ.get('DB_POOL_WRITERS', 1))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # วินาที
+
+# Configuration for Metrics (/metrics ในรูปแบบ Prometheus)
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') != '0'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')  # ถ้าตั้งไว้ต้องส่ง Authorization: Bearer <token>
+app.config['METRICS_ALLOW'] = os.environ.get('METRICS_ALLOW', '127.0.0.1/32,::1/128')  # เครือข่ายที่ดู /metrics ได้เมื่อไม่ได้ตั้ง token
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))  # 0 = ปิด slow query log
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG', os.path.join(app.instance_path, 'slow_queries.jsonl'))
+
+# Configuration for Production Server (flask serve หรือ python app.py --prod)
+app.config['SERVE_BIND'] = os.environ.get('SERVE_BIND', '0.0.0.0:5000')
+app.config['SERVE_WORKERS'] = int(os.environ.get('SERVE_WORKERS', min((os.cpu_count() or 1) * 2 + 1, 8)))  # process (gunicorn)
+app.config['SERVE_THREADS'] = int(os.environ.get('SERVE_THREADS', 4))  # thread ต่อ process
+app.config['SERVE_TIMEOUT'] = int(os.environ.get('SERVE_TIMEOUT', 60))  # วินาที ก่อน worker ที่ค้างถูก restart
+app.config['SERVE_GRACEFUL_TIMEOUT'] = int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))  # วินาทีที่รอ request ที่ค้างอยู่ตอน restart
+app.config['SERVE_MAX_REQUESTS'] = int(os.environ.get('SERVE_MAX_REQUESTS', 5000))  # restart worker หลังจำนวน request นี้ (0 = ไม่ restart)
+
+# Configuration for Startup
+app.config['JINJA_CACHE_FOLDER'] = os.environ.get('JINJA_CACHE_FOLDER', os.path.join(app.instance_path, 'jinja_cache'))  # '' = ปิด
+
+# Configuration for Password Hashing
+# รูปแบบของ Werkzeug เช่น 'scrypt:32768:8:1' (ค่าเริ่มต้น ใช้หน่วยความจำ ~32MB ต่อครั้ง) หรือ 'pbkdf2:sha256:600000'
+# hash เดิมที่ใช้วิธี/ค่า cost อื่นจะถูก hash ใหม่อัตโนมัติเมื่อผู้ใช้เข้าสู่ระบบสำเร็จ
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))  # thread ที่ hash พร้อมกันได้ต่อ process
+app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 64))  # งานที่รอได้ก่อนตอบว่าระบบไม่ว่าง
+
 # --- Initial Setup ---
-try:
-    os.makedirs(app.instance_path)
-    os.makedirs(app.config['UPLOAD_FOLDER'])
-except OSError:
-    pass
+for folder in (app.instance_path, app.config['UPLOAD_FOLDER'], app.config['JINJA_CACHE_FOLDER']):
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+if app.config['JINJA_CACHE_FOLDER']:
+    # template ที่ compile แล้วถูกเก็บเป็น bytecode ข้ามการเปิดโปรแกรม (Jinja ตรวจ checksum ของ source เอง)
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(app.config['JINJA_CACHE_FOLDER']))
 
 # --- Helper Functions ---
 def allowed_file(filename):
@@ -52,9 +160,11 @@ def _process_asset_form(request, existing_filename=None):
         'next_pm_date': request.form.get('next_pm_date') or None,
         'pm_frequency_days': request.form.get('pm_frequency_days') or None,
         'technician_id': request.form.get('technician_id') or None,
+        # ตัดช่องว่างหัวท้ายเพื่อให้ key/ค่าตรงกับที่เก็บในดัชนี asset_attributes
         'custom_data': json.dumps({
-            k: v for k, v in zip(request.form.getlist('custom_key'), request.form.getlist('custom_value')) if k
-        })
+            k.strip(): v.strip()
+            for k, v in zip(request.form.getlist('custom_key'), request.form.getlist('custom_value')) if k.strip()
+        }, ensure_ascii=False)
     }
 
     # 2. จัดการไฟล์อัปโหลด
@@ -63,40 +173,77 @@ def _process_asset_form(request, existing_filename=None):
         file = request.files['asset_image']
         # ถ้ามีการอัปโหลดไฟล์ใหม่ ให้บันทึกและอัปเดตชื่อไฟล์
         if file and file.filename != '' and allowed_file(file.filename):
-            image_filename = secure_filename(file.filename)
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+            image_filename = store_upload(file.stream, file.filename)
+            schedule_renditions(image_filename)
             
     form_data['asset_image_filename'] = image_filename
     
     return form_data
 
-def get_maintenance_points_for_asset(asset_id):
-    """ดึงข้อมูลจุดบำรุงรักษาทั้งหมดของสินทรัพย์"""
+def _id_chunks(ids, size=500):
+    """แบ่ง list ของ ID เป็นชุด ๆ เพื่อไม่ให้จำนวน placeholder เกินขีดจำกัดของ SQLite"""
+    ids = list(dict.fromkeys(ids))
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+def get_maintenance_point_images_batch(point_ids):
+    """ดึงรูปภาพของจุดบำรุงรักษาหลายจุดในคิวรีเดียว คืนค่า {point_id: [images]}"""
     db = get_db()
-    return db.execute("""
-        SELECT mp.*, u.username as created_by_name 
-        FROM maintenance_points mp 
-        LEFT JOIN users u ON mp.created_by = u.id 
-        WHERE mp.asset_id = ? 
-        ORDER BY mp.created_at DESC
-    """, (asset_id,)).fetchall()
+    images = {point_id: [] for point_id in point_ids}
+    for chunk in _id_chunks(point_ids):
+        placeholders = ', '.join('?' for _ in chunk)
+        rows = db.execute(f"""
+            SELECT mpi.*, u.username as uploaded_by_name 
+            FROM maintenance_point_images mpi 
+            LEFT JOIN users u ON mpi.uploaded_by = u.id 
+            WHERE mpi.maintenance_point_id IN ({placeholders}) 
+            ORDER BY mpi.maintenance_point_id, mpi.upload_date DESC
+        """, chunk)
+        for row in rows:
+            images[row['maintenance_point_id']].append(row)
+    return images
+
+def get_maintenance_points_batch(asset_ids, with_images=True):
+    """
+    ดึงจุดบำรุงรักษาของสินทรัพย์หลายรายการพร้อมรูปภาพ โดยใช้จำนวนคิวรีคงที่ (ไม่ขึ้นกับจำนวนจุด)
+    คืนค่า {asset_id: [point dict ที่มี key 'images']}
+    """
+    db = get_db()
+    points_by_asset = {asset_id: [] for asset_id in asset_ids}
+    all_points = []
+    for chunk in _id_chunks(asset_ids):
+        placeholders = ', '.join('?' for _ in chunk)
+        rows = db.execute(f"""
+            SELECT mp.*, u.username as created_by_name 
+            FROM maintenance_points mp 
+            LEFT JOIN users u ON mp.created_by = u.id 
+            WHERE mp.asset_id IN ({placeholders}) 
+            ORDER BY mp.asset_id, mp.created_at DESC
+        """, chunk)
+        for row in rows:
+            point = dict(row)
+            points_by_asset[point['asset_id']].append(point)
+            all_points.append(point)
+
+    if with_images:
+        images = get_maintenance_point_images_batch([point['id'] for point in all_points])
+        for point in all_points:
+            point['images'] = images[point['id']]
+    return points_by_asset
+
+def get_maintenance_points_for_asset(asset_id):
+    """ดึงข้อมูลจุดบำรุงรักษาทั้งหมดของสินทรัพย์ (พร้อมรูปภาพ)"""
+    return get_maintenance_points_batch([asset_id])[asset_id]
 
 def get_maintenance_point_images(maintenance_point_id):
     """ดึงรูปภาพทั้งหมดของจุดบำรุงรักษา"""
-    db = get_db()
-    return db.execute("""
-        SELECT mpi.*, u.username as uploaded_by_name 
-        FROM maintenance_point_images mpi 
-        LEFT JOIN users u ON mpi.uploaded_by = u.id 
-        WHERE mpi.maintenance_point_id = ? 
-        ORDER BY mpi.upload_date DESC
-    """, (maintenance_point_id,)).fetchall()
+    return get_maintenance_point_images_batch([maintenance_point_id])[maintenance_point_id]
 
 def save_maintenance_point_image(file, maintenance_point_id, description='', image_type='reference'):
     """บันทึกรูปภาพของจุดบำรุงรักษา"""
     if file and file.filename != '' and allowed_file(file.filename):
-        filename = secure_filename(f"mp_{maintenance_point_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}")
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        filename = store_upload(file.stream, file.filename)
+        schedule_renditions(filename)
         
         db = get_db()
         db.execute("""
@@ -108,171 +255,3125 @@ def save_maintenance_point_image(file, maintenance_point_id, description='', ima
         return filename
     return None
 
-# --- Parts Management Helper Functions ---
-def get_all_parts():
-    """ดึงข้อมูลอะไหล่ทั้งหมด"""
-    db = get_db()
-    return db.execute("""
-        SELECT p.*, u.username as created_by_name 
-        FROM parts p 
-        LEFT JOIN users u ON p.created_by = u.id 
-        ORDER BY p.part_name ASC
-    """).fetchall()
+# --- Upload Storage Helpers ---
+BLOB_NAME_RE = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+def _blob_shard(filename):
+    """โฟลเดอร์ย่อยสองชั้นของไฟล์ content-addressed (ไฟล์ชื่อแบบเก่าไม่มี)"""
+    if BLOB_NAME_RE.match(filename):
+        return os.path.join(filename[:2], filename[2:4])
+    return ''
+
+def upload_path(filename):
+    """path จริงของไฟล์อัปโหลด ไฟล์ชื่อแบบเก่ายังอยู่ในโฟลเดอร์ uploads ตามเดิม"""
+    shard = _blob_shard(filename)
+    if shard:
+        return os.path.join(app.config['BLOB_FOLDER'], shard, filename)
+    return os.path.join(app.config['UPLOAD_FOLDER'], filename)
+
+def store_upload(stream, original_filename):
+    """
+    บันทึกไฟล์ลงที่เก็บแบบ content-addressed แล้วคืนชื่อ '<sha256>.<ext>' สำหรับเก็บใน DB
+    ถ้ามีไฟล์เนื้อหาเดียวกันอยู่แล้วจะไม่เขียนซ้ำ ref_count จะเพิ่มโดย trigger เมื่อมีแถวอ้างอิง
+    แถวใน upload_blobs ถูกเขียนก่อนตรวจว่ามีไฟล์อยู่แล้ว จึงถือ write lock ไว้จนผู้เรียก commit แถวที่อ้างอิงไฟล์
+    และ purge_unreferenced_uploads ที่ลบไฟล์ขณะถือ write lock เช่นกันจะไม่ลบไฟล์ที่เราเพิ่งตัดสินใจใช้ซ้ำ
+    """
+    ext = original_filename.rsplit('.', 1)[1].lower()
+    ext = 'jpg' if ext == 'jpeg' else ext
+    tmp_folder = os.path.join(app.config['BLOB_FOLDER'], 'tmp')
+    os.makedirs(tmp_folder, exist_ok=True)
+    import tempfile
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_folder)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        filename = f"{digest.hexdigest()}.{ext}"
+        get_db().execute("""
+            INSERT INTO upload_blobs (name, size) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET size = excluded.size
+        """, (filename, size))
+        path = upload_path(filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename
+
+def purge_unreferenced_uploads(db, filenames):
+    """
+    ลบไฟล์ที่ไม่มีแถวใดอ้างอิงแล้ว เรียกหลัง commit การลบ/เปลี่ยนแถวที่อ้างอิงไฟล์ คืนค่าจำนวนไฟล์ที่ลบ
+    ไฟล์ถูกลบก่อน commit ขณะที่ยังถือ write lock (ดู store_upload) ถ้า commit ล้มเหลวแถวจะยังอยู่
+    และ store_upload ครั้งถัดไปของเนื้อหาเดียวกันจะเขียนไฟล์กลับมาเอง
+    """
+    if not db.in_transaction:
+        db.execute("BEGIN IMMEDIATE")
+    try:
+        removed = [filename for filename in dict.fromkeys(name for name in filenames if name)
+                   if db.execute("DELETE FROM upload_blobs WHERE name = ? AND ref_count <= 0", (filename,)).rowcount]
+        for filename in removed:
+            remove_uploaded_file(filename)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(removed)
+
+def send_upload(path, etag=True, max_age=0, immutable=False):
+    """
+    ส่งไฟล์อัปโหลดพร้อม ETag, Cache-Control, 304 และ Range (ผ่าน send_file)
+    หรือส่งต่อให้ front-end server ตาม UPLOAD_SENDFILE (ตรวจ login ไปแล้วใน route)
+    """
+    if not os.path.isfile(path):
+        return "File not found", 404
+    mode = app.config['UPLOAD_SENDFILE']
+    if mode == 'x-accel-redirect':
+        import mimetypes
+        # nginx จัดการ 304/Range เองจากไฟล์จริง
+        relative = os.path.relpath(path, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = app.config['UPLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + quote(relative)
+        if isinstance(etag, str):
+            response.set_etag(etag)
+    else:
+        response = send_file(path, request.environ, etag=etag, conditional=True, max_age=None,
+                             use_x_sendfile=(mode == 'x-sendfile'), response_class=app.response_class)
+    # ต้อง login ก่อนเข้าถึง จึงให้ cache ได้เฉพาะในเบราว์เซอร์ (private) ไม่ใช่ shared proxy
+    response.cache_control.no_cache = None if max_age else True
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = immutable or None
+    return response
+
+# --- Image Rendition Helpers ---
+def rendition_path(rendition_folder, size, filename):
+    """path ของไฟล์ย่อขนาด (เป็น JPEG เสมอ)"""
+    return os.path.join(rendition_folder, size, _blob_shard(filename), filename + '.jpg')
+
+def create_renditions(source_path, filename, rendition_folder, sizes, quality=82, force=False):
+    """
+    สร้างไฟล์ย่อขนาดทุกขนาดจากไฟล์ต้นฉบับ: หมุนภาพตาม EXIF แล้วเข้ารหัสใหม่เป็น JPEG โดยไม่มี EXIF
+    เป็นฟังก์ชันระดับ module เพื่อให้ส่งไปทำงานใน process pool ได้ คืนค่า list ของขนาดที่สร้าง
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return []
+    targets = {size: rendition_path(rendition_folder, size, filename) for size in sizes}
+    if not force:
+        source_mtime = os.path.getmtime(source_path)
+        targets = {size: path for size, path in targets.items()
+                   if not os.path.exists(path) or os.path.getmtime(path) < source_mtime}
+    if not targets:
+        return []
+
+    created = []
+    with Image.open(source_path) as img:
+        # ให้ตัวถอดรหัส JPEG ลดขนาดระหว่างอ่าน ซึ่งเร็วกว่าการอ่านเต็มขนาดแล้วค่อยย่อ
+        largest = max(sizes[size] for size in targets)
+        img.draft('RGB', (largest, largest))
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        # สร้างจากขนาดใหญ่ไปเล็ก เพื่อย่อต่อจากภาพที่ย่อแล้ว
+        for size in sorted(targets, key=lambda name: sizes[name], reverse=True):
+            img.thumbnail((sizes[size], sizes[size]), Image.LANCZOS)
+            path = targets[size]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            img.save(tmp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+            os.replace(tmp_path, path)
+            created.append(size)
+    return created
+
+_recent_renditions = {}
+
+def schedule_renditions(filename):
+    """เพิ่มงานสร้างไฟล์ย่อขนาดลงคิว (ไม่รอผล) ไม่เพิ่มซ้ำถ้า process นี้เพิ่งเพิ่มไปภายใน 60 วินาที"""
+    now = time.monotonic()
+    if _recent_renditions.get(filename, 0) > now or not os.path.isfile(upload_path(filename)):
+        return
+    if len(_recent_renditions) > 10000:
+        _recent_renditions.clear()
+    _recent_renditions[filename] = now + 60
+    # ผู้ใช้รออยู่ที่หน้าเว็บจึงให้ priority สูงกว่างานทั่วไป
+    enqueue_job(get_db(write=True), 'renditions', {'filename': filename}, priority=10,
+                dedupe_key=f'renditions:{filename}')
+
+def remove_uploaded_file(filename):
+    """ลบไฟล์ที่อัปโหลดพร้อมไฟล์ย่อขนาดทั้งหมด"""
+    try:
+        os.remove(upload_path(filename))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Error deleting file {filename}: {e}")
+    for size in IMAGE_RENDITIONS:
+        try:
+            os.remove(rendition_path(app.config['RENDITION_FOLDER'], size, filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error deleting {size} rendition of {filename}: {e}")
+
+@app.template_global()
+def image_url(filename, size=None):
+    """URL ของรูปภาพตามขนาดที่ต้องการ ('thumb', 'medium' หรือ None = ต้นฉบับ)"""
+    if size is None:
+        return url_for('uploaded_file', filename=filename)
+    return url_for('uploaded_rendition', size=size, filename=filename)
+
+# --- Parts Management Helper Functions ---
+SAMPLE_PARTS = [
+    ('FILTER001', 'กรองอากาศ', 'กรองอากาศสำหรับเครื่องปรับอากาศ', 'ระบบปรับอากาศ', 'ABC Filter Co.', 150.00, 5, 20, 'ชั้น A1', 'บริษัท ฟิลเตอร์ จำกัด', '02-123-4567', 'เปลี่ยนทุก 3 เดือน'),
+    ('BELT002', 'สายพาน V-Belt', 'สายพานสำหรับเครื่องจักร', 'เครื่องจักร', 'Gates Corporation', 350.00, 3, 15, 'ชั้น B2', 'บริษัท เกตส์ ไทย', '02-234-5678', 'ตรวจสอบความตึงเป็นประจำ'),
+    ('OIL003', 'น้ำมันหล่อลื่น', 'น้ำมันหล่อลื่นเกรดอุตสาหกรรม', 'น้ำมันหล่อลื่น', 'Shell', 450.00, 10, 25, 'คลัง C', 'บริษัท เชลล์', '02-345-6789', 'เก็บในที่แห้ง'),
+    ('BEARING004', 'ลูกปืน', 'ลูกปืนขนาด 6203', 'เครื่องจักร', 'SKF', 280.00, 8, 12, 'ชั้น A3', 'บริษัท เอสเคเอฟ', '02-456-7890', 'ใช้จาระบีคุณภาพดี'),
+    ('SCREW005', 'สกรูสแตนเลส', 'สกรูสแตนเลส M6x20', 'ฮาร์ดแวร์', 'Local Supplier', 15.00, 50, 200, 'ชั้น D1', 'ร้านเหล็ก ABC', '02-567-8901', 'สต็อกจำนวนมาก'),
+]
+
+def insert_sample_parts(db):
+    """เพิ่มอะไหล่ตัวอย่าง (ข้ามรหัสที่มีอยู่แล้ว) พร้อมรายการรับเข้าเริ่มต้นใน ledger คืนค่าจำนวนที่เพิ่ม"""
+    added = 0
+    for part_data in SAMPLE_PARTS:
+        cursor = db.execute("""
+            INSERT OR IGNORE INTO parts 
+            (part_number, part_name, description, category, manufacturer, unit_price, 
+             minimum_stock, current_stock, location, supplier, supplier_contact, notes, created_by) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        """, part_data)
+        if cursor.rowcount:
+            added += 1
+            db.execute("""
+                INSERT INTO parts_transactions (part_id, transaction_type, quantity, reference_type, unit_cost, notes, balance_after)
+                SELECT id, 'in', current_stock, 'initial', unit_price, 'สต็อกเริ่มต้น', current_stock FROM parts WHERE id = ? AND current_stock > 0
+            """, (cursor.lastrowid,))
+    return added
+
+def get_all_parts():
+    """ดึงข้อมูลอะไหล่ทั้งหมด"""
+    db = get_db()
+    return db.execute("""
+        SELECT p.*, u.username as created_by_name 
+        FROM parts p 
+        LEFT JOIN users u ON p.created_by = u.id 
+        ORDER BY p.part_name ASC
+    """).fetchall()
+
+def get_parts_low_stock():
+    """ดึงอะไหล่ที่ถึงจุดสั่งซื้อ (ตามผลพยากรณ์ใน parts_forecast หรือ minimum_stock ถ้ายังไม่มีผล) เรียงตามวันที่สต็อกพอใช้"""
+    db = get_db()
+    return db.execute(f"""
+        SELECT p.*, {PARTS_FORECAST_COLUMNS}
+        FROM parts p
+        LEFT JOIN parts_forecast f ON f.part_id = p.id
+        WHERE p.current_stock <= COALESCE(f.reorder_threshold, p.minimum_stock)
+        ORDER BY days_of_cover IS NULL, days_of_cover ASC, (p.current_stock - p.minimum_stock) ASC
+    """).fetchall()
+
+def get_part_by_id(part_id):
+    """ดึงข้อมูลอะไหล่ตาม ID"""
+    db = get_db()
+    return db.execute("SELECT * FROM parts WHERE id = ?", (part_id,)).fetchone()
+
+def get_part_transactions(part_id, after=None, before=None, per_page=50):
+    """ดึงประวัติการเคลื่อนไหวของอะไหล่ทีละหน้า (ใหม่สุดก่อน)"""
+    return keyset_paginate("""
+        SELECT pt.*, u.username as created_by_name 
+        FROM parts_transactions pt 
+        LEFT JOIN users u ON pt.created_by = u.id 
+        WHERE pt.part_id = ?
+    """, (part_id,), [('pt.transaction_date', 'DESC'), ('pt.id', 'DESC')], after, before, per_page)
+
+def replay_stock_movements(balance, movements):
+    """คำนวณยอดคงเหลือจากยอดตั้งต้นและรายการ (transaction_type, quantity) ตามลำดับ"""
+    for transaction_type, quantity in movements:
+        if transaction_type == 'in':
+            balance += quantity
+        elif transaction_type == 'out':
+            balance -= quantity
+        elif transaction_type == 'adjustment':
+            balance = quantity
+    return balance
+
+def get_stock_as_of(db, part_id, as_of):
+    """สต็อกของอะไหล่ ณ สิ้นวัน as_of ('YYYY-MM-DD'): snapshot ล่าสุดที่ไม่เกินวันนั้น + รายการหลัง snapshot"""
+    snapshot = db.execute("""
+        SELECT balance, last_transaction_id FROM parts_stock_snapshots
+        WHERE part_id = ? AND snapshot_date <= ? ORDER BY snapshot_date DESC LIMIT 1
+    """, (part_id, as_of)).fetchone()
+    balance, last_id = tuple(snapshot) if snapshot else (0, 0)
+    movements = db.execute("""
+        SELECT transaction_type, quantity FROM parts_transactions
+        WHERE part_id = ? AND id > ? AND transaction_date < date(?, '+1 day') ORDER BY id
+    """, (part_id, last_id, as_of)).fetchall()
+    return replay_stock_movements(balance, movements)
+
+def _latest_snapshots(db, before_date=None):
+    """snapshot ล่าสุดของอะไหล่แต่ละชิ้น (ก่อน before_date ถ้าระบุ) คืนค่า {part_id: (balance, last_transaction_id)}"""
+    return {row[0]: (row[1], row[2]) for row in db.execute("""
+        SELECT s.part_id, s.balance, s.last_transaction_id FROM parts_stock_snapshots s
+        WHERE s.snapshot_date = (SELECT MAX(snapshot_date) FROM parts_stock_snapshots
+                                 WHERE part_id = s.part_id AND snapshot_date < ?)
+    """, (before_date or '9999-12-31',))}
+
+def _movements_since(db, before_date=None, until_id=None):
+    """
+    รายการของแต่ละอะไหล่หลัง snapshot ล่าสุดของชิ้นนั้น (ก่อน before_date ถ้าระบุ) คืนค่า {part_id: [(id, type, qty)]}
+    เงื่อนไข id > last_transaction_id อยู่ใน SQL จึงอ่านเฉพาะช่วงท้ายของ ledger ผ่าน idx_parts_transactions_part_id
+    """
+    # CROSS JOIN บังคับให้วนตาม parts แล้วค้น ledger ของแต่ละชิ้นด้วย (part_id = ? AND id > ?) แทนการสแกน ledger ทั้งหมด
+    sql = """
+        SELECT t.part_id, t.id, t.transaction_type, t.quantity
+        FROM parts p
+        CROSS JOIN parts_transactions t ON t.part_id = p.id AND t.id > COALESCE((
+            SELECT s.last_transaction_id FROM parts_stock_snapshots s
+            WHERE s.part_id = p.id AND s.snapshot_date < ? ORDER BY s.snapshot_date DESC LIMIT 1), 0)
+    """
+    params = [before_date or '9999-12-31']
+    if until_id is not None:
+        sql += " WHERE t.id <= ?"
+        params.append(until_id)
+    movements = {}
+    for part_id, transaction_id, transaction_type, quantity in db.execute(sql + " ORDER BY p.id, t.id", params):
+        movements.setdefault(part_id, []).append((transaction_id, transaction_type, quantity))
+    return movements
+
+def ledger_today(db):
+    """
+    วันที่ปัจจุบันตามนาฬิกาเดียวกับ parts_transactions.transaction_date (CURRENT_TIMESTAMP ของ SQLite เป็น UTC)
+    ใช้เป็นวันที่ของ snapshot เพื่อไม่ให้รายการช่วงรอยต่อวันตกไปอยู่คนละวันกับ snapshot
+    """
+    return db.execute("SELECT date('now')").fetchone()[0]
+
+def take_stock_snapshots(db, snapshot_date=None):
+    """
+    บันทึกยอดคงเหลือ ณ สิ้นวัน snapshot_date (ค่าเริ่มต้นวันนี้ตาม ledger_today) ต่อยอดจาก snapshot ก่อนหน้า
+    เขียนเฉพาะอะไหล่ที่มีการเคลื่อนไหวตั้งแต่ snapshot ก่อน คืนค่าจำนวนแถวที่เขียน
+    """
+    snapshot_date = snapshot_date or ledger_today(db)
+    until_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM parts_transactions WHERE transaction_date < date(?, '+1 day')",
+                          (snapshot_date,)).fetchone()[0]
+    previous = _latest_snapshots(db, before_date=snapshot_date)
+    rows = []
+    for part_id, movements in _movements_since(db, snapshot_date, until_id).items():
+        balance = replay_stock_movements(previous.get(part_id, (0, 0))[0], [(t, q) for _, t, q in movements])
+        rows.append((part_id, snapshot_date, balance, movements[-1][0]))
+    db.executemany("""
+        INSERT INTO parts_stock_snapshots (part_id, snapshot_date, balance, last_transaction_id) VALUES (?, ?, ?, ?)
+        ON CONFLICT (part_id, snapshot_date) DO UPDATE SET
+            balance = excluded.balance, last_transaction_id = excluded.last_transaction_id, created_at = CURRENT_TIMESTAMP
+    """, rows)
+    db.commit()
+    return len(rows)
+
+def reconcile_stock(db):
+    """เทียบ current_stock กับ snapshot ล่าสุด + รายการหลังจากนั้น คืนค่า list ของ (part_id, part_number, current_stock, ledger)"""
+    snapshots = _latest_snapshots(db)
+    movements = _movements_since(db)
+    mismatches = []
+    for part_id, part_number, current_stock in db.execute("SELECT id, part_number, current_stock FROM parts ORDER BY id"):
+        ledger = replay_stock_movements(snapshots.get(part_id, (0, 0))[0],
+                                        [(t, q) for _, t, q in movements.get(part_id, [])])
+        if ledger != (current_stock or 0):
+            mismatches.append((part_id, part_number, current_stock, ledger))
+    return mismatches
+
+# คอลัมน์ที่คำนวณจากผลพยากรณ์และสต็อกปัจจุบัน (ใช้กับ parts p LEFT JOIN parts_forecast f)
+PARTS_FORECAST_COLUMNS = """
+    f.daily_demand, f.reorder_point, f.computed_at AS forecast_at,
+    CASE WHEN f.daily_demand > 0 THEN p.current_stock / f.daily_demand END AS days_of_cover,
+    MAX(COALESCE(f.target_stock, p.minimum_stock) - p.current_stock, 0) AS suggested_qty
+"""
+
+# พยากรณ์ทุกอะไหล่ในคิวรีเดียว
+# usage: การเบิกจาก ledger ('out') และจาก maintenance_parts_used ที่ไม่มีรายการใน ledger แล้ว (ไม่นับซ้ำ)
+# การใช้ในงาน PM ถูกแยกออกจาก daily_usage และแทนด้วยอัตราต่องาน PM ของแต่ละสินทรัพย์ x จำนวน PM ใน pm_occurrences
+PARTS_FORECAST_SQL = """
+WITH usage AS (
+    SELECT pt.part_id, pt.quantity, pt.transaction_date AS used_on, mh.asset_id, mh.job_type
+    FROM parts_transactions pt
+    LEFT JOIN maintenance_history mh ON pt.reference_type = 'maintenance' AND mh.id = pt.reference_id
+    WHERE pt.transaction_type = 'out' AND pt.transaction_date >= :since
+    UNION ALL
+    SELECT mpu.part_id, mpu.quantity_used, mh.date, mh.asset_id, mh.job_type
+    FROM maintenance_parts_used mpu
+    JOIN maintenance_history mh ON mh.id = mpu.maintenance_history_id
+    WHERE mh.date >= :since AND NOT EXISTS (
+        SELECT 1 FROM parts_transactions pt
+        WHERE pt.reference_type = 'maintenance' AND pt.reference_id = mpu.maintenance_history_id
+          AND pt.part_id = mpu.part_id AND pt.transaction_type = 'out')
+),
+consumed AS (
+    SELECT part_id, SUM(quantity) AS total_qty,
+           SUM(CASE WHEN job_type IS NOT 'PM' THEN quantity ELSE 0 END) AS unplanned_qty
+    FROM usage GROUP BY part_id
+),
+pm_jobs AS (
+    SELECT asset_id, COUNT(*) AS jobs FROM maintenance_history
+    WHERE job_type = 'PM' AND date >= :since GROUP BY asset_id
+),
+pm_rates AS (
+    SELECT u.part_id, u.asset_id, SUM(u.quantity) * 1.0 / j.jobs AS per_job
+    FROM usage u JOIN pm_jobs j ON j.asset_id = u.asset_id
+    WHERE u.job_type = 'PM' GROUP BY u.part_id, u.asset_id
+),
+upcoming AS (
+    SELECT asset_id,
+           SUM(due_date <= :lead_until) AS lead_jobs,
+           COUNT(*) AS horizon_jobs
+    FROM pm_occurrences WHERE due_date <= :horizon_until GROUP BY asset_id
+),
+pm_demand AS (
+    SELECT r.part_id, SUM(r.per_job * o.lead_jobs) AS lead_qty, SUM(r.per_job * o.horizon_jobs) AS horizon_qty
+    FROM pm_rates r JOIN upcoming o ON o.asset_id = r.asset_id GROUP BY r.part_id
+),
+rates AS (
+    SELECT p.id AS part_id, COALESCE(p.minimum_stock, 0) AS safety_stock,
+           COALESCE(c.total_qty, 0) AS consumed_qty,
+           COALESCE(c.unplanned_qty, 0) * 1.0 / :window_days AS daily_usage,
+           COALESCE(d.lead_qty, 0) AS pm_lead_demand,
+           COALESCE(d.horizon_qty, 0) AS pm_demand,
+           COALESCE(c.unplanned_qty, 0) * 1.0 / :window_days * :lead_days + COALESCE(d.lead_qty, 0) AS lead_need,
+           COALESCE(c.unplanned_qty, 0) * 1.0 / :window_days * (:lead_days + :review_days) + COALESCE(d.horizon_qty, 0) AS horizon_need
+    FROM parts p
+    LEFT JOIN consumed c ON c.part_id = p.id
+    LEFT JOIN pm_demand d ON d.part_id = p.id
+),
+points AS (
+    SELECT *, safety_stock + CAST(lead_need AS INTEGER) + (lead_need > CAST(lead_need AS INTEGER)) AS reorder_point
+    FROM rates
+)
+INSERT INTO parts_forecast (part_id, consumed_qty, daily_usage, pm_lead_demand, pm_demand, daily_demand,
+                            reorder_point, reorder_threshold, target_stock, computed_at)
+SELECT part_id, consumed_qty, daily_usage, pm_lead_demand, pm_demand,
+       horizon_need / (:lead_days + :review_days),
+       reorder_point, MAX(reorder_point, safety_stock),
+       safety_stock + CAST(horizon_need AS INTEGER) + (horizon_need > CAST(horizon_need AS INTEGER)),
+       CURRENT_TIMESTAMP
+FROM points
+"""
+
+def refresh_parts_forecast(db):
+    """
+    คำนวณ parts_forecast ใหม่ทั้งตาราง (อัตราการใช้, จุดสั่งซื้อ, ระดับสต็อกเป้าหมาย) คืนค่าจำนวนอะไหล่
+    ปรับ pm_occurrences ให้เป็นปัจจุบันก่อนเพื่อให้ความต้องการจาก PM ตรงกับกำหนดการล่าสุด
+    """
+    refresh_pm_schedule(db)
+    today = date.today()
+    window_days = max(app.config['PARTS_FORECAST_WINDOW_DAYS'], 1)
+    lead_days = app.config['PARTS_LEAD_TIME_DAYS']
+    review_days = max(app.config['PARTS_REVIEW_DAYS'], 1)
+    params = {
+        'since': (today - timedelta(days=window_days)).isoformat(),
+        'window_days': window_days,
+        'lead_days': lead_days,
+        'review_days': review_days,
+        'lead_until': (today + timedelta(days=lead_days)).isoformat(),
+        'horizon_until': (today + timedelta(days=lead_days + review_days)).isoformat(),
+    }
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute("DELETE FROM parts_forecast")
+        changes = db.total_changes
+        db.execute(PARTS_FORECAST_SQL, params)
+        written = db.total_changes - changes
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return written
+
+class StockError(ValueError):
+    """การเคลื่อนไหวสต็อกขัดกับเงื่อนไข ทั้งชุดถูกยกเลิก (errors คือ list ของ (ลำดับรายการ, ข้อความ))"""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f"line {index + 1}: {message}" for index, message in errors))
+        self.errors = errors
+
+STOCK_MOVEMENT_TYPES = ('in', 'out', 'adjustment')
+
+def _is_sql_int(value):
+    """True ถ้า value เป็น int (ไม่ใช่ bool) ที่ SQLite เก็บได้"""
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63
+
+def apply_stock_movements(db, movements, reference_type=None, reference_id=None, user_id=None):
+    """
+    บันทึกการเคลื่อนไหวสต็อกหลายรายการเป็น transaction เดียวภายใต้ BEGIN IMMEDIATE
+    (ถือ write lock ตั้งแต่อ่านสต็อกจนเขียนเสร็จ จึงไม่มีการเขียนทับกันหรือสต็อกติดลบจากการทำงานพร้อมกัน)
+    movements: list ของ dict {'part_id', 'type': 'in' | 'out' | 'adjustment', 'quantity', 'unit_cost', 'notes'}
+    ตรวจทุกรายการก่อนเขียน ถ้ามีรายการผิดจะ raise StockError และไม่เขียนอะไรเลย คืนค่า {part_id: สต็อกใหม่}
+    """
+    errors = []
+    for index, movement in enumerate(movements):
+        quantity = movement.get('quantity')
+        if movement.get('type') not in STOCK_MOVEMENT_TYPES:
+            errors.append((index, f"type must be one of {', '.join(STOCK_MOVEMENT_TYPES)}"))
+        elif not _is_sql_int(quantity) or quantity < 0 or (quantity == 0 and movement['type'] != 'adjustment'):
+            errors.append((index, "quantity must be a positive integer"))
+    if errors:
+        raise StockError(errors)
+
+    # ถ้า connection อยู่ใน transaction ที่เขียนไปแล้ว (เช่น add_part) ก็ถือ write lock อยู่แล้ว ผู้เรียกเป็นคน commit
+    own_transaction = not db.in_transaction
+    if own_transaction:
+        db.execute("BEGIN IMMEDIATE")
+    try:
+        balances = {}
+        for chunk in _id_chunks([movement['part_id'] for movement in movements]):
+            placeholders = ', '.join('?' for _ in chunk)
+            balances.update(tuple(row) for row in db.execute(
+                f"SELECT id, current_stock FROM parts WHERE id IN ({placeholders})", chunk))
+
+        rows = []
+        for index, movement in enumerate(movements):
+            part_id, quantity = movement['part_id'], movement['quantity']
+            if part_id not in balances:
+                errors.append((index, f"part {part_id} not found"))
+                continue
+            balance = balances[part_id] or 0
+            if movement['type'] == 'in':
+                balance += quantity
+            elif movement['type'] == 'out':
+                if quantity > balance:
+                    errors.append((index, f"part {part_id}: cannot issue {quantity}, only {balance} in stock"))
+                    continue
+                balance -= quantity
+            else:
+                balance = quantity
+            balances[part_id] = balance
+            rows.append((part_id, movement['type'], quantity, reference_type, reference_id,
+                         movement.get('unit_cost'), movement.get('notes', ''), user_id, balance))
+        if errors:
+            raise StockError(errors)
+
+        db.executemany("""
+            INSERT INTO parts_transactions
+            (part_id, transaction_type, quantity, reference_type, reference_id, unit_cost, notes, created_by, balance_after)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        touched = {row[0]: balances[row[0]] for row in rows}
+        db.executemany("UPDATE parts SET current_stock = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                       [(stock, part_id) for part_id, stock in touched.items()])
+        if own_transaction:
+            db.commit()
+    except Exception:
+        if own_transaction:
+            db.rollback()
+        raise
+    return touched
+
+def add_part_transaction(part_id, transaction_type, quantity, reference_type=None, reference_id=None, unit_cost=None, notes=''):
+    """เพิ่มการเคลื่อนไหวของอะไหล่และอัปเดตสต็อก (raise StockError ถ้าสต็อกไม่พอหรือข้อมูลไม่ถูกต้อง)"""
+    apply_stock_movements(get_db(), [{'part_id': part_id, 'type': transaction_type, 'quantity': quantity,
+                                      'unit_cost': unit_cost, 'notes': notes}],
+                          reference_type, reference_id, session.get('user_id'))
+
+def get_parts_for_maintenance(maintenance_id):
+    """ดึงอะไหล่ที่ใช้ในงานซ่อมบำรุง"""
+    db = get_db()
+    return db.execute("""
+        SELECT mpu.*, p.part_number, p.part_name 
+        FROM maintenance_parts_used mpu 
+        JOIN parts p ON mpu.part_id = p.id 
+        WHERE mpu.maintenance_history_id = ?
+    """, (maintenance_id,)).fetchall()
+
+# --- Pagination Helpers ---
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+def cached_count(sql, params=()):
+    """
+    นับจำนวนแถวโดยเก็บผลลัพธ์ไว้ใน cache ตามเวลา COUNT_CACHE_TTL
+    cache เป็น LRU ขนาดไม่เกิน COUNT_CACHE_SIZE เพราะ key มาจากตัวกรองที่ผู้ใช้ส่งมาได้ไม่จำกัด
+    """
+    key = (sql, tuple(params))
+    now = time.monotonic()
+    with _count_cache_lock:
+        hit = _count_cache.get(key)
+        if hit and hit[1] > now:
+            _count_cache.move_to_end(key)
+            return hit[0]
+    value = get_db().execute(sql, params).fetchone()[0]
+    with _count_cache_lock:
+        _count_cache[key] = (value, now + app.config['COUNT_CACHE_TTL'])
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > app.config['COUNT_CACHE_SIZE']:
+            _count_cache.popitem(last=False)
+    return value
+
+def invalidate_count_cache():
+    """ล้าง cache จำนวนแถว (เรียกหลังจากเพิ่ม/แก้ไข/ลบสินทรัพย์)"""
+    with _count_cache_lock:
+        _count_cache.clear()
+
+def encode_cursor(values):
+    """แปลงค่าคีย์ของแถวเป็น cursor string สำหรับใส่ใน URL"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """แปลง cursor string กลับเป็น list ของค่าคีย์ (คืน None ถ้า cursor ไม่ถูกต้อง)"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    # cursor มาจาก URL จึงรับเฉพาะค่าเดี่ยวที่ SQLite bind ได้ ค่าอื่น (list/dict, int เกิน 64 บิต) ถือว่าไม่มี cursor
+    if not isinstance(values, list) or not all(
+            value is None or isinstance(value, (str, float))
+            or (isinstance(value, int) and -2 ** 63 <= value < 2 ** 63) for value in values):
+        return None
+    return values
+
+def get_per_page(arg_name='per_page'):
+    """อ่านขนาดหน้าจาก query string โดยจำกัดไม่ให้เกิน MAX_PER_PAGE"""
+    per_page = request.args.get(arg_name, type=int) or app.config['ASSETS_PER_PAGE']
+    return max(1, min(per_page, app.config['MAX_PER_PAGE']))
+
+def keyset_paginate(base_sql, params, order_by, after=None, before=None, per_page=50):
+    """
+    แบ่งหน้าแบบ keyset (cursor) แทน OFFSET ทำให้ทุกหน้ามีต้นทุนเท่ากัน
+    - base_sql ต้องเป็น SELECT ที่มี WHERE เสมอ (ใช้ WHERE 1=1 ได้) และไม่มี ORDER BY / LIMIT
+    - order_by คือ list ของ (column, 'ASC'|'DESC') ที่รวมกันแล้วต้อง unique (เช่นปิดท้ายด้วย id)
+    - after/before คือ cursor ของแถวสุดท้าย/แรกของหน้าที่แล้ว
+    """
+    columns = [col for col, _ in order_by]
+    key_names = [col.split('.')[-1] for col in columns]
+    backwards = before is not None and after is None
+    cursor_values = decode_cursor(before if backwards else after)
+    if cursor_values is not None and len(cursor_values) != len(columns):
+        cursor_values = None
+
+    sql, params = base_sql, list(params)
+    if cursor_values is not None:
+        # เทียบแบบ row value: (a, b) > (?, ?) ใช้ได้เมื่อทุกคอลัมน์เรียงทิศทางเดียวกัน
+        direction = order_by[0][1].upper()
+        forward_op = '<' if direction == 'DESC' else '>'
+        op = {'<': '>', '>': '<'}[forward_op] if backwards else forward_op
+        sql += f" AND ({', '.join(columns)}) {op} ({', '.join('?' for _ in columns)})"
+        params.extend(cursor_values)
+
+    flip = {'ASC': 'DESC', 'DESC': 'ASC'}
+    sql += ' ORDER BY ' + ', '.join(
+        f"{col} {flip[d.upper()] if backwards else d.upper()}" for col, d in order_by
+    )
+    sql += ' LIMIT ?'
+    params.append(per_page + 1)
+
+    rows = get_db().execute(sql, params).fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def key_of(row):
+        return [row[name] for name in key_names]
+
+    has_next = has_more if not backwards else True
+    has_prev = has_more if backwards else cursor_values is not None
+    return {
+        'items': rows,
+        'per_page': per_page,
+        'next_cursor': encode_cursor(key_of(rows[-1])) if rows and has_next else None,
+        'prev_cursor': encode_cursor(key_of(rows[0])) if rows and has_prev else None,
+    }
+
+# --- Full-Text Search Helpers ---
+def fts_match_expression(search_query):
+    """
+    แปลงคำค้นหาเป็น MATCH expression ของ FTS5 (trigram)
+    คืน None ถ้ามีคำที่สั้นกว่า 3 ตัวอักษร ซึ่ง trigram ค้นหาด้วย MATCH ไม่ได้
+    """
+    terms = search_query.split()
+    if not terms or any(len(term) < 3 for term in terms):
+        return None
+    return ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def search_assets(search_query, after=None, before=None, per_page=50):
+    """ค้นหาสินทรัพย์ผ่านดัชนี assets_fts เรียงตามความเกี่ยวข้อง คืนค่า (page, total)"""
+    match = fts_match_expression(search_query)
+    if match:
+        base_sql = """
+            SELECT a.*, f.rank FROM assets a
+            JOIN (SELECT rowid, rank FROM assets_fts WHERE assets_fts MATCH ?) f ON f.rowid = a.id
+            WHERE 1=1
+        """
+        order_by = [('f.rank', 'ASC'), ('a.id', 'ASC')]
+        count_sql = "SELECT COUNT(*) FROM assets_fts WHERE assets_fts MATCH ?"
+        params = [match]
+    else:
+        # คำค้นสั้น: ใช้ LIKE บนตาราง FTS แทน เพื่อไม่ให้ไปตรงกับ key ของ JSON
+        search_term = f"%{search_query}%"
+        where_sql = " WHERE (f.name LIKE ? OR f.location LIKE ? OR f.custom_values LIKE ?)"
+        base_sql = "SELECT a.* FROM assets a JOIN assets_fts f ON f.rowid = a.id" + where_sql
+        order_by = [('a.id', 'DESC')]
+        count_sql = "SELECT COUNT(*) FROM assets_fts f" + where_sql
+        params = [search_term, search_term, search_term]
+    page = keyset_paginate(base_sql, params, order_by, after=after, before=before, per_page=per_page)
+    return page, cached_count(count_sql, params)
+
+# คำสั่งเติมข้อมูลลงดัชนีค้นหาจากตารางต้นทาง (ต่อท้ายด้วย WHERE เพื่อเติมเฉพาะบางแถวได้)
+SEARCH_INDEX_SOURCES = {
+    'assets': ('assets_fts', """
+        INSERT INTO assets_fts (rowid, name, location, custom_values)
+        SELECT id, name, location,
+               CASE WHEN json_valid(custom_data)
+                    THEN (SELECT group_concat(value, ' ') FROM json_each(assets.custom_data)) END
+        FROM assets
+    """),
+    'parts': ('parts_fts', """
+        INSERT INTO parts_fts (rowid, part_number, part_name, description)
+        SELECT id, part_number, part_name, description FROM parts
+    """),
+}
+
+def rebuild_search_index(db):
+    """สร้างข้อมูลในดัชนีค้นหาและดัชนี custom attribute ใหม่ทั้งหมดจากตาราง assets และ parts"""
+    for fts_table, fill_sql in SEARCH_INDEX_SOURCES.values():
+        db.execute(f"DELETE FROM {fts_table}")
+        db.execute(fill_sql)
+        db.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('optimize')")
+    db.execute("DELETE FROM asset_attributes")
+    db.execute(ASSET_ATTRIBUTES_FILL_SQL)
+    db.commit()
+
+# --- Custom Attribute Index ---
+# asset_attributes ถูกเติมจาก view asset_attribute_source (migration 0013) ซึ่งแปลง custom_data เป็นค่าแบบมีชนิด
+ASSET_ATTRIBUTES_FILL_SQL = """
+    INSERT OR REPLACE INTO asset_attributes (asset_id, attr_key, value_text, value_num)
+    SELECT asset_id, attr_key, value_text, value_num FROM asset_attribute_source
+"""
+ATTRIBUTE_FILTER_RE = re.compile(r'^\s*(.+?)\s*(>=|<=|!=|=|>|<|~)\s*(.*?)\s*$')
+
+def parse_attribute_filter(expression):
+    """
+    แปลงเงื่อนไข 'key op value' เช่น 'voltage > 380', 'Brand = ABB', 'Serial ~ SN12' เป็น (key, op, value)
+    op คือ = != > >= < <= หรือ ~ (มีข้อความนี้) ค่าที่เป็นตัวเลขถูกแปลงเป็น float เพื่อเทียบกับ value_num
+    """
+    match = ATTRIBUTE_FILTER_RE.match(expression or '')
+    if not match or not match.group(3):
+        raise ValueError(f"invalid attribute filter {expression!r}, expected key op value (e.g. voltage > 380)")
+    key, op, value = match.groups()
+    if op != '~':
+        try:
+            value = float(value.replace(',', ''))
+        except ValueError:
+            pass
+    return key, op, value
+
+def attribute_filter_sql(filters, alias='a'):
+    """
+    คืนค่า (SQL ที่ต่อท้าย WHERE ได้, params) ที่ทุกเงื่อนไขต้องเป็นจริง แต่ละเงื่อนไขค้นผ่าน index ของ asset_attributes
+    ตัวเลขเทียบกับ value_num ข้อความเทียบกับ value_text แบบไม่สนตัวพิมพ์ และ != รวมสินทรัพย์ที่ไม่มี key นั้นด้วย
+    """
+    sql, params = '', []
+    for key, op, value in filters:
+        if op == '~':
+            condition, value = "value_text LIKE ?", f"%{value}%"
+        else:
+            column = 'value_num' if isinstance(value, float) else 'value_text'
+            condition = f"{column} {'=' if op == '!=' else op} ?"
+        sql += (f" AND {alias}.id {'NOT IN' if op == '!=' else 'IN'} "
+                f"(SELECT asset_id FROM asset_attributes WHERE attr_key = ? AND {condition})")
+        params += [key, value]
+    return sql, params
+
+# --- Report Rollup Helpers ---
+JOB_TYPE_LABELS = {'PM': 'งาน PM', 'CM': 'งานซ่อมทั่วไป (CM)'}
+
+def classify_job_type(description):
+    """จัดประเภทงานจากรายละเอียด ใช้เมื่อผู้ใช้ไม่ได้เลือกประเภทงานเอง"""
+    return 'PM' if 'PM' in description or 'บำรุงรักษาเชิงป้องกัน' in description else 'CM'
+
+REPORT_ROLLUP_SOURCES = {
+    'report_monthly_costs': """
+        INSERT INTO report_monthly_costs (month, job_type, job_count, total_cost)
+        SELECT COALESCE(strftime('%Y-%m', date), ''), job_type, COUNT(*), COALESCE(SUM(cost), 0)
+        FROM maintenance_history GROUP BY 1, 2
+    """,
+    'report_asset_job_types': """
+        INSERT INTO report_asset_job_types (asset_id, job_type, job_count, total_cost)
+        SELECT asset_id, job_type, COUNT(*), COALESCE(SUM(cost), 0)
+        FROM maintenance_history GROUP BY 1, 2
+    """,
+}
+
+def rebuild_report_rollups(db, reclassify=False):
+    """สร้างตารางสรุปของหน้ารายงานใหม่ทั้งหมดจาก maintenance_history"""
+    if reclassify:
+        db.execute("""
+            UPDATE maintenance_history
+            SET job_type = CASE WHEN instr(description, 'PM') > 0
+                                  OR instr(description, 'บำรุงรักษาเชิงป้องกัน') > 0 THEN 'PM' ELSE 'CM' END
+        """)
+    for table, fill_sql in REPORT_ROLLUP_SOURCES.items():
+        db.execute(f"DELETE FROM {table}")
+        db.execute(fill_sql)
+    db.commit()
+
+# --- PM Schedule Projection ---
+# จุดบำรุงรักษาที่ยังไม่มี next_check_date ถือว่าครบกำหนดหลังตรวจครั้งล่าสุด (หรือหลังสร้าง) ตามความถี่
+PM_PROJECTION_SQL = """
+    WITH RECURSIVE sources (source_type, source_id, asset_id, technician_id, first_due, freq) AS (
+        SELECT 'asset', id, id, technician_id, pm_due_date, CAST(pm_frequency_days AS INTEGER)
+        FROM assets WHERE pm_due_date IS NOT NULL {asset_filter}
+        UNION ALL
+        SELECT 'point', mp.id, mp.asset_id, a.technician_id,
+               COALESCE(mp.point_due_date,
+                        date(COALESCE(mp.last_checked_date, mp.created_at), '+' || mp.frequency_days || ' days')),
+               mp.frequency_days
+        FROM maintenance_points mp JOIN assets a ON a.id = mp.asset_id
+        WHERE mp.status = 'active' {point_filter}
+    ),
+    -- คำนวณเป็นเลขวัน (julianday) แล้วแปลงเป็นวันที่ครั้งเดียวตอน insert
+    occurrences (source_type, source_id, seq, asset_id, technician_id, due_day, freq) AS (
+        SELECT source_type, source_id, 0, asset_id, technician_id, julianday(first_due), freq
+        FROM sources WHERE first_due <= :until
+        UNION ALL
+        -- รอบถัดจากรอบที่เลยกำหนดแล้วนับจากวันนี้ เหมือนกับ perform_pm
+        SELECT source_type, source_id, seq + 1, asset_id, technician_id, max(due_day, julianday(:today)) + freq, freq
+        FROM occurrences
+        WHERE freq > 0 AND max(due_day, julianday(:today)) + freq <= julianday(:until)
+    )
+    INSERT INTO pm_occurrences (source_type, source_id, seq, asset_id, technician_id, due_date)
+    SELECT source_type, source_id, seq, asset_id, technician_id, date(due_day) FROM occurrences
+"""
+
+def refresh_pm_schedule(db, full=False):
+    """
+    คำนวณ pm_occurrences ใหม่ในคิวรีเดียว: ทั้งหมดเมื่อ full=True หรือเมื่อวัน/horizon เปลี่ยน
+    ไม่เช่นนั้นเฉพาะสินทรัพย์/จุดที่อยู่ใน pm_schedule_dirty คืนค่า (mode, จำนวนแถวที่สร้าง)
+    """
+    today = date.today().isoformat()
+    until = (date.today() + timedelta(days=app.config['PM_SCHEDULE_HORIZON_DAYS'])).isoformat()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        state = db.execute("SELECT projected_from, projected_until FROM pm_schedule_state WHERE id = 1").fetchone()
+        if full or tuple(state) != (today, until):
+            mode = 'full'
+            db.execute("DELETE FROM pm_occurrences")
+            sql = PM_PROJECTION_SQL.format(asset_filter='', point_filter='')
+        elif db.execute("SELECT EXISTS (SELECT 1 FROM pm_schedule_dirty)").fetchone()[0]:
+            mode = 'incremental'
+            db.execute("""
+                DELETE FROM pm_occurrences
+                WHERE (source_type, source_id) IN (SELECT source_type, source_id FROM pm_schedule_dirty)
+            """)
+            sql = PM_PROJECTION_SQL.format(
+                asset_filter="AND id IN (SELECT source_id FROM pm_schedule_dirty WHERE source_type = 'asset')",
+                point_filter="AND mp.id IN (SELECT source_id FROM pm_schedule_dirty WHERE source_type = 'point')")
+        else:
+            db.rollback()
+            return 'current', 0
+        changes = db.total_changes
+        db.execute(sql, {'today': today, 'until': until})
+        inserted = db.total_changes - changes  # rowcount ใช้กับคำสั่งที่ขึ้นต้นด้วย WITH ไม่ได้
+        db.execute("DELETE FROM pm_schedule_dirty")
+        db.execute("""
+            UPDATE pm_schedule_state SET projected_from = ?, projected_until = ?, refreshed_at = CURRENT_TIMESTAMP
+            WHERE id = 1
+        """, (today, until))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return mode, inserted
+
+def ensure_pm_schedule():
+    """
+    ตรวจว่า pm_occurrences เป็นปัจจุบัน (คิวรีเดียวบน reader) คืนค่า True ถ้าผลที่ใช้ได้เป็นปัจจุบัน
+    - เปลี่ยนไม่เกิน PM_SCHEDULE_INLINE_MAX สินทรัพย์/จุด: คำนวณใหม่เฉพาะส่วนนั้นทันที (ใช้ writer ช่วงสั้น ๆ)
+    - วัน/horizon เปลี่ยนหรือเปลี่ยนจำนวนมาก: เพิ่มงาน pm_project ลงคิวแล้วใช้ผลที่คำนวณไว้ล่าสุดไปก่อน
+    """
+    today = date.today().isoformat()
+    until = (date.today() + timedelta(days=app.config['PM_SCHEDULE_HORIZON_DAYS'])).isoformat()
+    inline_max = app.config['PM_SCHEDULE_INLINE_MAX']
+    current, dirty = get_db().execute("""
+        SELECT projected_from IS ? AND projected_until IS ?,
+               (SELECT COUNT(*) FROM (SELECT 1 FROM pm_schedule_dirty LIMIT ?))
+        FROM pm_schedule_state WHERE id = 1
+    """, (today, until, inline_max + 1)).fetchone()
+    if current and not dirty:
+        return True
+    if current and dirty <= inline_max:
+        refresh_pm_schedule(get_db(write=True))
+        return True
+    enqueue_job(get_db(write=True), 'pm_project', dedupe_key='pm_project')
+    return False
+
+@app.template_global()
+def page_url(**overrides):
+    """สร้าง URL ของหน้าปัจจุบันโดยคง query string เดิมและแทนที่ค่าที่ระบุ (None = ลบออก)"""
+    args = request.args.to_dict()
+    args.update(overrides)
+    args = {k: v for k, v in args.items() if v is not None}
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+# --- Background Jobs ---
+# request เพิ่มงานลงตาราง jobs แล้วตอบกลับทันที ส่วน flask worker จองงานทีละงานตาม priority แล้วทำ
+JOB_HANDLERS = {}
+
+def job_handler(kind):
+    """ลงทะเบียนฟังก์ชันทำงานชนิด kind (รับ payload เป็น dict คืนค่าผลลัพธ์ที่แปลงเป็น JSON ได้)"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+def enqueue_job(db, kind, payload=None, priority=0, delay=0, max_attempts=None, dedupe_key=None):
+    """
+    เพิ่มงานลงคิว คืนค่า id ของงาน ถ้ามีธุรกรรมเปิดอยู่งานจะเข้าร่วมธุรกรรมนั้น (worker เห็นหลังผู้เรียก commit)
+    ไม่เช่นนั้น commit ทันที ถ้ามีงาน dedupe_key เดียวกันที่ยังรอหรือกำลังทำอยู่จะคืน id ของงานนั้นแทน
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"unknown job kind: {kind}")
+    commit = not db.in_transaction
+    cursor = db.execute("""
+        INSERT OR IGNORE INTO jobs (kind, payload, priority, run_at, max_attempts, dedupe_key, created_by)
+        VALUES (?, ?, ?, datetime('now', ?), ?, ?, ?)
+    """, (kind, json.dumps(payload or {}, ensure_ascii=False), priority, f'+{delay} seconds',
+          max_attempts or app.config['JOB_MAX_ATTEMPTS'], dedupe_key,
+          session.get('user_id') if has_request_context() else None))
+    if cursor.rowcount:
+        job_id = cursor.lastrowid
+    else:
+        job_id = db.execute("SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')",
+                            (dedupe_key,)).fetchone()[0]
+    if commit:
+        db.commit()
+    return job_id
+
+def claim_job(db, worker_id):
+    """จองงานที่ถึงเวลาและ priority สูงสุดหนึ่งงานด้วยคำสั่งเดียว (None ถ้าคิวว่าง)"""
+    rows = db.execute("""
+        UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?,
+                        locked_at = CURRENT_TIMESTAMP, started_at = CURRENT_TIMESTAMP
+        WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND run_at <= CURRENT_TIMESTAMP
+                    ORDER BY priority DESC, run_at, id LIMIT 1)
+        RETURNING id, kind, payload, attempts, max_attempts
+    """, (worker_id,)).fetchall()
+    db.commit()
+    return rows[0] if rows else None
+
+def job_retry_delay(attempts):
+    """เวลารอก่อนลองใหม่ (วินาที) แบบ exponential backoff พร้อม jitter ±10%"""
+    delay = app.config['JOB_RETRY_BASE_SECONDS'] * 2 ** max(attempts - 1, 0)
+    return min(delay, app.config['JOB_RETRY_MAX_SECONDS']) * random.uniform(0.9, 1.1)
+
+def finish_job(db, job, result=None, error=None, retry=True):
+    """บันทึกผลของงาน: สำเร็จ, กลับเข้าคิวพร้อม backoff หรือ failed เมื่อครบ max_attempts"""
+    if error is None:
+        db.execute("""
+            UPDATE jobs SET status = 'done', result = ?, last_error = NULL, locked_by = NULL, locked_at = NULL,
+                            finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (json.dumps(result, ensure_ascii=False, default=str), job['id']))
+    elif retry and job['attempts'] < job['max_attempts']:
+        db.execute("""
+            UPDATE jobs SET status = 'queued', run_at = datetime('now', ?), last_error = ?, locked_by = NULL, locked_at = NULL
+            WHERE id = ?
+        """, (f"+{job_retry_delay(job['attempts']):.1f} seconds", error, job['id']))
+    else:
+        db.execute("""
+            UPDATE jobs SET status = 'failed', last_error = ?, locked_by = NULL, locked_at = NULL,
+                            finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (error, job['id']))
+    db.commit()
+
+def requeue_stale_jobs(db):
+    """คืนงานที่ค้างสถานะ running นานกว่า JOB_LOCK_TIMEOUT (worker ตายกลางคัน) กลับเข้าคิว คืนค่าจำนวนงาน"""
+    count = db.execute("""
+        UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                        finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE CURRENT_TIMESTAMP END,
+                        last_error = 'worker ' || locked_by || ' stopped responding', locked_by = NULL, locked_at = NULL
+        WHERE status = 'running' AND locked_at < datetime('now', ?)
+    """, (f"-{app.config['JOB_LOCK_TIMEOUT']} seconds",)).rowcount
+    db.commit()
+    return count
+
+def run_job(job):
+    """
+    ทำงานหนึ่งงานแล้วบันทึกผล (exception ของงานไม่หลุดออกไปหยุด worker)
+    งานยืม connection เองตามต้องการ และทุก connection ถูกคืนก่อนยืม writer ใหม่มาบันทึกผล
+    """
+    handler = JOB_HANDLERS.get(job['kind'])
+    if handler is None:
+        finish_job(get_db(write=True), job, error=f"no handler for job kind {job['kind']!r}", retry=False)
+        return
+    result = error = None
+    try:
+        result = handler(json.loads(job['payload']))
+    except Exception as e:
+        print(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed: {e}")
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        release_db()  # rollback งานที่ค้างอยู่ด้วย
+    finish_job(get_db(write=True), job, result=result, error=error)
+
+def work_jobs(worker_id, stop, once=False):
+    """
+    วนจองและทำงานจนกว่า stop จะถูก set (once=True: หยุดเมื่อคิวว่าง) แต่ละงานมี app context ของตัวเอง
+    ไม่ถือ writer ระหว่างทำงาน (dev server รัน worker ใน process เดียวกับเว็บ) และถ้าฐานข้อมูลมีปัญหา
+    จะเขียน log แล้วรอนานขึ้นเรื่อย ๆ แทนที่ thread จะตาย
+    """
+    failures = 0
+    while not stop.is_set():
+        job = None
+        try:
+            with app.app_context():
+                job = claim_job(get_db(write=True), worker_id)
+                release_db()
+                if job is not None:
+                    run_job(job)
+        except Exception as e:
+            failures += 1
+            delay = min(app.config['JOB_POLL_INTERVAL'] * 2 ** failures, app.config['JOB_RETRY_MAX_SECONDS'])
+            print(f"Worker {worker_id} error ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+            stop.wait(delay)
+            continue
+        failures = 0
+        if job is None:
+            if once:
+                return
+            stop.wait(app.config['JOB_POLL_INTERVAL'])
+
+def start_worker_threads(count, stop, once=False):
+    """เริ่ม thread ของ worker count ตัวใน process นี้ คืนค่า list ของ thread"""
+    import socket
+    threads = []
+    for index in range(count):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        thread = threading.Thread(target=work_jobs, args=(worker_id, stop, once), name=f'job-worker-{index}', daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+def _worker_process(once):
+    """จุดเริ่มของ worker แบบ process (หนึ่ง thread ต่อ process) หยุดเมื่อได้รับ SIGTERM หลังทำงานปัจจุบันเสร็จ"""
+    import socket
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work_jobs(f"{socket.gethostname()}:{os.getpid()}:0", stop, once)
+
+def job_status(row):
+    """ข้อมูลสถานะของงานสำหรับ API"""
+    job = {key: row[key] for key in ('id', 'kind', 'status', 'priority', 'attempts', 'max_attempts', 'run_at',
+                                     'last_error', 'created_at', 'started_at', 'finished_at')}
+    job['result'] = json.loads(row['result']) if row['result'] else None
+    if row['kind'] == 'export_history' and row['status'] == 'done':
+        job['download_url'] = url_for('download_job_export', job_id=row['id'])
+    return job
+
+@job_handler('renditions')
+def renditions_job(payload):
+    filename = payload['filename']
+    path = upload_path(filename)
+    if not os.path.isfile(path):
+        return {'created': []}
+    return {'created': create_renditions(path, filename, app.config['RENDITION_FOLDER'],
+                                         IMAGE_RENDITIONS, app.config['RENDITION_QUALITY'])}
+
+@job_handler('purge_uploads')
+def purge_uploads_job(payload):
+    return {'removed': purge_unreferenced_uploads(get_db(write=True), payload['filenames'])}
+
+@job_handler('export_history')
+def export_history_job(payload):
+    sql, params, _ = history_export_query(payload['args'])
+    fmt = payload['args'].get('format', 'csv')
+    chunks = encode_export(iter_query_batches(sql, params), HISTORY_EXPORT_COLUMNS, fmt)
+    os.makedirs(app.config['EXPORT_FOLDER'], exist_ok=True)
+    path = os.path.join(app.config['EXPORT_FOLDER'], payload['file'])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as out:
+        if payload['args'].get('gzip') == '1':
+            for data in gzip_stream(chunks):
+                out.write(data)
+        else:
+            for chunk in chunks:
+                out.write(chunk.encode('utf-8'))
+    os.replace(tmp_path, path)
+    return {'file': payload['file'], 'download_name': payload['download_name'], 'size': os.path.getsize(path)}
+
+@job_handler('parts_forecast')
+def parts_forecast_job(payload):
+    return {'parts': refresh_parts_forecast(get_db(write=True))}
+
+@job_handler('report_rollups')
+def report_rollups_job(payload):
+    rebuild_report_rollups(get_db(write=True), reclassify=payload.get('reclassify', False))
+    return {'rebuilt': list(REPORT_ROLLUP_SOURCES)}
+
+@job_handler('pm_project')
+def pm_project_job(payload):
+    mode, inserted = refresh_pm_schedule(get_db(write=True), full=payload.get('full', False))
+    return {'mode': mode, 'inserted': inserted}
+# ^^^ --- จบส่วนของฟังก์ชันผู้ช่วย --- ^^^
+
+
+# --- Slow Query Log ---
+SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_slow_query_lock = threading.Lock()
+
+def normalize_sql(sql):
+    """รูปแบบของคิวรีสำหรับจัดกลุ่ม: ค่าคงที่เป็น ? รายการ IN (?, ?, ...) เป็น (?...) และยุบช่องว่าง"""
+    sql = SQL_LITERAL_RE.sub('?', ' '.join(sql.split()))
+    return SQL_IN_LIST_RE.sub('(?...)', sql)
+
+def parameter_shape(params):
+    """ชนิดของพารามิเตอร์โดยไม่เก็บค่าจริง เช่น ['int', 'str'] หรือ {'start': 'str'}"""
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    types = [type(value).__name__ for value in params]
+    if len(types) > 10:
+        return [f"{name} x{count}" for name, count in Counter(types).items()]
+    return types
+
+def log_slow_query(conn, sql, params, seconds, rows, plan=True):
+    """เขียนคิวรีที่ช้ากว่า SLOW_QUERY_MS ลง SLOW_QUERY_LOG (JSON หนึ่งบรรทัด) พร้อม EXPLAIN QUERY PLAN"""
+    normalized = normalize_sql(sql)
+    details = []
+    if plan and (sql.split(None, 1) or [''])[0].upper() in ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE'):
+        try:
+            # cursor ธรรมดาเพื่อไม่ให้ EXPLAIN ถูกจับเวลาหรือบันทึกซ้ำ
+            details = [row[3] for row in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params)]
+        except sqlite3.Error as e:
+            details = [f"(EXPLAIN failed: {e})"]
+    entry = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'fingerprint': hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12],
+        'sql': normalized,
+        'params': parameter_shape(params),
+        'ms': round(seconds * 1000, 3),
+        'rows': rows,
+        'source': (request.endpoint or 'unmatched') if has_request_context() else threading.current_thread().name,
+        'plan': details,
+    }
+    line = json.dumps(entry, ensure_ascii=False) + '\n'
+    with _slow_query_lock:
+        with open(app.config['SLOW_QUERY_LOG'], 'a', encoding='utf-8') as log:
+            log.write(line)
+
+# --- Request Metrics ---
+# ตัวเลขเก็บในหน่วยความจำของแต่ละ process และอ่านได้จาก /metrics
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_QUERY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+class RequestTrace:
+    """ตัวเลขของ request ที่กำลังทำงานอยู่ใน thread นี้ (SQL ถูกบันทึกโดย TracingCursor)"""
+    __slots__ = ('started', 'queries', 'rows', 'sql_seconds', 'template_seconds', 'template_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = self.rows = 0
+        self.sql_seconds = self.template_seconds = 0.0
+        self.template_started = None
+
+_request_trace = threading.local()
+
+def _trace_sql(seconds, queries=0, rows=0):
+    trace = getattr(_request_trace, 'current', None)
+    if trace is not None:
+        trace.queries += queries
+        trace.rows += rows
+        trace.sql_seconds += seconds
+
+class TracingCursor(sqlite3.Cursor):
+    """
+    cursor ที่จับเวลาการ execute/fetch และนับแถวที่ส่งกลับ ให้กับ request ปัจจุบัน
+    และรวมเวลาของแต่ละคำสั่งตั้งแต่ execute จนอ่านแถวหมด (หรือ execute ใหม่/ปิด cursor) เพื่อตรวจกับ SLOW_QUERY_MS
+    """
+    __slots__ = ('_sql', '_params', '_elapsed', '_rows')
+
+    def _begin(self, sql, params):
+        self._finish()
+        self._sql, self._params, self._elapsed, self._rows = sql, params, 0.0, 0
+
+    def _add(self, seconds, queries=0, rows=0):
+        _trace_sql(seconds, queries, rows)
+        if getattr(self, '_sql', None) is not None:
+            self._elapsed += seconds
+            self._rows += rows
+
+    def _finish(self):
+        sql = getattr(self, '_sql', None)
+        if sql is None:
+            return
+        self._sql = None
+        threshold = app.config['SLOW_QUERY_MS']
+        if threshold and self._elapsed * 1000 >= threshold:
+            try:
+                log_slow_query(self.connection, sql, self._params, self._elapsed, self._rows)
+            except Exception as e:
+                print(f"Error writing slow query log: {e}")
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(time.perf_counter() - started, queries=1)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+        finally:
+            seconds = time.perf_counter() - started
+            _trace_sql(seconds, queries=1)
+        # บันทึกเฉพาะคำสั่งที่สำเร็จ และไม่ให้ log ที่เขียนไม่ได้ทำให้คำสั่งที่สำเร็จแล้วล้มเหลว
+        threshold = app.config['SLOW_QUERY_MS']
+        if threshold and seconds * 1000 >= threshold:
+            try:
+                log_slow_query(self.connection, sql, (), seconds, self.rowcount, plan=False)
+            except Exception as e:
+                print(f"Error writing slow query log: {e}")
+        return result
+
+    def executescript(self, sql_script):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _trace_sql(time.perf_counter() - started, queries=1)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - started, rows=row is not None)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._add(time.perf_counter() - started, rows=len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - started, rows=len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        # นับอย่างเดียว การจับเวลาทุกแถวแพงกว่าการอ่านแถวเอง
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        self._add(0.0, rows=1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # คิวรีที่อ่านแค่แถวเดียวด้วย fetchone() ไม่เคยอ่านจนหมด จึงตรวจตอน cursor ถูกทิ้ง
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class TracingConnection(sqlite3.Connection):
+    """connection ที่ทุกคำสั่ง (รวม execute ของ connection เอง) ผ่าน TracingCursor"""
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+def prometheus_labels(**values):
+    """ชุด label ของ Prometheus เช่น {endpoint="index",method="GET"} (escape \\ " และขึ้นบรรทัดใหม่)"""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(values, escaped)) + '}'
+
+class MetricsRegistry:
+    """histogram และ counter ของแต่ละ endpoint แสดงผลในรูปแบบ Prometheus text exposition"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()       # (endpoint, method, status) -> จำนวน
+        self.latency = {}               # (endpoint, method) -> [bucket counts..., sum, count]
+        self.queries = {}               # endpoint -> [bucket counts..., sum, count]
+        self.sql_seconds = Counter()
+        self.sql_rows = Counter()
+        self.template_seconds = Counter()
+        self.started_at = time.time()
+
+    @staticmethod
+    def _observe(histograms, key, buckets, value):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(buckets) + 2)
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def observe_request(self, endpoint, method, status, seconds, trace):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            self._observe(self.latency, (endpoint, method), METRICS_LATENCY_BUCKETS, seconds)
+            self._observe(self.queries, endpoint, METRICS_QUERY_BUCKETS, trace.queries)
+            self.sql_seconds[endpoint] += trace.sql_seconds
+            self.sql_rows[endpoint] += trace.rows
+            self.template_seconds[endpoint] += trace.template_seconds
+
+    def render(self, pools=()):
+        labels = prometheus_labels
+
+        def histogram(name, help_text, data, buckets, label_names):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} histogram'])
+            for key, values in sorted(data.items()):
+                key_labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+                for bound, count in zip(buckets, values):
+                    lines.append(f'{name}_bucket{labels(**key_labels, le=bound)} {count}')
+                lines.append(f'{name}_bucket{labels(**key_labels, le="+Inf")} {values[-1]}')
+                lines.append(f'{name}_sum{labels(**key_labels)} {values[-2]:.6f}')
+                lines.append(f'{name}_count{labels(**key_labels)} {values[-1]}')
+
+        def counter(name, help_text, data, label_name='endpoint'):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} counter'])
+            for key, value in sorted(data.items()):
+                lines.append(f'{name}{labels(**{label_name: key})} {value:.6f}'
+                             if isinstance(value, float) else f'{name}{labels(**{label_name: key})} {value}')
+
+        lines = []
+        with self._lock:
+            lines.extend(['# HELP http_requests_total Requests handled by this process.',
+                          '# TYPE http_requests_total counter'])
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{labels(endpoint=endpoint, method=method, status=status)} {count}')
+            histogram('http_request_duration_seconds', 'Request latency from first hook to response.',
+                      self.latency, METRICS_LATENCY_BUCKETS, ('endpoint', 'method'))
+            histogram('http_request_sql_queries', 'SQL statements executed per request.',
+                      self.queries, METRICS_QUERY_BUCKETS, ('endpoint',))
+            counter('http_request_sql_seconds_total', 'Time spent executing and fetching SQL.', self.sql_seconds)
+            counter('http_request_sql_rows_total', 'Rows returned by SQL queries.', self.sql_rows)
+            counter('http_request_template_seconds_total', 'Time spent rendering templates.', self.template_seconds)
+        pool_stats = [pool.stats() for pool in pools]
+        for key, kind in (('in_use', 'gauge'), ('checkouts', 'counter'), ('waits', 'counter'), ('timeouts', 'counter')):
+            name = f'sqlite_pool_{key}' + ('_total' if kind == 'counter' else '')
+            lines.append(f'# TYPE {name} {kind}')
+            for stats in pool_stats:
+                lines.append(f"{name}{labels(pool='read' if stats['readonly'] else 'write')} {stats[key]}")
+        lines.extend(['# HELP process_start_time_seconds Start time of the process since unix epoch.',
+                      '# TYPE process_start_time_seconds gauge',
+                      f'process_start_time_seconds {self.started_at:.3f}'])
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+@app.before_request
+def start_request_trace():
+    if app.config['METRICS_ENABLED']:
+        _request_trace.current = RequestTrace()
+
+def finish_request_trace(status):
+    """บันทึกตัวเลขของ request ที่จบแล้วลง metrics (เรียกครั้งเดียวต่อ request)"""
+    trace = getattr(_request_trace, 'current', None)
+    if trace is None:
+        return
+    _request_trace.current = None
+    metrics.observe_request(request.endpoint or 'unmatched', request.method, status,
+                            time.perf_counter() - trace.started, trace)
+
+@app.after_request
+def record_request_metrics(response):
+    finish_request_trace(response.status_code)
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(exception):
+    # after_request ไม่ถูกเรียกเมื่อ view มี exception ที่ไม่ได้จัดการ
+    finish_request_trace(500)
+
+@before_render_template.connect_via(app)
+def _template_render_started(sender, template, context, **extra):
+    trace = getattr(_request_trace, 'current', None)
+    if trace is not None:
+        trace.template_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def _template_render_finished(sender, template, context, **extra):
+    trace = getattr(_request_trace, 'current', None)
+    if trace is not None and trace.template_started is not None:
+        trace.template_seconds += time.perf_counter() - trace.template_started
+        trace.template_started = None
+
+
+# --- Database Connection ---
+class PoolExhaustedError(sqlite3.OperationalError):
+    """ยืม connection จาก pool ไม่ได้ภายใน DB_POOL_TIMEOUT (ตอบ 503 ใน request)"""
+
+class ConnectionPool:
+    """
+    pool ของ connection SQLite ต่อ process
+    - connection ถูกสร้างเมื่อจำเป็นและตั้งค่า PRAGMA ครั้งเดียวตอนสร้าง
+    - pool แบบ read-only เปิดไฟล์ด้วย mode=ro ส่วน pool ผู้เขียนมีขนาดเล็ก (ปกติ 1)
+      เพราะ SQLite เขียนได้ทีละ connection อยู่แล้ว
+    """
+
+    def __init__(self, database, readonly=False, max_size=1, pragmas=None, timeout=10.0):
+        self.database = database
+        self.readonly = readonly
+        self.max_size = max_size
+        self.pragmas = dict(pragmas or {})
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = Counter()
+
+    def _connect(self):
+        traced = app.config['METRICS_ENABLED'] or app.config['SLOW_QUERY_MS']
+        factory = TracingConnection if traced else sqlite3.Connection
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{self.database}?mode=ro", uri=True, check_same_thread=False, factory=factory)
+        else:
+            conn = sqlite3.connect(self.database, check_same_thread=False, factory=factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            # journal_mode ถูกเก็บในไฟล์ฐานข้อมูล ตั้งได้จาก connection ที่เขียนได้เท่านั้น
+            if self.readonly and name == 'journal_mode':
+                continue
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self):
+        """ยืม connection จาก pool (สร้างใหม่ถ้ายังไม่เต็ม หรือรอจนกว่าจะมีคืน)"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                self._stats['created'] += 1
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    self._stats['timeouts'] += 1
+                    raise PoolExhaustedError(
+                        f"connection pool exhausted ({self.max_size} connections busy for {self.timeout}s)")
+                self._stats['waits'] += 1
+                self._stats['wait_ms'] += (time.perf_counter() - started) * 1000
+        self._stats['checkouts'] += 1
+        return conn
+
+    def release(self, conn):
+        """คืน connection เข้า pool (rollback งานที่ค้างอยู่ก่อน)"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+                self._stats['rollbacks'] += 1
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        """ปิด connection ที่ว่างอยู่ทั้งหมด"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        idle = self._idle.qsize()
+        return {
+            'database': self.database,
+            'readonly': self.readonly,
+            'max_size': self.max_size,
+            'open': self._created,
+            'idle': idle,
+            'in_use': self._created - idle,
+            'checkouts': self._stats['checkouts'],
+            'created': self._stats['created'],
+            'waits': self._stats['waits'],
+            'wait_ms': round(self._stats['wait_ms'], 3),
+            'timeouts': self._stats['timeouts'],
+            'rollbacks': self._stats['rollbacks'],
+        }
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(readonly):
+    """คืน pool ของ process นี้สำหรับฐานข้อมูลปัจจุบัน (แยก pool อ่านและเขียน)"""
+    key = (DATABASE, readonly)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(
+                    DATABASE,
+                    readonly=readonly,
+                    max_size=app.config['DB_POOL_READERS'] if readonly else app.config['DB_POOL_WRITERS'],
+                    pragmas=SQLITE_PRAGMA_PROFILES[app.config['SQLITE_PRAGMA_PROFILE']],
+                    timeout=app.config['DB_POOL_TIMEOUT'],
+                )
+                _pools[key] = pool
+    return pool
+
+def reset_pools():
+    """ทิ้ง pool ทั้งหมด (เช่นหลัง fork เพราะ connection ใช้ข้าม process ไม่ได้)"""
+    _pools.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_pools)
+
+def remove_database():
+    """ปิด connection ใน pool แล้วลบไฟล์ฐานข้อมูลพร้อม -wal/-shm (WAL เก่าใช้กับไฟล์ใหม่ไม่ได้)"""
+    if has_app_context():
+        release_db()
+    for pool in list(_pools.values()):
+        pool.close_all()
+    reset_pools()
+    for path in (DATABASE, DATABASE + '-wal', DATABASE + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+
+# คำสั่งที่ส่งไป reader ได้: SELECT/VALUES/EXPLAIN และ WITH ที่ไม่มีคำสั่งเขียนอยู่ข้างใน
+READ_STATEMENT_RE = re.compile(r'\s*(?:(?:--[^\n]*\n|/\*.*?\*/)\s*)*(SELECT|VALUES|EXPLAIN|WITH)\b', re.IGNORECASE | re.DOTALL)
+WRITE_KEYWORD_RE = re.compile(r'\b(?:INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=1024)
+def is_read_statement(sql):
+    """True ถ้าคำสั่ง SQL อ่านอย่างเดียว (ถ้าไม่แน่ใจถือเป็นคำสั่งเขียน ซึ่งปลอดภัยกว่า)"""
+    match = READ_STATEMENT_RE.match(sql)
+    if match is None:
+        return False
+    return match.group(1).upper() != 'WITH' or WRITE_KEYWORD_RE.search(sql, match.end()) is None
+
+class RequestConnection:
+    """
+    connection ของ request: คำสั่งอ่านใช้ reader ส่วนคำสั่งเขียนยืม writer ตอนที่ต้องเขียนจริง
+    และคืน writer เข้า pool ทันทีที่ commit/rollback เพื่อให้ POST ที่ส่วนใหญ่อ่านอย่างเดียวไม่ต้องรอกัน
+    ระหว่างที่ถือ writer อยู่ คำสั่งอ่านจะใช้ writer ด้วยเพื่อให้เห็นข้อมูลที่ยังไม่ commit
+    """
+
+    def writer(self):
+        if g.get('write_db') is None:
+            g.write_db = get_pool(readonly=False).acquire()
+        return g.write_db
+
+    def reader(self):
+        if g.get('write_db') is not None:
+            return g.write_db
+        if g.get('db') is None:
+            g.db = get_pool(readonly=True).acquire()
+        return g.db
+
+    def execute(self, sql, parameters=()):
+        conn = self.reader() if is_read_statement(sql) else self.writer()
+        return conn.execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.writer().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.writer().executescript(sql_script)
+
+    def cursor(self, *args):
+        return self.writer().cursor(*args)
+
+    @property
+    def in_transaction(self):
+        return g.get('write_db') is not None and g.write_db.in_transaction
+
+    @property
+    def total_changes(self):
+        return self.writer().total_changes
+
+    def _finish(self, method):
+        conn = g.pop('write_db', None)
+        if conn is None:
+            return
+        try:
+            getattr(conn, method)()
+        finally:
+            get_pool(readonly=False).release(conn)
+
+    def commit(self):
+        self._finish('commit')
+
+    def rollback(self):
+        self._finish('rollback')
+
+    def __getattr__(self, name):
+        return getattr(self.writer(), name)
+
+def get_db(write=None):
+    """
+    คืน connection สำหรับงานปัจจุบัน
+    - ใน request: คืน RequestConnection (อ่านจาก reader และยืม writer เฉพาะช่วงที่เขียน)
+      write=True ยืม writer ทันทีเพื่อให้ทุกคำสั่งจนถึง commit ใช้ connection เดียวกัน
+    - นอก request (CLI, worker): คืน writer ที่ถือไว้จนจบ app context หรือจนเรียก release_db()
+    """
+    if has_request_context():
+        if 'request_db' not in g:
+            g.request_db = RequestConnection()
+        if write:
+            g.request_db.writer()
+        return g.request_db
+    if g.get('write_db') is None:
+        g.write_db = get_pool(readonly=False).acquire()
+    return g.write_db
+
+def release_db():
+    """คืน connection ทั้งหมดที่ app context นี้ยืมไว้เข้า pool"""
+    db = g.pop('db', None)
+    if db is not None:
+        get_pool(readonly=True).release(db)
+    write_db = g.pop('write_db', None)
+    if write_db is not None:
+        get_pool(readonly=False).release(write_db)
+
+def get_application_path():
+    """คืน path ของโฟลเดอร์โปรแกรม (รองรับการทำงานใน .exe ที่สร้างด้วย PyInstaller)"""
+    if getattr(sys, 'frozen', False):
+        # ถ้ากำลังรันใน .exe ให้ใช้ path ของ .exe
+        return os.path.dirname(sys.executable)
+    # ถ้ารันเป็นสคริปต์ปกติ ให้ใช้ path ของไฟล์ .py
+    return os.path.dirname(os.path.abspath(__file__))
+
+def init_database():
+    """Creates the database if it does not exist and applies any pending migrations."""
+    
+    # --- สร้าง Path ไปยังโฟลเดอร์ instance ---
+    # ส่วนนี้จะซับซ้อนขึ้นเพื่อรองรับการทำงานใน .exe
+    application_path = get_application_path()
+    instance_path = os.path.join(application_path, 'instance')
+    db_path = os.path.join(instance_path, 'maintenance.db')
+
+    # --- ตรวจสอบและสร้าง/อัปเกรดฐานข้อมูล ---
+    migrations_folder = os.path.join(application_path, 'migrations')
+    is_new = not os.path.exists(db_path)
+    if is_new:
+        print("Database not found. Creating a new one...")
+    try:
+        # ถ้าเวอร์ชันใน header ตรงกับ migration ล่าสุดแล้วก็ไม่ต้องเปิดฐานข้อมูล (กรณีปกติตอนเปิดโปรแกรม)
+        migrations = get_migrations(migrations_folder)
+        if migrations and read_schema_stamp(db_path) == migrations[-1][0]:
+            return
+        os.makedirs(instance_path, exist_ok=True)
+        db = sqlite3.connect(db_path)
+        applied = upgrade_database(db, migrations_folder)
+        db.close()
+        if is_new:
+            print(f"Database created successfully at {db_path}")
+        elif applied:
+            print(f"Database upgraded to version {applied[-1][0]}")
+    except Exception as e:
+        print(f"An error occurred while creating the database: {e}")
+
+# --- Schema Migrations ---
+MIGRATIONS_FOLDER = os.path.join(app.root_path, 'migrations')
+
+# คิวรีที่ถูกเรียกบ่อย ใช้สำหรับรายงาน EXPLAIN QUERY PLAN ก่อน/หลัง upgrade
+HOT_QUERIES = [
+    ('index: asset list', "SELECT * FROM assets WHERE 1=1 ORDER BY id DESC LIMIT 51", ()),
+    ('index: pm due panel', "SELECT * FROM assets WHERE pm_due_date <= date('now', '+7 days') ORDER BY pm_due_date ASC, id ASC LIMIT 51", ()),
+    ('my_tasks', "SELECT id, name, location, next_pm_date FROM assets WHERE technician_id = ? AND pm_due_date <= date('now', '+7 days') ORDER BY pm_due_date ASC", (1,)),
+    ('asset_detail: history', "SELECT * FROM maintenance_history WHERE asset_id = ? ORDER BY date DESC", (1,)),
+    ('asset_detail: points', "SELECT * FROM maintenance_points WHERE asset_id = ? ORDER BY created_at DESC", (1,)),
+    ('asset_detail: point images', "SELECT * FROM maintenance_point_images WHERE maintenance_point_id = ? ORDER BY upload_date DESC", (1,)),
+    ('part_detail: transactions', "SELECT * FROM parts_transactions WHERE part_id = ? AND (transaction_date, id) < (?, ?) ORDER BY transaction_date DESC, id DESC LIMIT 51", (1, '9999', 0)),
+    ('stock as of: snapshot', "SELECT balance, last_transaction_id FROM parts_stock_snapshots WHERE part_id = ? AND snapshot_date <= ? ORDER BY snapshot_date DESC LIMIT 1", (1, '2025-01-01')),
+    ('stock as of: movements', "SELECT transaction_type, quantity FROM parts_transactions WHERE part_id = ? AND id > ? AND transaction_date < date(?, '+1 day') ORDER BY id", (1, 0, '2025-01-01')),
+    ('parts_index: by category', "SELECT * FROM parts WHERE category = ? ORDER BY part_name ASC", ('',)),
+    ('parts_index: low stock', "SELECT p.* FROM parts p LEFT JOIN parts_forecast f ON f.part_id = p.id WHERE p.current_stock <= COALESCE(f.reorder_threshold, p.minimum_stock)", ()),
+    ('parts_index: categories', "SELECT DISTINCT category FROM parts WHERE category IS NOT NULL ORDER BY category", ()),
+    ('delete_part: usage check', "SELECT COUNT(*) FROM maintenance_parts_used WHERE part_id = ?", (1,)),
+    ('pm_events: assets', "SELECT id, name, pm_due_date FROM assets WHERE pm_due_date >= ? AND pm_due_date < ?", ('2025-01-01', '2025-02-01')),
+    ('pm_capacity: window', "SELECT due_date, technician_id, COUNT(*) FROM pm_occurrences WHERE due_date >= ? AND due_date < ? GROUP BY 1, 2", ('2025-01-01', '2025-04-01')),
+    ('jobs: claim', "SELECT id FROM jobs WHERE status = 'queued' AND run_at <= CURRENT_TIMESTAMP ORDER BY priority DESC, run_at, id LIMIT 1", ()),
+    ('pm_events: points', "SELECT asset_id, point_name, point_due_date FROM maintenance_points WHERE status = 'active' AND point_due_date >= ? AND point_due_date < ?", ('2025-01-01', '2025-02-01')),
+]
+
+def get_migrations(migrations_folder=None):
+    """คืน list ของ (version, name, path) จากไฟล์ NNNN_name.sql เรียงตามเวอร์ชัน"""
+    folder = migrations_folder or MIGRATIONS_FOLDER
+    migrations = []
+    for filename in sorted(os.listdir(folder)):
+        prefix, _, rest = filename.partition('_')
+        if filename.endswith('.sql') and prefix.isdigit():
+            migrations.append((int(prefix), rest[:-len('.sql')], os.path.join(folder, filename)))
+    return migrations
+
+def get_schema_version(db):
+    """คืนเวอร์ชันล่าสุดที่ถูก apply แล้ว (0 ถ้ายังไม่เคย)"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+
+def upgrade_database(db, migrations_folder=None):
+    """apply migration ที่ยังไม่ได้ทำทีละไฟล์ โดยแต่ละไฟล์อยู่ใน transaction ของตัวเอง คืน list ที่ apply แล้ว"""
+    current = get_schema_version(db)
+    db.commit()
+    applied = []
+    for version, name, path in get_migrations(migrations_folder):
+        if version <= current:
+            continue
+        with open(path, mode='r', encoding='utf-8') as f:
+            script = f.read()
+        try:
+            db.executescript(
+                "BEGIN;\n" + script +
+                f"\nINSERT INTO schema_migrations (version, name) VALUES ({version}, '{name}');\nCOMMIT;"
+            )
+        except sqlite3.Error as e:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise RuntimeError(f"Migration {version:04d}_{name} failed: {e}") from e
+        applied.append((version, name))
+    # เก็บเวอร์ชันไว้ใน header ของไฟล์ด้วย เพื่อให้ init_database() ตรวจได้โดยไม่ต้องเปิดฐานข้อมูล
+    latest = max([current] + [version for version, _ in applied])
+    if db.execute("PRAGMA user_version").fetchone()[0] != latest:
+        db.execute(f"PRAGMA user_version = {latest}")
+    return applied
+
+def read_schema_stamp(db_path):
+    """อ่าน user_version จาก header 100 ไบต์แรกของไฟล์ SQLite โดยตรง คืน None ถ้าไม่มีไฟล์หรือไม่ใช่ SQLite"""
+    try:
+        with open(db_path, 'rb') as f:
+            header = f.read(100)
+    except OSError:
+        return None
+    if len(header) < 100 or not header.startswith(b'SQLite format 3\x00'):
+        return None
+    return int.from_bytes(header[60:64], 'big')
+
+def explain_query_plans(db):
+    """คืน list ของ (ชื่อคิวรี, [รายละเอียดแผน]) สำหรับ HOT_QUERIES"""
+    report = []
+    for label, sql, params in HOT_QUERIES:
+        try:
+            plan = [row[3] for row in db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+        except sqlite3.OperationalError as e:
+            plan = [f"(ใช้ไม่ได้กับ schema นี้: {e})"]
+        report.append((label, plan))
+    return report
+
+def print_query_plans(title, report):
+    """พิมพ์รายงานแผนคิวรี โดยทำเครื่องหมาย !! ที่บรรทัดที่สแกนทั้งตารางหรือต้องสร้าง temp b-tree"""
+    click.echo(f"--- {title} ---")
+    for label, plan in report:
+        click.echo(f"  {label}")
+        for detail in plan:
+            marker = '!!' if detail.startswith('SCAN') or 'TEMP B-TREE' in detail else '  '
+            click.echo(f"    {marker} {detail}")
+
+@app.teardown_appcontext
+def close_connection(exception):
+    release_db()
+
+@app.errorhandler(PoolExhaustedError)
+def pool_exhausted(error):
+    """ฐานข้อมูลไม่ว่างนานเกิน DB_POOL_TIMEOUT: ตอบ 503 ให้ client ลองใหม่แทน 500"""
+    retry_after = {'Retry-After': str(max(int(app.config['DB_POOL_TIMEOUT']), 1))}
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'database busy, retry later'}), 503, retry_after
+    return 'ระบบกำลังทำงานหนัก กรุณาลองใหม่อีกครั้งในอีกสักครู่', 503, retry_after
+
+# --- CLI Commands (No Changes) ---
+@app.cli.command('init-db')
+def init_db_command():
+    """Delete the database and recreate it from the migrations."""
+    remove_database()
+    db = sqlite3.connect(DATABASE)
+    upgrade_database(db)
+    
+    # Add sample parts data if parts table is empty
+    cursor = db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM parts")
+    if cursor.fetchone()[0] == 0:
+        insert_sample_parts(db)
+        print('Sample parts data added successfully!')
+    
+    db.commit()
+    db.close()
+    print('Initialized the database.')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the FTS5 search index for assets and parts and the asset attribute index."""
+    db = sqlite3.connect(DATABASE)
+    rebuild_search_index(db)
+    assets_count = db.execute("SELECT COUNT(*) FROM assets_fts").fetchone()[0]
+    parts_count = db.execute("SELECT COUNT(*) FROM parts_fts").fetchone()[0]
+    attributes_count = db.execute("SELECT COUNT(*) FROM asset_attributes").fetchone()[0]
+    db.close()
+    print(f'Search index rebuilt: {assets_count} assets, {parts_count} parts, {attributes_count} asset attributes.')
+
+
+@app.cli.command('rebuild-report-rollups')
+@click.option('--reclassify', is_flag=True, help='Re-derive job_type from each description first.')
+def rebuild_report_rollups_command(reclassify):
+    """Rebuild the monthly cost and job type rollup tables used by /reports."""
+    db = sqlite3.connect(DATABASE)
+    rebuild_report_rollups(db, reclassify=reclassify)
+    months = db.execute("SELECT COUNT(DISTINCT month) FROM report_monthly_costs").fetchone()[0]
+    assets_count = db.execute("SELECT COUNT(DISTINCT asset_id) FROM report_asset_job_types").fetchone()[0]
+    db.close()
+    print(f'Report rollups rebuilt: {months} months, {assets_count} assets.')
+
+
+db_cli = AppGroup('db', help='Database schema migration commands.')
+
+@db_cli.command('upgrade')
+@click.option('--explain/--no-explain', default=True, help='Print EXPLAIN QUERY PLAN for hot queries before and after.')
+def db_upgrade_command(explain):
+    """Apply pending schema migrations."""
+    db = sqlite3.connect(DATABASE)
+    try:
+        if explain:
+            print_query_plans('Query plans before upgrade', explain_query_plans(db))
+        before = get_schema_version(db)
+        applied = upgrade_database(db)
+        for version, name in applied:
+            click.echo(f"Applied {version:04d}_{name}")
+        if not applied:
+            click.echo(f"Database is up to date (version {before}).")
+        if explain:
+            db.execute("PRAGMA analysis_limit = 1000")
+            db.execute("ANALYZE")
+            db.commit()
+            print_query_plans('Query plans after upgrade', explain_query_plans(db))
+    finally:
+        db.close()
+
+@db_cli.command('status')
+def db_status_command():
+    """Show the current schema version and pending migrations."""
+    db = sqlite3.connect(DATABASE)
+    current = get_schema_version(db)
+    db.close()
+    click.echo(f"Current version: {current}")
+    for version, name, _ in get_migrations():
+        click.echo(f"  [{'x' if version <= current else ' '}] {version:04d}_{name}")
+
+@db_cli.command('explain')
+def db_explain_command():
+    """Print EXPLAIN QUERY PLAN for the hot queries."""
+    db = sqlite3.connect(DATABASE)
+    print_query_plans('Query plans', explain_query_plans(db))
+    db.close()
+
+@db_cli.command('slow-queries')
+@click.option('--top', type=int, default=20, help='Number of query types to show.')
+@click.option('--since', default=None, help='Only entries logged on or after this date (YYYY-MM-DD).')
+@click.option('--sort', type=click.Choice(['total', 'max', 'count']), default='total', help='Rank query types by.')
+@click.option('--clear', is_flag=True, help='Empty the log after printing the report.')
+def db_slow_queries_command(top, since, sort, clear):
+    """Group the slow-query log by normalized SQL and show the worst query types with their plans."""
+    path = app.config['SLOW_QUERY_LOG']
+    groups = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as log:
+            for line in log:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if since and entry['at'] < since:
+                    continue
+                group = groups.setdefault(entry['fingerprint'], {'sql': entry['sql'], 'durations': [], 'rows': 0,
+                                                                 'sources': Counter(), 'params': None, 'plan': []})
+                group['durations'].append(entry['ms'])
+                group['rows'] += entry['rows'] or 0
+                group['sources'][entry['source']] += 1
+                group['params'] = entry['params']
+                group['plan'] = entry['plan'] or group['plan']
+    if not groups:
+        click.echo(f"No slow queries logged (threshold {app.config['SLOW_QUERY_MS']:g} ms, log {path})")
+        return
+    rank = {'total': lambda g: sum(g['durations']), 'max': lambda g: max(g['durations']),
+            'count': lambda g: len(g['durations'])}[sort]
+    ranked = sorted(groups.items(), key=lambda item: rank(item[1]), reverse=True)
+    click.echo(f"{sum(len(g['durations']) for g in groups.values())} slow queries in {len(groups)} query types "
+               f"(threshold {app.config['SLOW_QUERY_MS']:g} ms), worst {min(top, len(ranked))} by {sort}:")
+    for fingerprint, group in ranked[:top]:
+        durations = sorted(group['durations'])
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        sources = ', '.join(f"{source} x{count}" for source, count in group['sources'].most_common(3))
+        click.echo(f"\n[{fingerprint}] {len(durations)}x  total {sum(durations):,.0f} ms  "
+                   f"avg {sum(durations) / len(durations):,.1f}  p95 {p95:,.1f}  max {durations[-1]:,.1f} ms  "
+                   f"avg rows {group['rows'] / len(durations):,.0f}")
+        click.echo(f"  from: {sources}")
+        click.echo(f"  params: {group['params']}")
+        click.echo(f"  {group['sql'][:500]}")
+        for detail in group['plan']:
+            marker = '!!' if detail.startswith('SCAN') or 'TEMP B-TREE' in detail else '  '
+            click.echo(f"    {marker} {detail}")
+    if clear:
+        open(path, 'w').close()
+        click.echo("\nSlow query log cleared.")
+
+app.cli.add_command(db_cli)
+
+
+pm_cli = AppGroup('pm', help='PM schedule projection commands.')
+
+@pm_cli.command('project')
+@click.option('--full', is_flag=True, help='Recompute every occurrence instead of only changed assets and points.')
+@click.option('--horizon', type=int, default=None, help='Days ahead to project (default PM_SCHEDULE_HORIZON_DAYS).')
+def pm_project_command(full, horizon):
+    """Project recurring PM occurrences for all assets and maintenance points."""
+    if horizon:
+        app.config['PM_SCHEDULE_HORIZON_DAYS'] = horizon
+    db = sqlite3.connect(DATABASE)
+    started = time.perf_counter()
+    mode, inserted = refresh_pm_schedule(db, full=full)
+    elapsed = time.perf_counter() - started
+    total, until = db.execute("""
+        SELECT (SELECT COUNT(*) FROM pm_occurrences), projected_until FROM pm_schedule_state WHERE id = 1
+    """).fetchone()
+    db.close()
+    print(f'PM schedule {mode}: {inserted} occurrences written in {elapsed:.2f}s, {total} projected until {until}.')
+
+@pm_cli.command('perform')
+@click.option('--asset', 'asset_ids', multiple=True, type=int, help='Asset ID (repeatable).')
+@click.option('--point', 'point_ids', multiple=True, type=int, help='Maintenance point ID (repeatable).')
+@click.option('--file', 'ids_file', type=click.File('r', encoding='utf-8-sig'),
+              help='CSV with type,id rows (type is asset or point).')
+@click.option('--date', 'performed_on', default=None, help='Completion date (YYYY-MM-DD), default today.')
+def pm_perform_command(asset_ids, point_ids, ids_file, performed_on):
+    """Record completed PMs for many assets and maintenance points in one transaction."""
+    asset_ids, point_ids = list(asset_ids), list(point_ids)
+    try:
+        performed_on = date.fromisoformat(performed_on) if performed_on else None
+    except ValueError:
+        raise click.BadParameter(f"expected YYYY-MM-DD, got {performed_on!r}", param_hint='--date')
+    if ids_file:
+        import csv
+        for row in csv.reader(ids_file):
+            if len(row) >= 2 and row[1].strip().isdigit():
+                (point_ids if row[0].strip().lower() == 'point' else asset_ids).append(int(row[1]))
+    started = time.perf_counter()
+    results = perform_pm_batch(get_db(write=True), asset_ids, point_ids, performed_on)
+    elapsed = time.perf_counter() - started
+    summary = Counter(result['status'] for result in results)
+    for result in results:
+        if result['status'] != 'done':
+            click.echo(f"  {result['type']} {result['id']}: {result['status']}")
+    click.echo(f"Done {summary['done']}, no frequency {summary['no_frequency']}, "
+               f"not found {summary['not_found']} in {elapsed:.2f}s")
+
+app.cli.add_command(pm_cli)
+
+
+@app.cli.command('worker')
+@click.option('--concurrency', '-c', type=int, default=None, help='Number of workers (default JOB_WORKERS).')
+@click.option('--pool', type=click.Choice(['thread', 'process']), default='thread',
+              help='Run workers as threads in this process or as separate processes.')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty instead of polling.')
+def worker_command(concurrency, pool, once):
+    """Run queued background jobs until interrupted (SIGTERM/Ctrl+C finish the current job first)."""
+    concurrency = max(concurrency or app.config['JOB_WORKERS'], 1)
+    # งานที่เขียนฐานข้อมูลถือ writer ระหว่างทำงาน จึงให้มี writer เท่าจำนวน thread
+    app.config['DB_POOL_WRITERS'] = max(app.config['DB_POOL_WRITERS'], concurrency)
+    reset_pools()
+    requeued = requeue_stale_jobs(get_db(write=True))
+    release_db()
+    click.echo(f"Worker starting: {concurrency} {pool} worker(s), {requeued} stale jobs requeued"
+               + (", exiting when the queue is empty" if once else ""))
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    if pool == 'thread':
+        workers = start_worker_threads(concurrency, stop, once)
+    else:
+        import multiprocessing
+        workers = [multiprocessing.Process(target=_worker_process, args=(once,), name=f'job-worker-{index}')
+                   for index in range(concurrency)]
+        for process in workers:
+            process.start()
+    checked = time.monotonic()
+    try:
+        while not stop.is_set() and any(worker.is_alive() for worker in workers):
+            stop.wait(1)
+            if time.monotonic() - checked > 60:
+                requeue_stale_jobs(get_db(write=True))
+                release_db()
+                checked = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    click.echo("Stopping workers after their current job...")
+    for worker in workers:
+        if pool == 'process' and worker.is_alive():
+            worker.terminate()  # ส่ง SIGTERM ให้ process หยุดหลังงานปัจจุบัน
+        worker.join()
+    counts = dict(get_db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    click.echo("Worker stopped. Jobs: " + ", ".join(f"{status} {count}" for status, count in sorted(counts.items())))
+
+
+jobs_cli = AppGroup('jobs', help='Background job queue commands.')
+
+@jobs_cli.command('list')
+@click.option('--status', type=click.Choice(['queued', 'running', 'done', 'failed']), default=None)
+@click.option('--limit', type=int, default=20)
+def jobs_list_command(status, limit):
+    """Show the most recent jobs."""
+    sql = "SELECT * FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY id DESC LIMIT ?"
+    for row in get_db().execute(sql, ([status] if status else []) + [limit]):
+        error = f"  {row['last_error'][:80]}" if row['last_error'] and row['status'] != 'done' else ''
+        click.echo(f"  #{row['id']} {row['kind']} [{row['status']}] priority {row['priority']}, "
+                   f"attempt {row['attempts']}/{row['max_attempts']}, run at {row['run_at']}{error}")
+
+@jobs_cli.command('enqueue')
+@click.argument('kind')
+@click.option('--payload', default='{}', help='JSON payload.')
+@click.option('--priority', type=int, default=0, help='Higher runs first.')
+@click.option('--delay', type=int, default=0, help='Seconds to wait before the job may run.')
+def jobs_enqueue_command(kind, payload, priority, delay):
+    """Add a job (e.g. parts_forecast, report_rollups, pm_project) to the queue."""
+    if kind not in JOB_HANDLERS:
+        raise click.BadParameter(f"choose from {', '.join(sorted(JOB_HANDLERS))}", param_hint='KIND')
+    job_id = enqueue_job(get_db(write=True), kind, json.loads(payload), priority=priority, delay=delay)
+    click.echo(f"Queued job #{job_id} ({kind})")
+
+@jobs_cli.command('retry')
+@click.argument('job_id', type=int)
+def jobs_retry_command(job_id):
+    """Queue a failed job again with a fresh set of attempts."""
+    db = get_db(write=True)
+    updated = db.execute("""
+        UPDATE jobs SET status = 'queued', attempts = 0, run_at = CURRENT_TIMESTAMP, finished_at = NULL
+        WHERE id = ? AND status = 'failed'
+    """, (job_id,)).rowcount
+    db.commit()
+    click.echo(f"Job #{job_id} queued again" if updated else f"Job #{job_id} is not a failed job")
+
+@jobs_cli.command('prune')
+@click.option('--days', type=int, default=7, help='Delete finished jobs older than this many days.')
+def jobs_prune_command(days):
+    """Delete finished jobs (and their export files) older than --days."""
+    db = get_db(write=True)
+    old = db.execute("""
+        SELECT id, kind, result FROM jobs
+        WHERE status IN ('done', 'failed') AND finished_at < datetime('now', ?)
+    """, (f'-{days} days',)).fetchall()
+    for row in old:
+        if row['kind'] == 'export_history' and row['result']:
+            try:
+                os.remove(os.path.join(app.config['EXPORT_FOLDER'], secure_filename(json.loads(row['result'])['file'])))
+            except FileNotFoundError:
+                pass
+    db.executemany("DELETE FROM jobs WHERE id = ?", [(row['id'],) for row in old])
+    db.commit()
+    click.echo(f"Deleted {len(old)} finished jobs")
+
+app.cli.add_command(jobs_cli)
+
+
+images_cli = AppGroup('images', help='Image rendition commands.')
+
+@images_cli.command('backfill')
+@click.option('--workers', default=os.cpu_count() or 2, show_default=True, help='Number of worker processes.')
+@click.option('--force', is_flag=True, help='Regenerate renditions that are already up to date.')
+def images_backfill_command(workers, force):
+    """Generate thumbnail and medium renditions for every stored upload."""
+    import importlib.util
+    if importlib.util.find_spec('PIL') is None:
+        click.echo("Pillow is not installed: pip install Pillow")
+        return
+    db = sqlite3.connect(DATABASE)
+    filenames = [name for (name,) in db.execute("SELECT name FROM upload_blobs WHERE ref_count > 0")
+                 if allowed_file(name) and os.path.isfile(upload_path(name))]
+    db.close()
+    click.echo(f"Processing {len(filenames)} images with {workers} workers...")
+    import concurrent.futures
+    started = time.perf_counter()
+    created = failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(create_renditions, upload_path(name), name,
+                            app.config['RENDITION_FOLDER'], IMAGE_RENDITIONS,
+                            app.config['RENDITION_QUALITY'], force): name
+            for name in filenames
+        }
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                created += len(future.result())
+            except Exception as e:
+                failed += 1
+                click.echo(f"  {futures[future]}: {e}")
+            if done % 500 == 0:
+                click.echo(f"  {done}/{len(filenames)}")
+    click.echo(f"Created {created} renditions, {failed} failed, in {time.perf_counter() - started:.1f}s")
+
+app.cli.add_command(images_cli)
+
+
+uploads_cli = AppGroup('uploads', help='Content-addressed upload storage commands.')
+
+@uploads_cli.command('gc')
+def uploads_gc_command():
+    """Delete stored files that no asset or maintenance point image references."""
+    db = get_db(write=True)
+    names = [row['name'] for row in db.execute("SELECT name FROM upload_blobs WHERE ref_count <= 0")]
+    removed = purge_unreferenced_uploads(db, names)
+    # ไฟล์ชั่วคราวที่ค้างจากการอัปโหลดที่ล้มเหลว (เก่ากว่า 1 ชั่วโมง)
+    tmp_folder = os.path.join(app.config['BLOB_FOLDER'], 'tmp')
+    stale = 0
+    if os.path.isdir(tmp_folder):
+        for entry in os.scandir(tmp_folder):
+            if entry.is_file() and entry.stat().st_mtime < time.time() - 3600:
+                os.remove(entry.path)
+                stale += 1
+    click.echo(f"Removed {removed} unreferenced files and {stale} stale temporary files.")
+
+@uploads_cli.command('migrate')
+def uploads_migrate_command():
+    """Move uploads saved under their original names into the content-addressed store."""
+    db = get_db(write=True)
+    legacy = [row['name'] for row in db.execute("SELECT name FROM upload_blobs WHERE ref_count > 0")
+              if not BLOB_NAME_RE.match(row['name'])]
+    moved = missing = 0
+    for name in legacy:
+        path = upload_path(name)
+        if not allowed_file(name) or not os.path.isfile(path):
+            missing += 1
+            continue
+        with open(path, 'rb') as f:
+            blob_name = store_upload(f, name)
+        db.execute("UPDATE assets SET asset_image_filename = ? WHERE asset_image_filename = ?", (blob_name, name))
+        db.execute("UPDATE maintenance_point_images SET image_filename = ? WHERE image_filename = ?", (blob_name, name))
+        db.commit()
+        purge_unreferenced_uploads(db, [name])
+        moved += 1
+    click.echo(f"Moved {moved} files, {missing} missing or not images.")
+    if moved:
+        click.echo("Run 'flask images backfill' to regenerate renditions.")
+
+app.cli.add_command(uploads_cli)
+
+
+stock_cli = AppGroup('stock', help='Stock ledger commands.')
+
+@stock_cli.command('bench')
+@click.option('--threads', default=8, show_default=True, help='Concurrent writers, each with its own connection.')
+@click.option('--batches', default=200, show_default=True, help='Batches posted by each writer.')
+@click.option('--lines', default=50, show_default=True, help='Movements per batch.')
+@click.option('--parts', default=100, show_default=True, help='Parts in the scratch database.')
+def stock_bench_command(threads, batches, lines, parts):
+    """Post random receipts and issues concurrently to a scratch database and check the ledger invariants."""
+    import shutil
+    import tempfile
+    initial_stock = 1000
+    folder = tempfile.mkdtemp(prefix='stock-bench-')
+    path = os.path.join(folder, 'bench.db')
+    db = sqlite3.connect(path)
+    upgrade_database(db)
+    db.executemany("INSERT INTO parts (part_number, part_name, current_stock) VALUES (?, ?, ?)",
+                   [(f"BENCH-{i:05d}", f"Bench part {i}", initial_stock) for i in range(parts)])
+    db.commit()
+    part_ids = [row[0] for row in db.execute("SELECT id FROM parts")]
+    pool = ConnectionPool(path, max_size=threads, pragmas=SQLITE_PRAGMA_PROFILES[app.config['SQLITE_PRAGMA_PROFILE']],
+                          timeout=app.config['DB_POOL_TIMEOUT'])
+    counts = Counter()
+    counts_lock = threading.Lock()
+
+    def writer(seed):
+        rng = random.Random(seed)
+        conn = pool.acquire()
+        local = Counter()
+        try:
+            for _ in range(batches):
+                movements = [{'part_id': rng.choice(part_ids), 'type': rng.choice(('in', 'out')),
+                              'quantity': rng.randint(1, 10)} for _ in range(lines)]
+                try:
+                    apply_stock_movements(conn, movements, 'bench')
+                    local['posted'] += 1
+                except StockError:
+                    local['rejected'] += 1
+        finally:
+            pool.release(conn)
+            with counts_lock:
+                counts.update(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=writer, args=(seed,)) for seed in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    pool.close_all()
+
+    negative = db.execute("SELECT COUNT(*) FROM parts WHERE current_stock < 0").fetchone()[0]
+    # สต็อกปัจจุบันต้องเท่ากับสต็อกเริ่มต้น + รับเข้า - จ่ายออก และเท่ากับ balance_after ของรายการล่าสุด
+    mismatched = db.execute("""
+        SELECT COUNT(*) FROM parts p
+        WHERE p.current_stock != ? + COALESCE((
+                SELECT SUM(CASE transaction_type WHEN 'in' THEN quantity ELSE -quantity END)
+                FROM parts_transactions WHERE part_id = p.id), 0)
+           OR p.current_stock != COALESCE((
+                SELECT balance_after FROM parts_transactions WHERE part_id = p.id ORDER BY id DESC LIMIT 1), ?)
+    """, (initial_stock, initial_stock)).fetchone()[0]
+    posted_lines = db.execute("SELECT COUNT(*) FROM parts_transactions").fetchone()[0]
+    db.close()
+    shutil.rmtree(folder, ignore_errors=True)
+
+    click.echo(f"{threads} writers: {counts['posted']} batches posted, {counts['rejected']} rejected (insufficient stock) "
+               f"in {elapsed:.2f}s")
+    click.echo(f"  {counts['posted'] / elapsed:,.0f} batches/s, {posted_lines / elapsed:,.0f} ledger lines/s")
+    click.echo(f"  invariants: {negative} negative stock, {mismatched} parts where stock != ledger "
+               f"-> {'OK' if not negative and not mismatched else 'FAILED'}")
+    if negative or mismatched:
+        raise click.ClickException("stock ledger invariants failed")
+
+@stock_cli.command('snapshot')
+@click.option('--date', 'snapshot_date', default=None, help='Snapshot the balance at the end of this day (YYYY-MM-DD, UTC like the ledger), default today.')
+def stock_snapshot_command(snapshot_date):
+    """Record end-of-day stock balances for parts that moved since their last snapshot."""
+    try:
+        snapshot_date = date.fromisoformat(snapshot_date).isoformat() if snapshot_date else None
+    except ValueError:
+        raise click.BadParameter(f"expected YYYY-MM-DD, got {snapshot_date!r}", param_hint='--date')
+    db = get_db(write=True)
+    started = time.perf_counter()
+    written = take_stock_snapshots(db, snapshot_date)
+    click.echo(f"Wrote {written} snapshots in {time.perf_counter() - started:.2f}s")
+
+@stock_cli.command('reconcile')
+def stock_reconcile_command():
+    """Compare parts.current_stock with the latest snapshot plus the ledger rows after it."""
+    mismatches = reconcile_stock(get_db())
+    for part_id, part_number, current_stock, ledger in mismatches[:50]:
+        click.echo(f"  {part_number} (id {part_id}): current_stock {current_stock}, ledger {ledger}")
+    click.echo(f"{len(mismatches)} parts do not match the ledger" if mismatches else "All parts match the ledger")
+
+@stock_cli.command('forecast')
+@click.option('--window', type=int, default=None, help='Days of consumption history to use (default PARTS_FORECAST_WINDOW_DAYS).')
+@click.option('--lead-time', type=int, default=None, help='Supplier lead time in days (default PARTS_LEAD_TIME_DAYS).')
+@click.option('--review', type=int, default=None, help='Days each order should cover (default PARTS_REVIEW_DAYS).')
+def stock_forecast_command(window, lead_time, review):
+    """Recompute consumption rates, reorder points and suggested order quantities for all parts."""
+    for key, value in (('PARTS_FORECAST_WINDOW_DAYS', window), ('PARTS_LEAD_TIME_DAYS', lead_time),
+                       ('PARTS_REVIEW_DAYS', review)):
+        if value is not None:
+            app.config[key] = value
+    db = get_db(write=True)
+    started = time.perf_counter()
+    written = refresh_parts_forecast(db)
+    elapsed = time.perf_counter() - started
+    reorder = db.execute(f"""
+        SELECT p.part_number, p.current_stock, {PARTS_FORECAST_COLUMNS}
+        FROM parts p JOIN parts_forecast f ON f.part_id = p.id
+        WHERE p.current_stock <= f.reorder_threshold
+        ORDER BY days_of_cover IS NULL, days_of_cover ASC
+    """).fetchall()
+    for row in reorder[:50]:
+        cover = f"{row['days_of_cover']:.1f} days" if row['days_of_cover'] is not None else 'no usage'
+        click.echo(f"  {row['part_number']}: stock {row['current_stock']}, reorder point {row['reorder_point']}, "
+                   f"cover {cover}, order {row['suggested_qty']}")
+    click.echo(f"Forecast {written} parts in {elapsed:.2f}s, {len(reorder)} at or below their reorder point")
+
+app.cli.add_command(stock_cli)
+
+
+@app.cli.command('create-admin')
+@click.argument('username')
+@click.argument('password')
+def create_admin_command(username, password):
+    db = sqlite3.connect(DATABASE)
+    try:
+        db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, 'admin')", (username, hash_password(password)))
+        db.commit()
+        print(f"Admin user '{username}' created successfully.")
+    except db.IntegrityError:
+        print(f"Error: User '{username}' already exists.")
+    finally:
+        db.close()
+
+# --- Synthetic Data and Benchmarks ---
+# ขนาดข้อมูลสำเร็จรูปของ flask seed (points = จำนวนจุดบำรุงรักษาเฉลี่ยต่อสินทรัพย์)
+SEED_SCALES = {
+    'small': {'technicians': 5, 'assets': 1000, 'points': 2, 'history': 20000, 'parts': 200, 'transactions': 10000},
+    'medium': {'technicians': 20, 'assets': 10000, 'points': 2, 'history': 500000, 'parts': 2000, 'transactions': 100000},
+    'large': {'technicians': 100, 'assets': 100000, 'points': 2, 'history': 5000000, 'parts': 10000, 'transactions': 1000000},
+}
+
+SEED_ASSET_TYPES = [
+    ('ปั๊มน้ำ', 'Water Pump'), ('เครื่องปรับอากาศ', 'Air Conditioner'), ('มอเตอร์ไฟฟ้า', 'Electric Motor'),
+    ('คอมเพรสเซอร์', 'Air Compressor'), ('สายพานลำเลียง', 'Conveyor'), ('หม้อไอน้ำ', 'Boiler'),
+    ('เครื่องกำเนิดไฟฟ้า', 'Generator'), ('พัดลมระบายอากาศ', 'Exhaust Fan'), ('ลิฟต์', 'Elevator'),
+    ('ตู้ควบคุมไฟฟ้า', 'Control Panel'), ('หอผึ่งเย็น', 'Cooling Tower'), ('เครื่องกลึง', 'Lathe'),
+]
+SEED_LOCATIONS = ['อาคาร A', 'อาคาร B', 'Building C', 'โรงงาน 1', 'Plant 2', 'คลังสินค้า', 'Warehouse', 'อาคารสำนักงาน']
+SEED_BRANDS = ['Mitsubishi', 'Daikin', 'Grundfos', 'ABB', 'Siemens', 'Hitachi', 'Atlas Copco', 'Toshiba']
+SEED_PM_TEXT = [
+    'PM ตรวจเช็คประจำเดือน', 'บำรุงรักษาเชิงป้องกัน ทำความสะอาดและหล่อลื่น', 'PM: replace filter and inspect belts',
+    'PM ตรวจวัดค่ากระแสไฟฟ้าและแรงดัน', 'Quarterly PM inspection', 'บำรุงรักษาเชิงป้องกัน เปลี่ยนน้ำมันหล่อลื่น',
+]
+SEED_CM_TEXT = [
+    'ซ่อมมอเตอร์ไหม้', 'เปลี่ยนลูกปืนที่มีเสียงดัง', 'Repair refrigerant leak', 'แก้ไขปัญหาเครื่องหยุดทำงาน',
+    'Replace broken coupling', 'ซ่อมระบบไฟฟ้าควบคุม', 'Fix abnormal vibration', 'เปลี่ยนซีลรั่วซึม',
+]
+SEED_POINT_NAMES = ['ลูกปืน', 'สายพาน', 'ไส้กรอง', 'Oil level', 'Coupling', 'ขั้วต่อสายไฟ', 'Pressure gauge', 'ใบพัด']
+SEED_PART_TYPES = [
+    ('ลูกปืน', 'Bearing', 'เครื่องจักร'), ('สายพาน', 'V-Belt', 'เครื่องจักร'), ('กรองอากาศ', 'Air Filter', 'ระบบปรับอากาศ'),
+    ('น้ำมันหล่อลื่น', 'Lubricant', 'น้ำมันหล่อลื่น'), ('ซีลยาง', 'Rubber Seal', 'ฮาร์ดแวร์'), ('ฟิวส์', 'Fuse', 'ไฟฟ้า'),
+    ('คอนแทคเตอร์', 'Contactor', 'ไฟฟ้า'), ('สกรู', 'Screw', 'ฮาร์ดแวร์'),
+]
+
+def _seed_timestamp(rng, anchor, days_back):
+    """เวลาสุ่มในช่วง days_back วันก่อน anchor ในรูปแบบเดียวกับ CURRENT_TIMESTAMP"""
+    moment = anchor - timedelta(seconds=rng.randrange(days_back * 86400))
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def _bulk_insert(db, sql, rows, batch_size=50000):
+    """executemany ทีละชุดเพื่อให้หน่วยความจำคงที่ (rows เป็น generator ได้) คืนค่าจำนวนแถว"""
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.executemany(sql, batch)
+            total += len(batch)
+            batch.clear()
+    if batch:
+        db.executemany(sql, batch)
+        total += len(batch)
+    db.commit()
+    return total
+
+def seed_database(db, scale, seed=42, echo=print, as_of=None):
+    """
+    สร้างข้อมูลจำลองที่สมจริงและสุ่มซ้ำได้ต่อจากข้อมูลที่มีอยู่ (seed และ as_of เดิมได้ข้อมูลเดิม)
+    วันที่และเวลาทั้งหมดนับจากเที่ยงคืนของ as_of (ค่าเริ่มต้นวันนี้) ไม่ใช่จากนาฬิกาขณะรัน
+    scale คือ dict แบบ SEED_SCALES คืนค่า dict ของ {ตาราง: จำนวนแถวที่เพิ่ม}
+    """
+    rng = random.Random(seed)
+    today = as_of or date.today()
+    anchor = datetime.combine(today, datetime.min.time())
+    counts = {}
+
+    def timed(table, sql, rows):
+        started = time.perf_counter()
+        counts[table] = _bulk_insert(db, sql, rows)
+        elapsed = time.perf_counter() - started
+        echo(f"  {table}: {counts[table]:,} rows in {elapsed:.1f}s ({counts[table] / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    # ช่างทุกคนใช้รหัสผ่าน 'password' (hash ครั้งเดียวเพราะ hash ช้าโดยตั้งใจ)
+    password_hash = hash_password('password')
+    first_user = db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM users").fetchone()[0]
+    timed('users', "INSERT OR IGNORE INTO users (username, password_hash, role) VALUES (?, ?, 'technician')",
+          ((f"tech{seed}_{n:04d}", password_hash) for n in range(scale['technicians'])))
+    technician_ids = [row[0] for row in db.execute(
+        "SELECT id FROM users WHERE role = 'technician' AND id >= ?", (first_user,))] or [None]
+
+    first_asset = db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM assets").fetchone()[0]
+
+    def assets():
+        for n in range(scale['assets']):
+            thai, english = rng.choice(SEED_ASSET_TYPES)
+            custom = {'Brand': rng.choice(SEED_BRANDS), 'Serial': f"SN{rng.randrange(10**8):08d}",
+                      'กำลัง (kW)': str(rng.choice([0.75, 1.5, 2.2, 5.5, 7.5, 15, 30]))}
+            frequency = rng.choice([7, 14, 30, 30, 90, 180, 365])
+            yield (f"{thai if rng.random() < 0.5 else english} {first_asset + n:06d}",
+                   f"{rng.choice(SEED_LOCATIONS)} ชั้น {rng.randint(1, 8)}",
+                   json.dumps(custom, ensure_ascii=False),
+                   (today + timedelta(days=rng.randint(-30, frequency))).isoformat(), frequency,
+                   rng.choice(technician_ids))
+
+    timed('assets', """INSERT INTO assets (name, location, custom_data, next_pm_date, pm_frequency_days, technician_id)
+                       VALUES (?, ?, ?, ?, ?, ?)""", assets())
+    asset_count = counts['assets']
+
+    def points():
+        for asset_id in range(first_asset, first_asset + asset_count):
+            for _ in range(rng.randint(0, scale['points'] * 2)):
+                frequency = rng.choice([7, 30, 90, 180])
+                last_checked = today - timedelta(days=rng.randint(0, frequency))
+                yield (asset_id, rng.choice(SEED_POINT_NAMES), frequency, last_checked.isoformat(),
+                       (last_checked + timedelta(days=frequency)).isoformat())
+
+    timed('maintenance_points', """INSERT INTO maintenance_points
+                                   (asset_id, point_name, frequency_days, last_checked_date, next_check_date, status)
+                                   VALUES (?, ?, ?, ?, ?, 'active')""", points())
+
+    def history():
+        for _ in range(scale['history']):
+            is_pm = rng.random() < 0.6
+            yield (first_asset + rng.randrange(asset_count), _seed_timestamp(rng, anchor, 3 * 365),
+                   rng.choice(SEED_PM_TEXT if is_pm else SEED_CM_TEXT),
+                   round(rng.uniform(200, 3000) if is_pm else rng.uniform(500, 50000), 2), 'PM' if is_pm else 'CM')
+
+    if asset_count:
+        timed('maintenance_history', "INSERT INTO maintenance_history (asset_id, date, description, cost, job_type) VALUES (?, ?, ?, ?, ?)",
+              history())
+
+    first_part = db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM parts").fetchone()[0]
+
+    def parts():
+        for n in range(scale['parts']):
+            thai, english, category = rng.choice(SEED_PART_TYPES)
+            yield (f"SEED{seed}-{first_part + n:06d}", f"{thai} {english} {rng.choice(['S', 'M', 'L', 'XL'])}-{n % 97}",
+                   category, rng.choice(SEED_BRANDS), round(rng.uniform(15, 5000), 2), rng.randint(0, 20),
+                   f"ชั้น {rng.choice('ABCD')}{rng.randint(1, 9)}")
+
+    timed('parts', """INSERT INTO parts (part_number, part_name, category, manufacturer, unit_price, minimum_stock, location, current_stock)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, 0)""", parts())
+    part_count = counts['parts']
+
+    # รายการเรียงตามเวลาทั้งหมด (id ของ ledger เรียงตามวันที่เหมือนข้อมูลจริง) และสต็อกไม่ติดลบ
+    balances = {}
+
+    def transactions():
+        moments = sorted(rng.randrange(3 * 365 * 86400) for _ in range(scale['transactions']))
+        start = anchor - timedelta(days=3 * 365)
+        for offset in moments:
+            part_id = first_part + min(int(rng.paretovariate(1.2)) - 1, part_count - 1)  # อะไหล่บางตัวเคลื่อนไหวบ่อยกว่ามาก
+            balance = balances.get(part_id)
+            if balance is None:
+                kind, quantity, reference = 'in', rng.randint(20, 200), 'initial'
+            elif balance > 0 and rng.random() < 0.7:
+                kind, quantity, reference = 'out', rng.randint(1, min(balance, 10)), 'maintenance'
+            else:
+                kind, quantity, reference = 'in', rng.randint(10, 100), 'purchase'
+            balance = (balance or 0) + (quantity if kind == 'in' else -quantity)
+            balances[part_id] = balance
+            yield (part_id, kind, quantity, reference, (start + timedelta(seconds=offset)).strftime('%Y-%m-%d %H:%M:%S'),
+                   balance)
+
+    if part_count:
+        timed('parts_transactions', """INSERT INTO parts_transactions
+                                        (part_id, transaction_type, quantity, reference_type, transaction_date, balance_after)
+                                        VALUES (?, ?, ?, ?, ?, ?)""", transactions())
+        db.executemany("UPDATE parts SET current_stock = ? WHERE id = ?",
+                       [(balance, part_id) for part_id, balance in balances.items()])
+        db.commit()
+    return counts
+
+@app.cli.command('seed')
+@click.option('--scale', type=click.Choice(list(SEED_SCALES)), default='small', help='Dataset size preset.')
+@click.option('--seed', 'seed_value', type=int, default=42,
+              help='Random seed; the same seed and --as-of give the same data.')
+@click.option('--as-of', 'as_of', type=click.DateTime(['%Y-%m-%d']), default=None,
+              help='Day the generated dates are relative to (YYYY-MM-DD), default today.')
+@click.option('--technicians', type=int, default=None)
+@click.option('--assets', type=int, default=None)
+@click.option('--points', type=int, default=None, help='Average maintenance points per asset.')
+@click.option('--history', type=int, default=None, help='Maintenance history rows.')
+@click.option('--parts', type=int, default=None)
+@click.option('--transactions', type=int, default=None, help='Part ledger rows.')
+@click.option('--reset', is_flag=True, help='Delete the database and apply the migrations first.')
+def seed_command(scale, seed_value, as_of, reset, **overrides):
+    """Generate a realistic, reproducible dataset (Thai and English text) with bulk inserts."""
+    as_of = as_of.date() if as_of else date.today()
+    sizes = dict(SEED_SCALES[scale], **{key: value for key, value in overrides.items() if value is not None})
+    if reset:
+        remove_database()
+    db = sqlite3.connect(DATABASE)
+    upgrade_database(db)
+    # ข้อมูลจำลองสร้างใหม่ได้เสมอ จึงไม่ต้องรอ fsync
+    db.execute("PRAGMA synchronous = OFF")
+    db.execute("PRAGMA cache_size = -200000")
+    db.execute("PRAGMA temp_store = MEMORY")
+    click.echo(f"Seeding {DATABASE} ({scale}, seed {seed_value}, as of {as_of}): "
+               + ", ".join(f"{key} {value:,}" for key, value in sizes.items()))
+    started = time.perf_counter()
+    seed_database(db, sizes, seed_value, echo=click.echo, as_of=as_of)
+    step = time.perf_counter()
+    mode, inserted = refresh_pm_schedule(db, full=True)
+    click.echo(f"  pm_occurrences: {inserted:,} rows in {time.perf_counter() - step:.1f}s")
+    step = time.perf_counter()
+    refresh_parts_forecast(db)
+    db.execute("ANALYZE")
+    db.commit()
+    click.echo(f"  parts_forecast and ANALYZE in {time.perf_counter() - step:.1f}s")
+    db.close()
+    click.echo(f"Seeded in {time.perf_counter() - started:.1f}s. Technician accounts use the password 'password'.")
+
+# route ที่วัดผล: ชื่อ -> (endpoint, ฟังก์ชันสร้าง URL จาก rng และ id ตัวอย่าง, ใช้ session ของช่าง)
+BENCH_ROUTES = {
+    'index': ('index', lambda rng, ids: '/', False),
+    'asset_detail': ('asset_detail', lambda rng, ids: f"/asset/{rng.choice(ids['assets'])}", False),
+    'parts_index': ('parts_index', lambda rng, ids: '/parts', False),
+    'part_detail': ('part_detail', lambda rng, ids: f"/parts/{rng.choice(ids['parts'])}", False),
+    'reports': ('reports', lambda rng, ids: '/reports', False),
+    'pm_events_api': ('pm_events_api', lambda rng, ids: '/api/pm_events?start={0}&end={1}'.format(
+        *[(date.today().replace(day=1) + timedelta(days=31 * rng.randint(-3, 3) + 42 * k)).replace(day=1).isoformat()
+          for k in (0, 1)]), False),
+    'my_tasks': ('my_tasks', lambda rng, ids: '/my-tasks', True),
+}
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def run_route_benchmarks(iterations, warmup=3, routes=None, seed=1):
+    """
+    เรียก route ที่ใช้บ่อยผ่าน test client แล้วคืนค่าผล (p50/p95/mean/max ms, คิวรีและแถวต่อ request)
+    จำนวนคิวรีอ่านจาก metrics ของ request เดียวกัน จึงบังคับเปิด METRICS_ENABLED ระหว่างวัด
+    """
+    app.config['METRICS_ENABLED'] = True
+    reset_pools()
+    rng = random.Random(seed)
+    db = sqlite3.connect(DATABASE)
+    ids = {
+        'assets': [row[0] for row in db.execute("SELECT id FROM assets ORDER BY random() LIMIT 200")],
+        'parts': [row[0] for row in db.execute("SELECT id FROM parts ORDER BY random() LIMIT 200")],
+    }
+    admin = db.execute("SELECT id, username FROM users ORDER BY role != 'admin', id LIMIT 1").fetchone()
+    technician = db.execute("""
+        SELECT u.id, u.username FROM users u JOIN assets a ON a.technician_id = u.id
+        GROUP BY u.id ORDER BY COUNT(*) DESC LIMIT 1
+    """).fetchone() or admin
+    sizes = {table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+             for table in ('assets', 'maintenance_history', 'maintenance_points', 'parts', 'parts_transactions')}
+    db.close()
+    if admin is None or not ids['assets'] or not ids['parts']:
+        raise click.ClickException("the database needs users, assets and parts (run flask seed first)")
+
+    results = {}
+    for name, (endpoint, make_url, as_technician) in BENCH_ROUTES.items():
+        if routes and name not in routes:
+            continue
+        client = app.test_client()
+        user = technician if as_technician else admin
+        with client.session_transaction() as sess:
+            sess['user_id'], sess['username'] = user
+            sess['role'] = 'technician' if as_technician else 'admin'
+        for _ in range(warmup):
+            client.get(make_url(rng, ids))
+        before = list(metrics.queries.get(endpoint, [0, 0]))[-2:], metrics.sql_rows[endpoint]
+        timings, errors = [], 0
+        for _ in range(iterations):
+            url = make_url(rng, ids)
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            errors += response.status_code != 200
+        (query_sum, count), rows = before
+        requests_seen = max(metrics.queries[endpoint][-1] - count, 1)
+        results[name] = {
+            'p50_ms': round(_percentile(timings, 0.5), 3),
+            'p95_ms': round(_percentile(timings, 0.95), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries_per_request': round((metrics.queries[endpoint][-2] - query_sum) / requests_seen, 2),
+            'rows_per_request': round((metrics.sql_rows[endpoint] - rows) / requests_seen, 1),
+            'errors': errors,
+        }
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'iterations': iterations,
+        'database': sizes,
+        'routes': results,
+    }
+
+def compare_benchmarks(baseline, current, tolerance):
+    """เทียบผลกับ baseline คืนค่า list ของ (route, ข้อความ, เป็น regression หรือไม่)"""
+    report = []
+    for name, result in current['routes'].items():
+        base = baseline.get('routes', {}).get(name)
+        if base is None:
+            report.append((name, 'new route (no baseline)', False))
+            continue
+        ratio = result['p95_ms'] / base['p95_ms'] if base['p95_ms'] else 1.0
+        # ต่างกันไม่ถึง 1 ms ถือเป็น noise แม้สัดส่วนจะเกิน
+        slower = ratio > 1 + tolerance and result['p95_ms'] - base['p95_ms'] > 1.0
+        more_queries = result['queries_per_request'] > base['queries_per_request'] + 0.5
+        message = (f"p95 {base['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms ({ratio - 1:+.0%}), "
+                   f"queries {base['queries_per_request']:g} -> {result['queries_per_request']:g}")
+        report.append((name, message, slower or more_queries or result['errors'] > base.get('errors', 0)))
+    return report
+
+@app.cli.command('bench')
+@click.option('--iterations', '-n', type=int, default=30, help='Requests per route.')
+@click.option('--warmup', type=int, default=3, help='Unmeasured requests per route first.')
+@click.option('--route', 'routes', multiple=True, type=click.Choice(list(BENCH_ROUTES)), help='Only these routes (repeatable).')
+@click.option('--baseline', 'baseline_path', type=click.Path(dir_okay=False), default=None,
+              help='Baseline JSON (default instance/bench_baseline.json).')
+@click.option('--save', is_flag=True, help='Write these results as the new baseline.')
+@click.option('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown before a route counts as a regression.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Also write the results to this JSON file.')
+def bench_command(iterations, warmup, routes, baseline_path, save, tolerance, output):
+    """Benchmark the hot routes through the test client and compare p50/p95 and query counts with a baseline."""
+    baseline_path = baseline_path or os.path.join(app.instance_path, 'bench_baseline.json')
+    current = run_route_benchmarks(iterations, warmup, routes)
+    click.echo(f"{'route':<15} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'queries':>8} {'rows':>9} {'errors':>6}")
+    for name, result in current['routes'].items():
+        click.echo(f"{name:<15} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['max_ms']:>9.2f} "
+                   f"{result['queries_per_request']:>8g} {result['rows_per_request']:>9g} {result['errors']:>6}")
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+    regressions = 0
+    if os.path.exists(baseline_path) and not save:
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        click.echo(f"\nCompared with {baseline_path} ({baseline['created_at']}):")
+        if baseline.get('database') != current['database']:
+            click.echo(f"  note: dataset differs from the baseline {baseline.get('database')}")
+        for name, message, regressed in compare_benchmarks(baseline, current, tolerance):
+            regressions += regressed
+            click.echo(f"  {'REGRESSION' if regressed else 'ok':<10} {name:<15} {message}")
+    else:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+        click.echo(f"\nSaved baseline to {baseline_path}")
+    if regressions:
+        raise click.ClickException(f"{regressions} route(s) regressed beyond {tolerance:.0%}")
+
+# สคริปต์ที่รันใน process ใหม่ทุกรอบของ bench-startup: เวลาแต่ละช่วงนับจากเวลาที่ process แม่สั่งรัน
+STARTUP_PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import {module} as target
+imported = time.time()
+target.init_database()
+checked = time.time()
+response = target.app.test_client().get('/login')
+served = time.time()
+print(json.dumps({{'imported': imported, 'checked': checked, 'served': served, 'status': response.status_code}}))
+"""
+
+def measure_startup(clear_cache=False):
+    """
+    เปิด Python process ใหม่ที่ import app ตรวจ schema และตอบ request แรก
+    คืนค่า dict ของเวลาแต่ละช่วง (ms) โดย first_request_ms คือเวลาตั้งแต่สั่งรันจนได้ response แรก
+    """
+    import subprocess
+    if clear_cache and app.config['JINJA_CACHE_FOLDER']:
+        for name in os.listdir(app.config['JINJA_CACHE_FOLDER']):
+            os.remove(os.path.join(app.config['JINJA_CACHE_FOLDER'], name))
+    script = STARTUP_PROBE.format(root=app.root_path, module=app.import_name)
+    started = time.time()
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    probe = json.loads(output.strip().splitlines()[-1])
+    if probe['status'] != 200:
+        raise click.ClickException(f"first request returned {probe['status']}")
+    return {
+        'import_ms': (probe['imported'] - started) * 1000,
+        'schema_check_ms': (probe['checked'] - probe['imported']) * 1000,
+        'render_ms': (probe['served'] - probe['checked']) * 1000,
+        'first_request_ms': (probe['served'] - started) * 1000,
+    }
+
+def import_time_profile(top=15):
+    """
+    import app ใน process ใหม่ด้วย python -X importtime
+    คืนค่า (เวลาของ app เอง, [(module, ms)] ของ module ที่ app import โดยตรง เรียงจากช้าที่สุด)
+    """
+    import subprocess
+    script = f"import sys; sys.path.insert(0, {app.root_path!r}); import {app.import_name}"
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                            capture_output=True, text=True, check=True).stderr
+    own_ms, modules = 0.0, []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0 and name.strip() == app.import_name:
+            own_ms = int(self_us) / 1000
+        elif depth == 1:
+            modules.append((name.strip(), int(cumulative_us) / 1000))
+    return own_ms, sorted(modules, key=lambda item: -item[1])[:top]
+
+@app.cli.command('bench-startup')
+@click.option('--runs', '-n', type=int, default=5, help='Fresh processes to start.')
+@click.option('--clear-cache', is_flag=True, help='Empty the Jinja bytecode cache before every run (first launch).')
+@click.option('--importtime', 'import_top', type=int, default=0, help='Also show the N slowest imports.')
+@click.option('--baseline', 'baseline_path', type=click.Path(dir_okay=False), default=None,
+              help='Baseline JSON (default instance/startup_baseline.json).')
+@click.option('--save', is_flag=True, help='Write these results as the new baseline.')
+@click.option('--tolerance', type=float, default=0.25, help='Allowed slowdown of the median time to first request.')
+def bench_startup_command(runs, clear_cache, import_top, baseline_path, save, tolerance):
+    """Measure cold start: process launch to the first rendered response, split into import, schema check and render."""
+    baseline_path = baseline_path or os.path.join(app.instance_path, 'startup_baseline.json')
+    samples = [measure_startup(clear_cache) for _ in range(max(runs, 1))]
+    current = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'runs': len(samples),
+        'clear_cache': clear_cache,
+        'median_ms': {key: round(_percentile([sample[key] for sample in samples], 0.5), 1) for key in samples[0]},
+    }
+    click.echo(f"{'phase':<18} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for key, median in current['median_ms'].items():
+        values = [sample[key] for sample in samples]
+        click.echo(f"{key:<18} {median:>10.1f} {min(values):>8.1f} {max(values):>8.1f}")
+    if import_top:
+        own_ms, modules = import_time_profile(import_top)
+        click.echo(f"\nImport time (cumulative, one run): {app.import_name} itself {own_ms:.1f} ms")
+        for name, ms in modules:
+            click.echo(f"  {ms:>8.1f} ms  {name}")
+    if os.path.exists(baseline_path) and not save:
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        base, now = baseline['median_ms']['first_request_ms'], current['median_ms']['first_request_ms']
+        click.echo(f"\nTime to first request: {base:.1f} -> {now:.1f} ms ({now / base - 1:+.0%}) "
+                   f"compared with {baseline_path} ({baseline['created_at']})")
+        # process ใหม่แกว่งได้หลายสิบ ms จึงไม่นับต่างกันไม่ถึง 20 ms
+        if now > base * (1 + tolerance) and now - base > 20:
+            raise click.ClickException(f"time to first request regressed beyond {tolerance:.0%}")
+    else:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+        click.echo(f"\nSaved baseline to {baseline_path}")
+
+
+@app.cli.command('bench-login')
+@click.option('--logins', '-n', type=int, default=200, help='Password checks to run (e.g. one shift change).')
+@click.option('--clients', type=int, default=32, help='Concurrent login requests.')
+@click.option('--method', 'methods', multiple=True,
+              help='Hash method to measure, e.g. pbkdf2:sha256:600000 (repeatable, default PASSWORD_HASH_METHOD).')
+def bench_login_command(logins, clients, methods):
+    """Measure password checks per second (and per core) through the bounded hash pool used by login."""
+    workers = app.config['PASSWORD_HASH_WORKERS']
+    cores = min(workers, os.cpu_count() or 1)
+    try:
+        hashes = [generate_password_hash('bench-password', method=method)
+                  for method in methods or [app.config['PASSWORD_HASH_METHOD']]]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--method')
+    click.echo(f"{logins} logins from {clients} concurrent clients, {workers} hash workers, {os.cpu_count()} CPUs")
+    click.echo(f"{'method':<24} {'single ms':>9} {'logins/s':>9} {'per core':>9} {'p50 ms':>8} {'p95 ms':>8} {'busy':>5}")
+    for stored in hashes:
+        started = time.perf_counter()
+        check_password_hash(stored, 'bench-password')
+        single_ms = (time.perf_counter() - started) * 1000
+        pending = iter(range(logins))
+        latencies, busy = [], 0
+        lock = threading.Lock()
+
+        def client():
+            nonlocal busy
+            while True:
+                with lock:
+                    if next(pending, None) is None:
+                        return
+                began = time.perf_counter()
+                try:
+                    run_password_task(check_password_hash, stored, 'bench-password')
+                except queue.Full:
+                    with lock:
+                        busy += 1
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - began) * 1000)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(max(clients, 1))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rate = len(latencies) / (time.perf_counter() - started)
+        latencies = latencies or [0.0]
+        click.echo(f"{stored.split('$', 1)[0]:<24} {single_ms:>9.1f} {rate:>9.1f} {rate / cores:>9.1f} "
+                   f"{_percentile(latencies, 0.5):>8.0f} {_percentile(latencies, 0.95):>8.0f} {busy:>5}")
+
+# --- Bulk Import ---
+def _import_text(value, field, required=False):
+    value = (value or '').strip()
+    if required and not value:
+        raise ValueError(f"{field} is required")
+    return value or None
+
+def _import_int(value, field, minimum=0):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        number = int(float(value))
+    except (ValueError, OverflowError):  # OverflowError: ค่าเช่น '1e400' กลายเป็น inf
+        raise ValueError(f"{field} must be a number, got {value!r}")
+    if number < minimum:
+        raise ValueError(f"{field} must be >= {minimum}")
+    if number >= 2 ** 63:
+        raise ValueError(f"{field} is too large")
+    return number
+
+def _import_float(value, field, minimum=0):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{field} must be a number, got {value!r}")
+    if number in (float('inf'), float('-inf')) or number != number:
+        raise ValueError(f"{field} must be a finite number, got {value!r}")
+    if number < minimum:
+        raise ValueError(f"{field} must be >= {minimum}")
+    return number
+
+def _import_date(value, field):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"{field} must be YYYY-MM-DD, got {value!r}")
+
+def _header_columns(row, record, sources=None):
+    """
+    คงไว้เฉพาะคอลัมน์ที่ไฟล์ CSV มีหัวคอลัมน์ เพื่อให้ upsert ไม่เขียนทับค่าเดิมด้วย None/0 จากคอลัมน์ที่ไม่ได้ส่งมา
+    sources: คอลัมน์ของตาราง -> หัวคอลัมน์ CSV ที่ใช้สร้างค่านั้น (ค่าเริ่มต้นคือชื่อเดียวกัน)
+    """
+    sources = sources or {}
+    return {column: value for column, value in record.items()
+            if any(header in row for header in sources.get(column, (column,)))}
+
+ASSET_IMPORT_FIELDS = {'name', 'location', 'next_pm_date', 'pm_frequency_days', 'technician', 'custom_data'}
 
-def get_parts_low_stock():
-    """ดึงอะไหล่ที่มีสต็อกต่ำ"""
-    db = get_db()
-    return db.execute("""
-        SELECT * FROM parts 
-        WHERE current_stock <= minimum_stock 
-        ORDER BY (current_stock - minimum_stock) ASC
-    """).fetchall()
+def _validate_asset_row(row, lookups):
+    """แปลงแถว CSV เป็นข้อมูลสินทรัพย์ คอลัมน์ที่ไม่รู้จักจะถูกเก็บเป็น custom_data"""
+    technician = _import_text(row.get('technician'), 'technician')
+    if technician and technician not in lookups['technicians']:
+        raise ValueError(f"unknown technician {technician!r}")
+    custom_data = {}
+    if row.get('custom_data'):
+        try:
+            parsed = json.loads(row['custom_data'])
+        except ValueError:
+            parsed = None
+        if not isinstance(parsed, dict):
+            raise ValueError("custom_data must be a JSON object")
+        custom_data.update(parsed)
+    extra_fields = [k for k in row if k and k not in ASSET_IMPORT_FIELDS]
+    custom_data.update({k: row[k].strip() for k in extra_fields if row[k] and row[k].strip()})
+    return _header_columns(row, {
+        'name': _import_text(row.get('name'), 'name', required=True),
+        'location': _import_text(row.get('location'), 'location', required=True),
+        'next_pm_date': _import_date(row.get('next_pm_date'), 'next_pm_date'),
+        'pm_frequency_days': _import_int(row.get('pm_frequency_days'), 'pm_frequency_days', minimum=1),
+        'technician_id': lookups['technicians'].get(technician),
+        'custom_data': json.dumps(custom_data, ensure_ascii=False),
+    }, {'technician_id': ('technician',), 'custom_data': ('custom_data', *extra_fields)})
 
-def get_part_by_id(part_id):
-    """ดึงข้อมูลอะไหล่ตาม ID"""
-    db = get_db()
-    return db.execute("SELECT * FROM parts WHERE id = ?", (part_id,)).fetchone()
+def _validate_part_row(row, lookups):
+    """แปลงแถว CSV เป็นข้อมูลอะไหล่"""
+    return _header_columns(row, {
+        'part_number': _import_text(row.get('part_number'), 'part_number', required=True),
+        'part_name': _import_text(row.get('part_name'), 'part_name', required=True),
+        'description': _import_text(row.get('description'), 'description'),
+        'category': _import_text(row.get('category'), 'category'),
+        'manufacturer': _import_text(row.get('manufacturer'), 'manufacturer'),
+        'unit_price': _import_float(row.get('unit_price'), 'unit_price') or 0,
+        'minimum_stock': _import_int(row.get('minimum_stock'), 'minimum_stock') or 0,
+        'current_stock': _import_int(row.get('current_stock'), 'current_stock') or 0,
+        'location': _import_text(row.get('location'), 'location'),
+        'supplier': _import_text(row.get('supplier'), 'supplier'),
+        'supplier_contact': _import_text(row.get('supplier_contact'), 'supplier_contact'),
+        'notes': _import_text(row.get('notes'), 'notes'),
+    })
 
-def get_part_transactions(part_id):
-    """ดึงประวัติการเคลื่อนไหวของอะไหล่"""
-    db = get_db()
-    return db.execute("""
-        SELECT pt.*, u.username as created_by_name 
-        FROM parts_transactions pt 
-        LEFT JOIN users u ON pt.created_by = u.id 
-        WHERE pt.part_id = ? 
-        ORDER BY pt.transaction_date DESC
-    """, (part_id,)).fetchall()
+def _validate_point_row(row, lookups):
+    """แปลงแถว CSV เป็นจุดบำรุงรักษา อ้างอิงสินทรัพย์ด้วย asset_id หรือ asset_name + asset_location"""
+    asset_id = _import_int(row.get('asset_id'), 'asset_id', minimum=1)
+    if asset_id is None:
+        key = (_import_text(row.get('asset_name'), 'asset_name', required=True),
+               _import_text(row.get('asset_location'), 'asset_location', required=True))
+        asset_id = lookups['assets'].get(key)
+        if asset_id is None:
+            raise ValueError(f"unknown asset {key[0]!r} at {key[1]!r}")
+    elif asset_id not in lookups['asset_ids']:
+        raise ValueError(f"unknown asset_id {asset_id}")
+    status = _import_text(row.get('status'), 'status') or 'active'
+    if status not in ('active', 'inactive', 'completed'):
+        raise ValueError(f"status must be active, inactive or completed, got {status!r}")
+    return _header_columns(row, {
+        'asset_id': asset_id,
+        'point_name': _import_text(row.get('point_name'), 'point_name', required=True),
+        'description': _import_text(row.get('description'), 'description'),
+        'maintenance_procedure': _import_text(row.get('maintenance_procedure'), 'maintenance_procedure'),
+        'frequency_days': _import_int(row.get('frequency_days'), 'frequency_days', minimum=1),
+        'status': status,
+    }, {'asset_id': ('asset_id', 'asset_name')})
 
-def add_part_transaction(part_id, transaction_type, quantity, reference_type=None, reference_id=None, unit_cost=None, notes=''):
-    """เพิ่มการเคลื่อนไหวของอะไหล่และอัปเดตสต็อก"""
-    db = get_db()
-    
-    # เพิ่มรายการเคลื่อนไหว
-    db.execute("""
-        INSERT INTO parts_transactions 
-        (part_id, transaction_type, quantity, reference_type, reference_id, unit_cost, notes, created_by) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (part_id, transaction_type, quantity, reference_type, reference_id, unit_cost, notes, session.get('user_id')))
-    
-    # อัปเดตสต็อกปัจจุบัน
-    if transaction_type == 'in':
-        db.execute("UPDATE parts SET current_stock = current_stock + ? WHERE id = ?", (quantity, part_id))
-    elif transaction_type == 'out':
-        db.execute("UPDATE parts SET current_stock = current_stock - ? WHERE id = ?", (quantity, part_id))
-    elif transaction_type == 'adjustment':
-        db.execute("UPDATE parts SET current_stock = ? WHERE id = ?", (quantity, part_id))
-    
-    # อัปเดตเวลาแก้ไข
-    db.execute("UPDATE parts SET updated_at = CURRENT_TIMESTAMP WHERE id = ?", (part_id,))
-    db.commit()
+def _asset_lookups(db):
+    assets = {(row['name'], row['location']): row['id'] for row in db.execute("SELECT id, name, location FROM assets")}
+    return {'assets': assets, 'asset_ids': set(assets.values())}
 
-def get_parts_for_maintenance(maintenance_id):
-    """ดึงอะไหล่ที่ใช้ในงานซ่อมบำรุง"""
-    db = get_db()
-    return db.execute("""
-        SELECT mpu.*, p.part_number, p.part_name 
-        FROM maintenance_parts_used mpu 
-        JOIN parts p ON mpu.part_id = p.id 
-        WHERE mpu.maintenance_history_id = ?
-    """, (maintenance_id,)).fetchall()
-# ^^^ --- จบส่วนของฟังก์ชันผู้ช่วย --- ^^^
+# table, คีย์สำหรับ upsert, คอลัมน์ที่ไม่อัปเดตเมื่อแถวมีอยู่แล้ว, ฟังก์ชันตรวจสอบแถว, ข้อมูลอ้างอิงที่โหลดครั้งเดียว
+IMPORT_SPECS = {
+    'assets': {
+        'table': 'assets',
+        'key': ('name', 'location'),
+        'insert_only': (),
+        'validate': _validate_asset_row,
+        'lookups': lambda db: {'technicians': {row['username']: row['id'] for row in db.execute("SELECT id, username FROM users")}},
+    },
+    'parts': {
+        'table': 'parts',
+        'key': ('part_number',),
+        # สต็อกของอะไหล่ที่มีอยู่แล้วต้องเปลี่ยนผ่านรายการเคลื่อนไหวเท่านั้น
+        'insert_only': ('current_stock',),
+        'validate': _validate_part_row,
+        'lookups': lambda db: {},
+    },
+    'points': {
+        'table': 'maintenance_points',
+        'key': ('asset_id', 'point_name'),
+        'insert_only': (),
+        'validate': _validate_point_row,
+        'lookups': _asset_lookups,
+    },
+}
 
+def bulk_import(db, kind, rows, batch_size=1000, dry_run=False):
+    """
+    นำเข้าแถว (line_no, dict) แบบ upsert ใน writer transaction เดียว เขียนด้วย executemany ทีละ batch_size แถว
+    คืนค่า dict ของจำนวนแถวที่ insert/update และ list ของ (line_no, error)
+    """
+    spec = IMPORT_SPECS[kind]
+    table, key_fields = spec['table'], spec['key']
+    result = {'read': 0, 'inserted': 0, 'updated': 0, 'errors': []}
 
-# --- Database Connection ---
-def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
-    return g.db
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        # ปิด trigger ของดัชนีค้นหาชั่วคราว แล้วเติมดัชนีครั้งเดียวตอนท้าย (ทั้งหมดอยู่ใน transaction เดียวกัน)
+        search_source = SEARCH_INDEX_SOURCES.get(kind)
+        fts_triggers = []
+        if search_source:
+            fts_triggers = db.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND name LIKE ?",
+                (table, search_source[0] + '_a%')).fetchall()
+            for trigger in fts_triggers:
+                db.execute(f"DROP TRIGGER {trigger['name']}")
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS import_touched (id INTEGER PRIMARY KEY)")
+            db.execute("DELETE FROM temp.import_touched")
 
-def init_database():
-    """Checks if the database exists, and if not, creates it and the tables."""
-    
-    # --- สร้าง Path ไปยังโฟลเดอร์ instance ---
-    # ส่วนนี้จะซับซ้อนขึ้นเพื่อรองรับการทำงานใน .exe
-    if getattr(sys, 'frozen', False):
-        # ถ้ากำลังรันใน .exe ให้ใช้ path ของ .exe
-        application_path = os.path.dirname(sys.executable)
+        lookups = spec['lookups'](db)
+        existing = {tuple(row[1:]): row[0] for row in db.execute(
+            f"SELECT id, {', '.join(key_fields)} FROM {table}")}
+        max_id = db.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        first_new_id = max_id + 1
+        columns = None
+        inserts, updates = {}, []
+
+        def flush():
+            nonlocal max_id
+            if inserts:
+                db.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    [tuple(record[c] for c in columns) for record in inserts.values()])
+                result['inserted'] += len(inserts)
+                # เก็บ id ของแถวที่เพิ่งเพิ่ม เพื่อให้แถวซ้ำที่ตามมาใน batch ถัดไปกลายเป็น update
+                for row in db.execute(f"SELECT id, {', '.join(key_fields)} FROM {table} WHERE id > ?", (max_id,)):
+                    existing[tuple(row[1:])] = row[0]
+                    max_id = max(max_id, row[0])
+                inserts.clear()
+            if updates:
+                update_columns = [c for c in columns if c not in spec['insert_only']]
+                db.executemany(
+                    f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in update_columns)} WHERE id = ?",
+                    [tuple(record[c] for c in update_columns) + (row_id,) for row_id, record in updates])
+                result['updated'] += len(updates)
+                if search_source:
+                    db.executemany("INSERT OR IGNORE INTO temp.import_touched (id) VALUES (?)",
+                                   [(row_id,) for row_id, _ in updates])
+                updates.clear()
+
+        for line_no, row in rows:
+            result['read'] += 1
+            try:
+                record = spec['validate'](row, lookups)
+            except ValueError as e:
+                result['errors'].append((line_no, str(e)))
+                continue
+            columns = columns or list(record)
+            key = tuple(record[k] for k in key_fields)
+            if key in existing:
+                updates.append((existing[key], record))
+            else:
+                inserts[key] = record  # แถวซ้ำในไฟล์เดียวกันให้แถวหลังชนะ
+            if len(inserts) + len(updates) >= batch_size:
+                flush()
+        flush()
+
+        if search_source:
+            fts_table, fill_sql = search_source
+            db.execute("INSERT OR IGNORE INTO temp.import_touched (id) SELECT id FROM " + table + " WHERE id >= ?",
+                       (first_new_id,))
+            db.execute(f"DELETE FROM {fts_table} WHERE rowid IN (SELECT id FROM temp.import_touched)")
+            db.execute(fill_sql + " WHERE id IN (SELECT id FROM temp.import_touched)")
+            for trigger in fts_triggers:
+                db.execute(trigger['sql'])
+
+        if kind == 'parts':
+            # สร้างรายการรับเข้าสต็อกเริ่มต้นของอะไหล่ใหม่ เหมือนกับ add_part()
+            db.execute("""
+                INSERT INTO parts_transactions (part_id, transaction_type, quantity, reference_type, unit_cost, notes, balance_after)
+                SELECT id, 'in', current_stock, 'initial', unit_price, 'สต็อกเริ่มต้น (นำเข้า)', current_stock
+                FROM parts WHERE id >= ? AND current_stock > 0
+            """, (first_new_id,))
+    except Exception:
+        db.rollback()
+        raise
+    if dry_run:
+        db.rollback()
     else:
-        # ถ้ารันเป็นสคริปต์ปกติ ให้ใช้ path ของไฟล์ .py
-        application_path = os.path.dirname(os.path.abspath(__file__))
-        
-    instance_path = os.path.join(application_path, 'instance')
-    db_path = os.path.join(instance_path, 'maintenance.db')
+        db.commit()
+    return result
 
-    # --- ตรวจสอบและสร้างฐานข้อมูล ---
-    if not os.path.exists(db_path):
-        print("Database not found. Creating a new one...")
-        try:
-            os.makedirs(instance_path, exist_ok=True)
-            
-            # --- สร้าง Path ไปยัง schema.sql ที่ถูกต้อง ---
-            # ใช้หลักการเดียวกับข้างบนเพื่อหา schema.sql
-            schema_path = os.path.join(application_path, 'schema.sql')
+def read_import_csv(path):
+    """อ่านไฟล์ CSV ทีละแถว (รองรับ BOM จาก Excel) คืนค่า (เลขบรรทัด, dict)"""
+    import csv
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
 
-            db = sqlite3.connect(db_path)
-            with open(schema_path, mode='r', encoding='utf-8') as f:
-                db.cursor().executescript(f.read())
-            db.commit()
-            db.close()
-            print(f"Database created successfully at {db_path}")
-        except Exception as e:
-            print(f"An error occurred while creating the database: {e}")
+import_cli = AppGroup('import', help='Bulk import assets, parts or maintenance points from CSV.')
 
-@app.teardown_appcontext
-def close_connection(exception):
-    db = g.pop('db', None)
-    if db is not None:
-        db.close()
+def _import_command(kind):
+    @import_cli.command(kind, help=f"Import {kind} from a CSV file (upsert).")
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows per executemany batch.')
+    @click.option('--dry-run', is_flag=True, help='Validate and roll back without saving.')
+    @click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), help='Write row-level errors to this CSV file.')
+    def command(path, batch_size, dry_run, errors_path):
+        started = time.perf_counter()
+        result = bulk_import(get_db(write=True), kind, read_import_csv(path), batch_size=batch_size, dry_run=dry_run)
+        elapsed = time.perf_counter() - started
+        if kind in ('assets', 'points') and not dry_run:
+            invalidate_count_cache()
 
-# --- CLI Commands (No Changes) ---
-@app.cli.command('init-db')
-def init_db_command():
-    db = sqlite3.connect(DATABASE)
-    with app.open_resource('schema.sql', mode='r', encoding='utf-8') as f:
-        db.cursor().executescript(f.read())
-    
-    # Add sample parts data if parts table is empty
-    cursor = db.cursor()
-    cursor.execute("SELECT COUNT(*) FROM parts")
-    if cursor.fetchone()[0] == 0:
-        sample_parts = [
-            ('FILTER001', 'กรองอากาศ', 'กรองอากาศสำหรับเครื่องปรับอากาศ', 'ระบบปรับอากาศ', 'ABC Filter Co.', 150.00, 5, 20, 'ชั้น A1', 'บริษัท ฟิลเตอร์ จำกัด', '02-123-4567', 'เปลี่ยนทุก 3 เดือน'),
-            ('BELT002', 'สายพาน V-Belt', 'สายพานสำหรับเครื่องจักร', 'เครื่องจักร', 'Gates Corporation', 350.00, 3, 15, 'ชั้น B2', 'บริษัท เกตส์ ไทย', '02-234-5678', 'ตรวจสอบความตึงเป็นประจำ'),
-            ('OIL003', 'น้ำมันหล่อลื่น', 'น้ำมันหล่อลื่นเกรดอุตสาหกรรม', 'น้ำมันหล่อลื่น', 'Shell', 450.00, 10, 25, 'คลัง C', 'บริษัท เชลล์', '02-345-6789', 'เก็บในที่แห้ง'),
-            ('BEARING004', 'ลูกปืน', 'ลูกปืนขนาด 6203', 'เครื่องจักร', 'SKF', 280.00, 8, 12, 'ชั้น A3', 'บริษัท เอสเคเอฟ', '02-456-7890', 'ใช้จาระบีคุณภาพดี'),
-            ('SCREW005', 'สกรูสแตนเลส', 'สกรูสแตนเลส M6x20', 'ฮาร์ดแวร์', 'Local Supplier', 15.00, 50, 200, 'ชั้น D1', 'ร้านเหล็ก ABC', '02-567-8901', 'สต็อกจำนวนมาก'),
-        ]
-        
-        for part_data in sample_parts:
-            cursor.execute("""
-                INSERT INTO parts 
-                (part_number, part_name, description, category, manufacturer, unit_price, 
-                 minimum_stock, current_stock, location, supplier, supplier_contact, notes, created_by) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
-            """, part_data)
-        
-        print('Sample parts data added successfully!')
-    
-    db.commit()
-    db.close()
-    print('Initialized the database.')
+        click.echo(f"{'[dry-run] ' if dry_run else ''}{kind}: read {result['read']}, "
+                   f"inserted {result['inserted']}, updated {result['updated']}, "
+                   f"errors {len(result['errors'])} in {elapsed:.2f}s "
+                   f"({result['read'] / elapsed if elapsed else 0:,.0f} rows/s)")
+        for line_no, error in result['errors'][:20]:
+            click.echo(f"  line {line_no}: {error}")
+        if len(result['errors']) > 20:
+            click.echo(f"  ... {len(result['errors']) - 20} more")
+        if errors_path and result['errors']:
+            import csv
+            with open(errors_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['line', 'error'])
+                writer.writerows(result['errors'])
+            click.echo(f"Error report written to {errors_path}")
+    return command
 
+for _kind in IMPORT_SPECS:
+    _import_command(_kind)
 
-@app.cli.command('create-admin')
-@click.argument('username')
-@click.argument('password')
-def create_admin_command(username, password):
-    db = sqlite3.connect(DATABASE)
+app.cli.add_command(import_cli)
+
+# --- Password Hashing ---
+_password_pool = None
+_password_slots = None
+_password_pool_lock = threading.Lock()
+
+def reset_password_pool():
+    """ทิ้ง thread pool ของการ hash รหัสผ่าน (thread ไม่ติดไปกับ process ที่ fork)"""
+    global _password_pool, _password_slots
+    _password_pool = _password_slots = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_password_pool)
+
+def run_password_task(fn, *args):
+    """
+    รัน fn (hash หรือตรวจรหัสผ่าน) ใน thread pool ขนาด PASSWORD_HASH_WORKERS แล้วรอผล
+    hashlib ปล่อย GIL ระหว่างคำนวณ จึงใช้ได้หลาย core และจำนวนที่คำนวณพร้อมกันไม่เกินขนาด pool
+    ถ้ามีงานค้างเกิน PASSWORD_HASH_QUEUE จะ raise queue.Full ทันทีแทนการรอ
+    """
+    global _password_pool, _password_slots
+    if _password_pool is None:
+        with _password_pool_lock:
+            if _password_pool is None:
+                import concurrent.futures
+                _password_slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE'])
+                _password_pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=app.config['PASSWORD_HASH_WORKERS'], thread_name_prefix='password-hash')
+    slots = _password_slots
+    if not slots.acquire(blocking=False):
+        raise queue.Full("too many password hashes in progress")
     try:
-        db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, 'admin')", (username, generate_password_hash(password)))
-        db.commit()
-        print(f"Admin user '{username}' created successfully.")
-    except db.IntegrityError:
-        print(f"Error: User '{username}' already exists.")
-    finally:
-        db.close()
+        future = _password_pool.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+def hash_password(password):
+    """hash รหัสผ่านด้วยวิธีและค่า cost ของ PASSWORD_HASH_METHOD"""
+    return generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
+
+@functools.lru_cache(maxsize=None)
+def _password_hash_prefix(method):
+    """ส่วนหน้า '$' ที่ Werkzeug เก็บสำหรับวิธีนี้ พร้อมค่าเริ่มต้นที่เติมให้ เช่น 'pbkdf2' -> 'pbkdf2:sha256:1000000'"""
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+def password_needs_rehash(password_hash):
+    """True ถ้า hash นี้ไม่ได้ใช้วิธี/ค่า cost ตาม PASSWORD_HASH_METHOD ปัจจุบัน"""
+    return password_hash.split('$', 1)[0] != _password_hash_prefix(app.config['PASSWORD_HASH_METHOD'])
 
 # --- Decorators and Helpers (No Changes) ---
 def login_required(view):
@@ -300,8 +3401,25 @@ def get_all_technicians():
 @app.route('/uploads/<filename>')
 @login_required
 def uploaded_file(filename):
-    """Provides access to uploaded files."""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Provides access to uploaded files. Content-addressed files never change, so they are cached as immutable."""
+    filename = secure_filename(filename)
+    if BLOB_NAME_RE.match(filename):
+        return send_upload(upload_path(filename), etag=filename.split('.')[0], max_age=31536000, immutable=True)
+    return send_upload(upload_path(filename))
+
+@app.route('/uploads/<size>/<filename>')
+@login_required
+def uploaded_rendition(size, filename):
+    """Serves a resized rendition, falling back to the original until it has been generated."""
+    if size not in IMAGE_RENDITIONS:
+        return "Unknown image size", 404
+    filename = secure_filename(filename)
+    path = rendition_path(app.config['RENDITION_FOLDER'], size, filename)
+    if not os.path.isfile(path):
+        # ยังไม่มีไฟล์ย่อขนาด: ส่งต้นฉบับแต่ห้าม cache เพื่อให้ครั้งหน้าได้ไฟล์ย่อขนาด
+        schedule_renditions(filename)
+        return send_upload(upload_path(filename))
+    return send_upload(path, max_age=app.config['RENDITION_CACHE_MAX_AGE'])
 
 # --- Parts Management Routes ---
 @app.route('/parts')
@@ -312,24 +3430,33 @@ def parts_index():
     category_filter = request.args.get('category', '')
     
     db = get_db()
-    base_sql = """
-        SELECT p.*, u.username as created_by_name 
+    base_sql = f"""
+        SELECT p.*, u.username as created_by_name, {PARTS_FORECAST_COLUMNS}
         FROM parts p 
         LEFT JOIN users u ON p.created_by = u.id 
-        WHERE 1=1
+        LEFT JOIN parts_forecast f ON f.part_id = p.id
     """
     params = []
+    order_sql = " ORDER BY p.part_name ASC"
     
-    if search_query:
+    # ค้นหาผ่านดัชนี parts_fts และเรียงตามความเกี่ยวข้อง
+    match = fts_match_expression(search_query) if search_query else None
+    if match:
+        base_sql += " JOIN (SELECT rowid, rank FROM parts_fts WHERE parts_fts MATCH ?) s ON s.rowid = p.id WHERE 1=1"
+        params.append(match)
+        order_sql = " ORDER BY s.rank ASC, p.part_name ASC"
+    elif search_query:
         search_term = f"%{search_query}%"
-        base_sql += " AND (p.part_number LIKE ? OR p.part_name LIKE ? OR p.description LIKE ?)"
+        base_sql += " JOIN parts_fts s ON s.rowid = p.id WHERE (s.part_number LIKE ? OR s.part_name LIKE ? OR s.description LIKE ?)"
         params.extend([search_term, search_term, search_term])
+    else:
+        base_sql += " WHERE 1=1"
     
     if category_filter:
         base_sql += " AND p.category = ?"
         params.append(category_filter)
     
-    base_sql += " ORDER BY p.part_name ASC"
+    base_sql += order_sql
     
     parts = db.execute(base_sql, params).fetchall()
     low_stock_parts = get_parts_low_stock()
@@ -372,12 +3499,12 @@ def add_part():
                  supplier_contact, notes, created_by) 
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (part_number, part_name, description, category, manufacturer,
-                  unit_price, minimum_stock, current_stock, location, supplier,
+                  unit_price, minimum_stock, 0, location, supplier,
                   supplier_contact, notes, session['user_id']))
             
             part_id = cursor.lastrowid
             
-            # เพิ่มรายการเริ่มต้นหากมีสต็อกเริ่มต้น
+            # รับสต็อกเริ่มต้นเข้าผ่าน ledger (อะไหล่ถูกสร้างด้วยสต็อก 0)
             if current_stock > 0:
                 add_part_transaction(part_id, 'in', current_stock, 'initial', None, unit_price, 'สต็อกเริ่มต้น')
             
@@ -399,8 +3526,12 @@ def part_detail(part_id):
         flash('ไม่พบอะไหล่ที่ต้องการ', 'error')
         return redirect(url_for('parts_index'))
     
-    transactions = get_part_transactions(part_id)
-    return render_template('parts/detail.html', part=part, transactions=transactions)
+    transactions_page = get_part_transactions(part_id, request.args.get('after'), request.args.get('before'),
+                                              get_per_page())
+    as_of = parse_calendar_date(request.args.get('as_of'), None)
+    stock_as_of = get_stock_as_of(get_db(), part_id, as_of) if as_of else None
+    return render_template('parts/detail.html', part=part, transactions=transactions_page['items'],
+                           transactions_page=transactions_page, as_of=as_of, stock_as_of=stock_as_of)
 
 @app.route('/parts/<int:part_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -460,16 +3591,76 @@ def adjust_stock(part_id):
     unit_cost = float(request.form.get('unit_cost', 0)) if request.form.get('unit_cost') else None
     notes = request.form.get('notes', '')
     
-    if transaction_type == 'adjustment':
-        # สำหรับการปรับปรุงสต็อก quantity คือจำนวนใหม่
-        add_part_transaction(part_id, transaction_type, quantity, 'manual', None, unit_cost, notes)
-    else:
-        # สำหรับการเข้า/ออก quantity คือจำนวนที่เปลี่ยนแปลง
+    # สำหรับ adjustment quantity คือจำนวนใหม่ ส่วนการเข้า/ออก quantity คือจำนวนที่เปลี่ยนแปลง
+    try:
         add_part_transaction(part_id, transaction_type, quantity, 'manual', None, unit_cost, notes)
+    except StockError as e:
+        flash(f'ไม่สามารถอัปเดตสต็อกได้: {e.errors[0][1]}', 'error')
+        return redirect(url_for('part_detail', part_id=part_id))
     
     flash('อัปเดตสต็อกเรียบร้อยแล้ว', 'success')
     return redirect(url_for('part_detail', part_id=part_id))
 
+@app.route('/parts/stock/batch', methods=['POST'])
+@login_required
+@admin_required
+def post_stock_batch():
+    """
+    Post a whole goods receipt or picking list in one transaction. JSON body:
+    {"reference_type": "purchase", "reference_id": 12, "lines": [{"part_id": 1 | "part_number": "X", "type": "in", "quantity": 5}]}
+    Returns the new balances, or 409 with per-line errors if any line would break the ledger (nothing is posted).
+    """
+    payload = request.get_json(silent=True)
+    lines = payload.get('lines') if isinstance(payload, dict) else None
+    if not isinstance(lines, list) or not lines or not all(isinstance(line, dict) for line in lines):
+        return jsonify({'error': 'lines must be a non-empty list of objects'}), 400
+    reference_type, reference_id = payload.get('reference_type', 'batch'), payload.get('reference_id')
+    if not isinstance(reference_type, str) or not (reference_id is None or _is_sql_int(reference_id)) \
+            or not isinstance(payload.get('notes', ''), str):
+        return jsonify({'error': 'reference_type and notes must be strings and reference_id an integer'}), 400
+
+    db = get_db()
+    part_numbers = [line['part_number'] for line in lines
+                    if 'part_id' not in line and isinstance(line.get('part_number'), str) and line['part_number']]
+    part_ids = {}
+    for start in range(0, len(part_numbers), 500):
+        chunk = part_numbers[start:start + 500]
+        placeholders = ', '.join('?' for _ in chunk)
+        part_ids.update(tuple(row) for row in db.execute(
+            f"SELECT part_number, id FROM parts WHERE part_number IN ({placeholders})", chunk))
+
+    movements, errors = [], []
+    for index, line in enumerate(lines):
+        if 'part_id' in line:
+            part_id = line['part_id']
+            if not _is_sql_int(part_id):
+                errors.append({'line': index + 1, 'error': f"part_id must be an integer, got {part_id!r}"})
+                continue
+        else:
+            part_number = line.get('part_number')
+            if not isinstance(part_number, str):
+                errors.append({'line': index + 1, 'error': f"part_number must be a string, got {part_number!r}"})
+                continue
+            part_id = part_ids.get(part_number)
+            if part_id is None:
+                errors.append({'line': index + 1, 'error': f"unknown part {part_number!r}"})
+                continue
+        unit_cost, notes = line.get('unit_cost'), line.get('notes')
+        if not (unit_cost is None or (isinstance(unit_cost, (int, float)) and not isinstance(unit_cost, bool))) \
+                or not (notes is None or isinstance(notes, str)):
+            errors.append({'line': index + 1, 'error': "unit_cost must be a number and notes a string"})
+            continue
+        movements.append({'part_id': part_id, 'type': line.get('type'), 'quantity': line.get('quantity'),
+                          'unit_cost': unit_cost, 'notes': notes or payload.get('notes', ''),
+                          'line': index + 1})
+    if errors:
+        return jsonify({'errors': errors}), 409
+    try:
+        balances = apply_stock_movements(db, movements, reference_type, reference_id, session.get('user_id'))
+    except StockError as e:
+        return jsonify({'errors': [{'line': movements[index]['line'], 'error': message} for index, message in e.errors]}), 409
+    return jsonify({'posted': len(movements), 'balances': balances})
+
 @app.route('/parts/<int:part_id>/delete', methods=['POST'])
 @login_required
 @admin_required
@@ -490,6 +3681,8 @@ def delete_part(part_id):
     
     # ลบข้อมูลการเคลื่อนไหวและอะไหล่
     db.execute("DELETE FROM parts_transactions WHERE part_id = ?", (part_id,))
+    db.execute("DELETE FROM parts_stock_snapshots WHERE part_id = ?", (part_id,))
+    db.execute("DELETE FROM parts_forecast WHERE part_id = ?", (part_id,))
     db.execute("DELETE FROM parts WHERE id = ?", (part_id,))
     db.commit()
     
@@ -508,7 +3701,7 @@ def register():
         elif db.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone() is not None:
             error = f"User {username} is already registered."
         if error is None:
-            db.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, generate_password_hash(password)))
+            db.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hash_password(password)))
             db.commit()
             flash('ลงทะเบียนสำเร็จ! กรุณาเข้าสู่ระบบ', 'success')
             return redirect(url_for('login'))
@@ -519,11 +3712,25 @@ def register():
 def login():
     if request.method == 'POST':
         username, password = request.form['username'], request.form['password']
-        db = get_db()
-        user = db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        if user is None or not check_password_hash(user['password_hash'], password):
+        # อ่านผู้ใช้จาก reader และใช้ writer เฉพาะตอนอัปเกรด hash เพื่อให้การล็อกอินพร้อมกันติดแค่ hash pool
+        user = get_db(write=False).execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        try:
+            valid = user is not None and run_password_task(check_password_hash, user['password_hash'], password)
+        except queue.Full:
+            flash('มีผู้ใช้กำลังเข้าสู่ระบบพร้อมกันจำนวนมาก กรุณาลองใหม่อีกครั้งในอีกสักครู่', 'error')
+            return render_template('login.html'), 503
+        if not valid:
             flash('ชื่อผู้ใช้หรือรหัสผ่านไม่ถูกต้อง', 'error')
         else:
+            if password_needs_rehash(user['password_hash']):
+                # อัปเกรด hash เป็นวิธี/ค่า cost ปัจจุบัน ทำได้เฉพาะตอนนี้ที่มีรหัสผ่านจริง (ถ้าระบบไม่ว่างจะทำในครั้งถัดไป)
+                try:
+                    new_hash = run_password_task(hash_password, password)
+                    db = get_db(write=True)
+                    db.execute("UPDATE users SET password_hash = ? WHERE id = ?", (new_hash, user['id']))
+                    db.commit()
+                except (queue.Full, PoolExhaustedError):
+                    pass
             session.clear()
             session['user_id'] = user['id']
             session['username'] = user['username']
@@ -541,19 +3748,29 @@ def logout():
 @app.route('/')
 @login_required
 def index():
-    db = get_db()
     search_query = request.args.get('q', '')
-    base_sql = "SELECT * FROM assets"
-    params = []
+    per_page = get_per_page()
+
     if search_query:
-        search_term = f"%{search_query}%"
-        base_sql += " WHERE name LIKE ? OR location LIKE ? OR custom_data LIKE ?"
-        params.extend([search_term, search_term, search_term])
-    base_sql += " ORDER BY id DESC"
-    assets = db.execute(base_sql, params).fetchall()
-    pm_due_assets = db.execute('SELECT * FROM assets WHERE next_pm_date IS NOT NULL AND next_pm_date != "" AND date(next_pm_date) <= date("now", "+7 days") ORDER BY next_pm_date ASC').fetchall()
+        assets_page, asset_total = search_assets(
+            search_query, after=request.args.get('after'), before=request.args.get('before'), per_page=per_page)
+    else:
+        assets_page = keyset_paginate(
+            "SELECT * FROM assets WHERE 1=1", [], [('id', 'DESC')],
+            after=request.args.get('after'), before=request.args.get('before'), per_page=per_page)
+        asset_total = cached_count("SELECT COUNT(*) FROM assets")
+
+    pm_due_where = " WHERE pm_due_date <= date('now', '+7 days')"
+    pm_due_page = keyset_paginate(
+        "SELECT * FROM assets" + pm_due_where, [], [('pm_due_date', 'ASC'), ('id', 'ASC')],
+        after=request.args.get('pm_after'), before=request.args.get('pm_before'), per_page=per_page)
+    pm_due_total = cached_count("SELECT COUNT(*) FROM assets" + pm_due_where)
+
     technicians = get_all_technicians()
-    return render_template('index.html', assets=assets, pm_due_assets=pm_due_assets, technicians=technicians, search_query=search_query)
+    return render_template('index.html',
+                           assets=assets_page['items'], assets_page=assets_page, asset_total=asset_total,
+                           pm_due_assets=pm_due_page['items'], pm_due_page=pm_due_page, pm_due_total=pm_due_total,
+                           technicians=technicians, search_query=search_query)
 
 # vvv --- แก้ไขฟังก์ชัน add_asset ให้เรียกใช้ฟังก์ชันผู้ช่วย --- vvv
 @app.route('/add_asset', methods=['POST'])
@@ -572,6 +3789,7 @@ def add_asset():
          asset_data['technician_id'], asset_data['asset_image_filename'])
     )
     db.commit()
+    invalidate_count_cache()
     flash(f'สินทรัพย์ "{asset_data["name"]}" ถูกเพิ่มเข้าระบบเรียบร้อยแล้ว', 'success')
     return redirect(url_for('index'))
 # ^^^ --- จบการแก้ไข add_asset --- ^^^
@@ -598,7 +3816,10 @@ def edit_asset(asset_id):
              asset_data['technician_id'], asset_data['asset_image_filename'], 
              asset_id)
         )
+        if asset_data['asset_image_filename'] != current_image:
+            enqueue_job(db, 'purge_uploads', {'filenames': [current_image]})
         db.commit()
+        invalidate_count_cache()
         flash(f'ข้อมูลสินทรัพย์ "{asset_data["name"]}" ถูกอัปเดตเรียบร้อยแล้ว', 'success')
         return redirect(url_for('asset_detail', asset_id=asset_id))
     
@@ -616,8 +3837,8 @@ def my_tasks():
     db = get_db()
     tasks = db.execute("""
         SELECT id, name, location, next_pm_date 
-        FROM assets WHERE technician_id = ? AND next_pm_date IS NOT NULL AND next_pm_date != '' AND date(next_pm_date) <= date('now', '+7 days')
-        ORDER BY next_pm_date ASC
+        FROM assets WHERE technician_id = ? AND pm_due_date <= date('now', '+7 days')
+        ORDER BY pm_due_date ASC
     """, (session['user_id'],)).fetchall()
     return render_template('my_tasks.html', tasks=tasks)
 
@@ -633,14 +3854,8 @@ def asset_detail(asset_id):
     is_pm_due = bool(asset.get('next_pm_date') and asset['next_pm_date'] != '' and date.fromisoformat(asset['next_pm_date']) <= date.today())
     history = db.execute('SELECT * FROM maintenance_history WHERE asset_id = ? ORDER BY date DESC', (asset_id,)).fetchall()
     
-    # ดึงข้อมูลจุดบำรุงรักษา
-    maintenance_points = get_maintenance_points_for_asset(asset_id)
-    
-    # ดึงรูปภาพสำหรับแต่ละจุดบำรุงรักษา
-    for point in maintenance_points:
-        point_dict = dict(point)
-        point_dict['images'] = get_maintenance_point_images(point['id'])
-        maintenance_points[maintenance_points.index(point)] = point_dict
+    # ดึงข้อมูลจุดบำรุงรักษาพร้อมรูปภาพ (2 คิวรีไม่ว่าจะมีกี่จุด)
+    maintenance_points = get_maintenance_points_batch([asset_id])[asset_id]
     
     return render_template('asset_detail.html', asset=asset, history=history, is_pm_due=is_pm_due, maintenance_points=maintenance_points)
 
@@ -652,45 +3867,142 @@ def delete_asset(asset_id):
     asset = db.execute('SELECT name, asset_image_filename FROM assets WHERE id = ?', (asset_id,)).fetchone()
     if asset:
         asset_name = asset['name']
-        # --- Delete associated image file ---
-        if asset['asset_image_filename']:
-            try:
-                os.remove(os.path.join(app.config['UPLOAD_FOLDER'], asset['asset_image_filename']))
-            except OSError as e:
-                print(f"Error deleting file {asset['asset_image_filename']}: {e}")
+        # --- ไฟล์รูปของสินทรัพย์และจุดบำรุงรักษา (ลบเฉพาะไฟล์ที่ไม่มีแถวอื่นอ้างอิงหลัง commit) ---
+        point_images = db.execute("""
+            SELECT mpi.image_filename FROM maintenance_point_images mpi
+            JOIN maintenance_points mp ON mpi.maintenance_point_id = mp.id
+            WHERE mp.asset_id = ?
+        """, (asset_id,)).fetchall()
+        filenames = [asset['asset_image_filename']] + [image['image_filename'] for image in point_images]
         
+        # ลบข้อมูลลูกก่อนเพื่อไม่ให้ขัดกับ foreign key
+        db.execute('DELETE FROM maintenance_point_images WHERE maintenance_point_id IN (SELECT id FROM maintenance_points WHERE asset_id = ?)', (asset_id,))
+        db.execute('DELETE FROM maintenance_points WHERE asset_id = ?', (asset_id,))
+        db.execute('DELETE FROM maintenance_parts_used WHERE maintenance_history_id IN (SELECT id FROM maintenance_history WHERE asset_id = ?)', (asset_id,))
         db.execute('DELETE FROM maintenance_history WHERE asset_id = ?', (asset_id,))
         db.execute('DELETE FROM assets WHERE id = ?', (asset_id,))
+        enqueue_job(db, 'purge_uploads', {'filenames': filenames})
         db.commit()
+        invalidate_count_cache()
         flash(f'สินทรัพย์ "{asset_name}" และข้อมูลที่เกี่ยวข้องถูกลบออกจากระบบเรียบร้อยแล้ว', 'success')
     else:
         flash('ไม่พบสินทรัพย์ที่ต้องการลบ', 'error')
     return redirect(url_for('index'))
 
-# ... (perform_pm and add_maintenance routes are unchanged) ...
+def perform_pm_batch(db, asset_ids=(), point_ids=(), performed_on=None):
+    """
+    บันทึกการทำ PM ของสินทรัพย์และจุดบำรุงรักษาหลายรายการใน transaction เดียว
+    คำนวณวันครบกำหนดถัดไป (performed_on + ความถี่) แล้วเขียนด้วย executemany
+    คืนค่า list ของ {'type', 'id', 'status': 'done' | 'no_frequency' | 'not_found', 'next_due'}
+    """
+    # ไม่ระบุวันที่ = ใช้เวลาปัจจุบันของฐานข้อมูล (CURRENT_TIMESTAMP) เหมือนการบันทึกทีละรายการ
+    performed_at = f"{performed_on.isoformat()} 00:00:00" if performed_on else None
+    performed_on = performed_on or date.today()
+    results, asset_updates, point_updates, history = [], [], [], []
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for kind, ids, sql in (
+            ('asset', asset_ids, "SELECT id, id AS asset_id, pm_frequency_days AS frequency, NULL AS point_name FROM assets WHERE id IN ({})"),
+            ('point', point_ids, "SELECT id, asset_id, frequency_days AS frequency, point_name FROM maintenance_points WHERE id IN ({})"),
+        ):
+            rows = {}
+            for chunk in _id_chunks(ids):
+                rows.update((row['id'], row) for row in db.execute(sql.format(', '.join('?' for _ in chunk)), chunk))
+            for item_id in dict.fromkeys(ids):
+                row = rows.get(item_id)
+                if row is None:
+                    results.append({'type': kind, 'id': item_id, 'status': 'not_found', 'next_due': None})
+                    continue
+                frequency = int(row['frequency']) if row['frequency'] else 0
+                if frequency <= 0:
+                    results.append({'type': kind, 'id': item_id, 'status': 'no_frequency', 'next_due': None})
+                    continue
+                next_due = (performed_on + timedelta(days=frequency)).isoformat()
+                if kind == 'asset':
+                    asset_updates.append((next_due, item_id))
+                    description = f"ดำเนินการบำรุงรักษาเชิงป้องกัน (PM) ตามรอบ {frequency} วัน"
+                else:
+                    point_updates.append((performed_on.isoformat(), next_due, item_id))
+                    description = f"ตรวจจุดบำรุงรักษา \"{row['point_name']}\" (PM) ตามรอบ {frequency} วัน"
+                history.append((row['asset_id'], performed_at, description, 0, 'PM'))
+                results.append({'type': kind, 'id': item_id, 'status': 'done', 'next_due': next_due})
+
+        db.executemany('UPDATE assets SET next_pm_date = ? WHERE id = ?', asset_updates)
+        db.executemany('UPDATE maintenance_points SET last_checked_date = ?, next_check_date = ? WHERE id = ?', point_updates)
+        db.executemany('INSERT INTO maintenance_history (asset_id, date, description, cost, job_type) VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?)', history)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if asset_updates:
+        invalidate_count_cache()
+    return results
+
 @app.route('/perform_pm/<int:asset_id>', methods=['POST'])
 @login_required
 def perform_pm(asset_id):
-    db = get_db()
-    asset = db.execute('SELECT pm_frequency_days FROM assets WHERE id = ?', (asset_id,)).fetchone()
-    if asset and asset['pm_frequency_days']:
-        frequency = int(asset['pm_frequency_days'])
-        new_next_pm_date = date.today() + timedelta(days=frequency)
-        db.execute('UPDATE assets SET next_pm_date = ? WHERE id = ?', (new_next_pm_date.isoformat(), asset_id))
-        db.execute('INSERT INTO maintenance_history (asset_id, description, cost) VALUES (?, ?, ?)',(asset_id, f"ดำเนินการบำรุงรักษาเชิงป้องกัน (PM) ตามรอบ {frequency} วัน", 0))
-        db.commit()
+    result = perform_pm_batch(get_db(), asset_ids=[asset_id])[0]
+    if result['status'] == 'done':
         flash('ดำเนินการ PM และอัปเดตกำหนดการครั้งถัดไปเรียบร้อยแล้ว', 'success')
     else:
         flash('ไม่สามารถดำเนินการได้: ไม่ได้ตั้งค่าความถี่ในการทำ PM', 'error')
     return redirect(url_for('asset_detail', asset_id=asset_id))
 
+@app.route('/perform_pm_batch', methods=['POST'])
+@login_required
+def perform_pm_batch_route():
+    """
+    Close out many PMs in one request. Accepts JSON {"asset_ids": [...], "point_ids": [...], "date": "YYYY-MM-DD"}
+    and returns per-item results, or form fields asset_ids/point_ids and redirects back with a summary.
+    """
+    is_json = request.is_json
+    payload = request.get_json(silent=True) if is_json else None
+    try:
+        if is_json:
+            if not isinstance(payload, dict):
+                raise ValueError('body must be a JSON object')
+            asset_ids, point_ids = payload.get('asset_ids') or [], payload.get('point_ids') or []
+            # สตริง "12" จะถูกแยกเป็น '1', '2' และ true จะกลายเป็น 1 จึงรับเฉพาะ list ของตัวเลขหรือสตริงตัวเลข
+            if not isinstance(asset_ids, list) or not isinstance(point_ids, list) \
+                    or any(isinstance(i, (bool, float)) for i in asset_ids + point_ids):
+                raise ValueError('asset_ids and point_ids must be lists')
+            asset_ids = [int(i) for i in asset_ids]
+            point_ids = [int(i) for i in point_ids]
+            performed_on = payload.get('date')
+        else:
+            asset_ids = [int(i) for i in request.form.getlist('asset_ids')]
+            point_ids = [int(i) for i in request.form.getlist('point_ids')]
+            performed_on = request.form.get('date')
+        if not all(-2 ** 63 <= i < 2 ** 63 for i in asset_ids + point_ids):
+            raise ValueError('ids must fit in SQLite integers')
+        performed_on = date.fromisoformat(performed_on) if performed_on else None
+    except (TypeError, ValueError):
+        if is_json:
+            return jsonify({'error': 'asset_ids and point_ids must be lists of integers and date must be YYYY-MM-DD'}), 400
+        flash('ข้อมูลที่ส่งมาไม่ถูกต้อง', 'error')
+        return redirect(request.referrer or url_for('index'))
+
+    results = perform_pm_batch(get_db(), asset_ids, point_ids, performed_on)
+    summary = Counter(result['status'] for result in results)
+    if is_json:
+        return jsonify({'results': results, 'summary': dict(summary)})
+    if summary['done']:
+        flash(f'บันทึกการทำ PM เรียบร้อยแล้ว {summary["done"]} รายการ', 'success')
+    if len(results) - summary['done']:
+        flash(f'ข้ามไป {len(results) - summary["done"]} รายการ (ไม่พบข้อมูลหรือไม่ได้ตั้งค่าความถี่)', 'warning')
+    return redirect(request.referrer or url_for('index'))
+
 @app.route('/add_maintenance/<int:asset_id>', methods=['POST'])
 @login_required
 def add_maintenance(asset_id):
     description, cost_str = request.form['description'], request.form.get('cost')
     cost = float(cost_str) if cost_str else None
+    job_type = request.form.get('job_type')
+    if job_type not in JOB_TYPE_LABELS:
+        job_type = classify_job_type(description)
     db = get_db()
-    db.execute('INSERT INTO maintenance_history (asset_id, description, cost) VALUES (?, ?, ?)', (asset_id, description, cost))
+    db.execute('INSERT INTO maintenance_history (asset_id, description, cost, job_type) VALUES (?, ?, ?, ?)', (asset_id, description, cost, job_type))
     db.commit()
     flash('เพิ่มประวัติการซ่อมบำรุงเรียบร้อยแล้ว', 'success')
     return redirect(url_for('asset_detail', asset_id=asset_id))
@@ -701,10 +4013,6 @@ def add_maintenance(asset_id):
 @admin_required
 def add_maintenance_point(asset_id):
     try:
-        print(f"DEBUG: add_maintenance_point called for asset_id={asset_id}")
-        print(f"DEBUG: Form data: {dict(request.form)}")
-        print(f"DEBUG: User session: {dict(session)}")
-        
         point_name = request.form['point_name']
         description = request.form.get('description', '')
         maintenance_procedure = request.form.get('maintenance_procedure', '')
@@ -719,7 +4027,6 @@ def add_maintenance_point(asset_id):
         """, (asset_id, point_name, description, maintenance_procedure, frequency_days, session['user_id']))
         
         maintenance_point_id = cursor.lastrowid
-        print(f"DEBUG: Created maintenance point with ID: {maintenance_point_id}")
         
         # จัดการไฟล์รูปภาพที่อัปโหลด (ถ้ามี)
         if 'point_images' in request.files:
@@ -730,12 +4037,11 @@ def add_maintenance_point(asset_id):
                                                request.form.get('image_description', ''), 'reference')
         
         db.commit()
-        print(f"DEBUG: Successfully committed to database")
         flash(f'เพิ่มจุดบำรุงรักษา "{point_name}" เรียบร้อยแล้ว', 'success')
         return redirect(url_for('asset_detail', asset_id=asset_id))
         
     except Exception as e:
-        print(f"DEBUG: Error in add_maintenance_point: {str(e)}")
+        print(f"Error in add_maintenance_point: {e}")
         flash(f'เกิดข้อผิดพลาด: {str(e)}', 'error')
         return redirect(url_for('asset_detail', asset_id=asset_id))
 
@@ -791,7 +4097,7 @@ def edit_maintenance_point(point_id):
         flash(f'อัปเดตจุดบำรุงรักษา "{point_name}" เรียบร้อยแล้ว', 'success')
         return redirect(url_for('asset_detail', asset_id=point['asset_id']))
     
-    images = get_maintenance_point_images(point_id)
+    images = get_maintenance_point_images_batch([point_id])[point_id]
     return render_template('edit_maintenance_point.html', point=point, images=images)
 
 @app.route('/delete_maintenance_point/<int:point_id>', methods=['POST'])
@@ -802,17 +4108,12 @@ def delete_maintenance_point(point_id):
     point = db.execute('SELECT * FROM maintenance_points WHERE id = ?', (point_id,)).fetchone()
     
     if point:
-        # ลบรูปภาพที่เกี่ยวข้อง
         images = get_maintenance_point_images(point_id)
-        for image in images:
-            try:
-                os.remove(os.path.join(app.config['UPLOAD_FOLDER'], image['image_filename']))
-            except OSError as e:
-                print(f"Error deleting image file {image['image_filename']}: {e}")
         
-        # ลบข้อมูลจากฐานข้อมูล
+        # ลบข้อมูลจากฐานข้อมูล แล้วให้ worker ลบไฟล์รูปภาพที่ไม่มีแถวอื่นอ้างอิง
         db.execute('DELETE FROM maintenance_point_images WHERE maintenance_point_id = ?', (point_id,))
         db.execute('DELETE FROM maintenance_points WHERE id = ?', (point_id,))
+        enqueue_job(db, 'purge_uploads', {'filenames': [image['image_filename'] for image in images]})
         db.commit()
         
         flash(f'ลบจุดบำรุงรักษา "{point["point_name"]}" เรียบร้อยแล้ว', 'success')
@@ -847,12 +4148,8 @@ def delete_point_image(image_id):
     image = db.execute('SELECT * FROM maintenance_point_images WHERE id = ?', (image_id,)).fetchone()
     
     if image:
-        try:
-            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], image['image_filename']))
-        except OSError as e:
-            print(f"Error deleting image file {image['image_filename']}: {e}")
-        
         db.execute('DELETE FROM maintenance_point_images WHERE id = ?', (image_id,))
+        enqueue_job(db, 'purge_uploads', {'filenames': [image['image_filename']]})
         db.commit()
         flash('ลบรูปภาพเรียบร้อยแล้ว', 'success')
     else:
@@ -861,43 +4158,398 @@ def delete_point_image(image_id):
     return redirect(request.referrer)
 
 # --- Dashboard & API Routes (No Changes) ---
+@app.route('/api/db_pool_stats')
+@login_required
+@admin_required
+def db_pool_stats_api():
+    """สถิติของ connection pool ใน process นี้"""
+    return jsonify({
+        'pid': os.getpid(),
+        'pragma_profile': app.config['SQLITE_PRAGMA_PROFILE'],
+        'pools': [pool.stats() for pool in list(_pools.values())],
+    })
+
+def metrics_client_allowed(remote_addr):
+    """remote_addr อยู่ในเครือข่ายใดเครือข่ายหนึ่งของ METRICS_ALLOW หรือไม่"""
+    try:
+        address = ipaddress.ip_address(remote_addr or '')
+    except ValueError:
+        return False
+    for network in app.config['METRICS_ALLOW'].split(','):
+        try:
+            if network.strip() and address in ipaddress.ip_network(network.strip(), strict=False):
+                return True
+        except ValueError:
+            print(f"Ignoring invalid METRICS_ALLOW network: {network.strip()}")
+    return False
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    ตัวเลขของ process นี้ในรูปแบบ Prometheus
+    ถ้าตั้ง METRICS_TOKEN ต้องส่ง token เสมอ ถ้าไม่ได้ตั้งจะตอบเฉพาะเครือข่ายใน METRICS_ALLOW
+    """
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response('unauthorized\n', 401, mimetype='text/plain')
+    elif not metrics_client_allowed(request.remote_addr):
+        return Response('forbidden: set METRICS_TOKEN or METRICS_ALLOW\n', 403, mimetype='text/plain')
+    return Response(metrics.render(list(_pools.values())), mimetype='text/plain; version=0.0.4')
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
     return render_template('dashboard.html')
 
+@app.route('/api/pm_capacity')
+@login_required
+def pm_capacity_api():
+    """Projected PM workload per period and technician, read from pm_occurrences."""
+    formats = {'day': '%Y-%m-%d', 'week': '%Y-W%W', 'month': '%Y-%m'}
+    period = request.args.get('period', 'week')
+    if period not in formats:
+        return jsonify({'error': 'period must be day, week or month'}), 400
+    start = parse_calendar_date(request.args.get('start'), date.today().isoformat())
+    end = parse_calendar_date(request.args.get('end'), '9999-12-31')
+    schedule_current = ensure_pm_schedule()
+    sql = """
+        SELECT strftime(?, o.due_date) AS period, o.technician_id, u.username AS technician,
+               COUNT(*) AS occurrences, SUM(o.source_type = 'asset') AS asset_pm, SUM(o.source_type = 'point') AS point_checks
+        FROM pm_occurrences o LEFT JOIN users u ON u.id = o.technician_id
+        WHERE o.due_date >= ? AND o.due_date < ?
+    """
+    params = [formats[period], start, end]
+    if request.args.get('technician_id'):
+        sql += " AND o.technician_id = ?"
+        params.append(request.args.get('technician_id', type=int))
+    sql += " GROUP BY 1, 2 ORDER BY 1, 3"
+    response = jsonify([dict(row) for row in get_db().execute(sql, params)])
+    response.headers['X-PM-Schedule'] = 'current' if schedule_current else 'stale'
+    return response
+
+# --- Asset Attribute API ---
+@app.route('/api/assets')
+@login_required
+def assets_api():
+    """สินทรัพย์ที่ตรงกับเงื่อนไข custom attribute ทุกข้อ (?attr=voltage>380&attr=Brand=ABB) แบ่งหน้าด้วย cursor"""
+    try:
+        filters = [parse_attribute_filter(expression) for expression in request.args.getlist('attr')]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    where_sql, params = attribute_filter_sql(filters)
+    page = keyset_paginate(
+        "SELECT a.id, a.name, a.location, a.next_pm_date, a.technician_id, a.custom_data FROM assets a WHERE 1=1" + where_sql,
+        params, [('a.id', 'DESC')],
+        after=request.args.get('after'), before=request.args.get('before'), per_page=get_per_page())
+    return jsonify({
+        'items': [dict(row, custom_data=json.loads(row['custom_data'] or '{}')) for row in page['items']],
+        'total': cached_count("SELECT COUNT(*) FROM assets a WHERE 1=1" + where_sql, params),
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+    })
+
+@app.route('/api/asset_attributes')
+@login_required
+def asset_attributes_api():
+    """key ของ custom attribute ทั้งหมด พร้อมจำนวนสินทรัพย์และจำนวนค่าที่เป็นตัวเลข (สำหรับสร้างตัวกรอง)"""
+    # นับแยกสองครั้งเพื่อให้แต่ละครั้งอ่านเฉพาะ covering index ของตัวเอง
+    rows = get_db().execute("""
+        SELECT k.attr_key AS key, k.assets, COALESCE(n.numeric, 0) AS numeric
+        FROM (SELECT attr_key, COUNT(*) AS assets FROM asset_attributes GROUP BY attr_key) k
+        LEFT JOIN (SELECT attr_key, COUNT(*) AS numeric FROM asset_attributes
+                   WHERE value_num IS NOT NULL GROUP BY attr_key) n ON n.attr_key = k.attr_key
+        ORDER BY k.assets DESC, key
+    """).fetchall()
+    return jsonify([dict(row) for row in rows])
+
+# --- Job Status API ---
+@app.route('/api/jobs')
+@login_required
+@admin_required
+def jobs_api():
+    """งานล่าสุดในคิว (กรองด้วย status และ kind) พร้อมจำนวนงานแยกตามสถานะ"""
+    db = get_db()
+    sql = "SELECT * FROM jobs WHERE 1=1"
+    params = []
+    for key in ('status', 'kind'):
+        if request.args.get(key):
+            sql += f" AND {key} = ?"
+            params.append(request.args[key])
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(max(1, min(request.args.get('limit', 100, type=int), app.config['MAX_PER_PAGE'])))
+    return jsonify({
+        'counts': {row['status']: row['count'] for row in db.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")},
+        'jobs': [job_status(row) for row in db.execute(sql, params)],
+    })
+
+def get_visible_job(job_id):
+    """งานที่ผู้ใช้ปัจจุบันดูได้ (ของตัวเอง หรือทุกงานถ้าเป็น admin) หรือ None"""
+    job = get_db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None or (session.get('role') != 'admin' and job['created_by'] != session.get('user_id')):
+        return None
+    return job
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def job_status_api(job_id):
+    """สถานะของงานหนึ่งงาน"""
+    job = get_visible_job(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job_status(job))
+
+@app.route('/jobs/<int:job_id>/download')
+@login_required
+def download_job_export(job_id):
+    """ดาวน์โหลดไฟล์ที่งานส่งออกสร้างไว้"""
+    job = get_visible_job(job_id)
+    if job is None or job['kind'] != 'export_history' or job['status'] != 'done':
+        return "File not found", 404
+    result = json.loads(job['result'])
+    path = os.path.join(app.config['EXPORT_FOLDER'], secure_filename(result['file']))
+    if not os.path.isfile(path):
+        return "File not found", 404
+    return send_file(path, request.environ, as_attachment=True, download_name=result['download_name'],
+                     response_class=app.response_class)
+
+# --- PM Calendar Feed ---
+PM_EVENTS_SQL = """
+    SELECT 'asset' AS kind, id AS asset_id, name AS title, pm_due_date AS due
+    FROM assets WHERE pm_due_date >= ? AND pm_due_date < ?
+    UNION ALL
+    SELECT 'point', mp.asset_id, a.name || ' - ' || mp.point_name, mp.point_due_date
+    FROM maintenance_points mp JOIN assets a ON a.id = mp.asset_id
+    WHERE mp.status = 'active' AND mp.point_due_date >= ? AND mp.point_due_date < ?
+    ORDER BY due
+"""
+
+_pm_events_cache = OrderedDict()
+_pm_events_lock = threading.Lock()
+
+def parse_calendar_date(value, default):
+    """อ่านวันที่จากพารามิเตอร์ของ FullCalendar (เช่น '2025-01-27T00:00:00+07:00') เป็น 'YYYY-MM-DD'"""
+    try:
+        return date.fromisoformat((value or '')[:10]).isoformat()
+    except ValueError:
+        return default
+
+def get_pm_events_body(start, end):
+    """
+    คืน (etag, JSON bytes) ของ event ในช่วง [start, end) โดย cache ตามช่วงวันที่
+    cache ถูกล้างเมื่อ cache_generations เปลี่ยน (trigger บน assets / maintenance_points)
+    """
+    db = get_db()
+    generation = db.execute("SELECT generation FROM cache_generations WHERE name = 'pm_events'").fetchone()[0]
+    key = (generation, start, end)
+    with _pm_events_lock:
+        if key in _pm_events_cache:
+            _pm_events_cache.move_to_end(key)
+            return _pm_events_cache[key]
+
+    asset_url = url_for('asset_detail', asset_id=0)[:-1]  # '/asset/' สร้างครั้งเดียวแทนการเรียก url_for ทุกแถว
+    events = []
+    for row in db.execute(PM_EVENTS_SQL, (start, end, start, end)):
+        event = {'title': row['title'], 'start': row['due'], 'url': f"{asset_url}{row['asset_id']}"}
+        if row['kind'] == 'point':
+            event['color'] = '#198754'
+        events.append(event)
+    body = json.dumps(events, ensure_ascii=False).encode('utf-8')
+    entry = (hashlib.sha1(body).hexdigest(), body)
+
+    with _pm_events_lock:
+        if any(cached[0] != generation for cached in _pm_events_cache):
+            _pm_events_cache.clear()
+        _pm_events_cache[key] = entry
+        while len(_pm_events_cache) > app.config['PM_EVENTS_CACHE_SIZE']:
+            _pm_events_cache.popitem(last=False)
+    return entry
+
 @app.route('/api/pm_events')
 @login_required
 def pm_events_api():
-    db = get_db()
-    assets_with_pm = db.execute("SELECT id, name, next_pm_date FROM assets WHERE next_pm_date IS NOT NULL AND next_pm_date != ''").fetchall()
-    events = [{'title': asset['name'], 'start': asset['next_pm_date'], 'url': url_for('asset_detail', asset_id=asset['id'])} for asset in assets_with_pm]
-    return jsonify(events)
+    """Calendar feed of asset PM dates and maintenance point due dates between start and end."""
+    start = parse_calendar_date(request.args.get('start'), '0000-01-01')
+    end = parse_calendar_date(request.args.get('end'), '9999-12-31')
+    etag, body = get_pm_events_body(start, end)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/reports')
 @login_required
 def reports():
     db = get_db()
+    # อ่านจากตารางสรุป (แถวละเดือนต่อประเภทงาน) ซึ่ง trigger ดูแลให้เป็นปัจจุบัน
     costs_by_month = db.execute("""
-        SELECT strftime('%Y-%m', date) as month, SUM(cost) as total_cost
-        FROM maintenance_history WHERE cost IS NOT NULL AND cost > 0
-        GROUP BY month ORDER BY month;
+        SELECT month, SUM(total_cost) as total_cost
+        FROM report_monthly_costs WHERE month != ''
+        GROUP BY month HAVING SUM(total_cost) > 0 ORDER BY month
     """).fetchall()
     cost_data = {
         'labels': [datetime.strptime(row['month'], '%Y-%m').strftime('%b %Y') for row in costs_by_month],
-        'data': [row['total_cost'] or 0 for row in costs_by_month]
+        'data': [row['total_cost'] for row in costs_by_month]
     }
-    all_descriptions = db.execute("SELECT description FROM maintenance_history").fetchall()
-    job_type_counts = Counter(
-        'งาน PM' if 'PM' in row['description'] or 'บำรุงรักษาเชิงป้องกัน' in row['description'] 
-        else 'งานซ่อมทั่วไป (CM)'
-        for row in all_descriptions
-    )
+    job_types = db.execute("""
+        SELECT job_type, SUM(job_count) as job_count, SUM(total_cost) as total_cost
+        FROM report_monthly_costs GROUP BY job_type ORDER BY job_type DESC
+    """).fetchall()
     job_type_data = {
-        'labels': list(job_type_counts.keys()),
-        'data': list(job_type_counts.values())
+        'labels': [JOB_TYPE_LABELS[row['job_type']] for row in job_types],
+        'data': [row['job_count'] for row in job_types]
     }
-    return render_template('reports.html', cost_data=cost_data, job_type_data=job_type_data)
+    return render_template('reports.html', cost_data=cost_data, job_type_data=job_type_data,
+                           total_maintenance=sum(row['job_count'] for row in job_types),
+                           total_cost='{:,.2f}'.format(sum(row['total_cost'] for row in job_types)),
+                           technicians=get_all_technicians())
+
+# --- Streaming Export Helpers ---
+HISTORY_EXPORT_COLUMNS = [
+    ('id', 'ID'),
+    ('asset_id', 'Asset ID'),
+    ('asset_name', 'Asset'),
+    ('location', 'Location'),
+    ('technician', 'Technician'),
+    ('date', 'Date'),
+    ('description', 'Description'),
+    ('cost', 'Cost'),
+]
+
+def iter_query_batches(sql, params=(), batch_size=1000):
+    """
+    generator อ่านผลคิวรีทีละชุดด้วย connection ของตัวเองจาก pool แบบอ่านอย่างเดียว
+    ใช้กับ response แบบ streaming ซึ่งทำงานต่อหลังจาก request context ถูกปิดไปแล้ว
+    """
+    pool = get_pool(readonly=True)
+    conn = pool.acquire()
+    try:
+        cursor = conn.execute(sql, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+    finally:
+        pool.release(conn)
+
+def encode_export(batches, columns, fmt):
+    """แปลงชุดของแถวเป็นข้อความ CSV หรือ JSON Lines ทีละชุด (หัวตาราง CSV ถูกส่งออกไปก่อนทันที)"""
+    keys = [key for key, _ in columns]
+    if fmt == 'jsonl':
+        for rows in batches:
+            yield ''.join(json.dumps({key: row[key] for key in keys}, ensure_ascii=False) + '\n' for row in rows)
+        return
+    import csv
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([label for _, label in columns])
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([row[key] for key in keys] for row in rows)
+        yield buffer.getvalue()
+
+def gzip_stream(chunks):
+    """บีบอัดข้อความเป็น gzip แบบ streaming โดย flush ทุกชุดเพื่อให้ไคลเอนต์ได้รับข้อมูลทันที"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def streaming_export_response(sql, params, columns, fmt, compress, filename):
+    """สร้าง Response แบบ streaming ที่ใช้หน่วยความจำคงที่ไม่ว่าจะส่งออกกี่แถว"""
+    chunks = encode_export(iter_query_batches(sql, params), columns, fmt)
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    filename = f"{filename}.{fmt}"
+    if compress:
+        chunks = gzip_stream(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    return Response(
+        chunks,
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment;filename={filename}",
+            "X-Accel-Buffering": "no",
+            "Cache-Control": "no-store",
+        },
+    )
+
+def history_export_query(args):
+    """
+    สร้างคิวรีส่งออกประวัติการซ่อมบำรุงจากพารามิเตอร์ (dict) คืนค่า (sql, params, ชื่อไฟล์ไม่รวมนามสกุล)
+    raise ValueError ถ้าวันที่ไม่ถูกต้อง
+    """
+    sql = """
+        SELECT mh.id, mh.asset_id, a.name AS asset_name, a.location, u.username AS technician,
+               mh.date, mh.description, mh.cost
+        FROM maintenance_history mh
+        JOIN assets a ON a.id = mh.asset_id
+        LEFT JOIN users u ON u.id = a.technician_id
+        WHERE 1=1
+    """
+    params = []
+    start = date.fromisoformat(args['start']) if args.get('start') else None
+    end = date.fromisoformat(args['end']) if args.get('end') else None
+    # เทียบกับคอลัมน์ date ตรง ๆ (ไม่ครอบด้วย date()) เพื่อให้ใช้ดัชนีได้
+    if start:
+        sql += " AND mh.date >= ?"
+        params.append(start.isoformat())
+    if end:
+        sql += " AND mh.date < ?"
+        params.append((end + timedelta(days=1)).isoformat())
+    if str(args.get('asset_id', '')).isdigit():
+        sql += " AND mh.asset_id = ?"
+        params.append(int(args['asset_id']))
+    if str(args.get('technician_id', '')).isdigit():
+        sql += " AND a.technician_id = ?"
+        params.append(int(args['technician_id']))
+    if args.get('location'):
+        sql += " AND a.location = ?"
+        params.append(args['location'])
+    sql += " ORDER BY mh.date ASC, mh.id ASC"
+
+    filename = "maintenance_history"
+    if start or end:
+        filename += f"_{start or 'begin'}_{end or 'now'}"
+    return sql, params, filename
+
+@app.route('/export/maintenance_history')
+@login_required
+def export_maintenance_history():
+    """
+    ส่งออกประวัติการซ่อมบำรุงทั้งหมดแบบ streaming
+    query string: asset_id, start, end (YYYY-MM-DD), technician_id, location, format=csv|jsonl, gzip=1
+    async=1: ให้ worker สร้างไฟล์แล้วตอบ 202 พร้อม URL สถานะของงาน (ดาวน์โหลดได้เมื่อเสร็จ)
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        flash('รูปแบบไฟล์ไม่ถูกต้อง (csv หรือ jsonl)', 'error')
+        return redirect(url_for('reports'))
+    try:
+        sql, params, filename = history_export_query(request.args)
+    except ValueError:
+        flash('รูปแบบวันที่ไม่ถูกต้อง (YYYY-MM-DD)', 'error')
+        return redirect(url_for('reports'))
+
+    if request.args.get('async') == '1':
+        args = request.args.to_dict()
+        args.pop('async')
+        download_name = f"{filename}.{fmt}" + ('.gz' if args.get('gzip') == '1' else '')
+        job_id = enqueue_job(get_db(write=True), 'export_history',
+                             {'args': args, 'file': secrets.token_hex(16), 'download_name': download_name})
+        status_url = url_for('job_status_api', job_id=job_id)
+        return jsonify({'id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
+    return streaming_export_response(sql, params, HISTORY_EXPORT_COLUMNS, fmt,
+                                     request.args.get('gzip') == '1', filename)
 
 @app.route('/export_asset_history/<int:asset_id>')
 @login_required
@@ -907,24 +4559,17 @@ def export_asset_history(asset_id):
     if not asset:
         flash('ไม่พบสินทรัพย์ที่ต้องการ', 'error')
         return redirect(url_for('index'))
-    history = db.execute('SELECT date, description, cost FROM maintenance_history WHERE asset_id = ? ORDER BY date DESC', (asset_id,)).fetchall()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Date', 'Description', 'Cost'])
-    for item in history:
-        writer.writerow([item['date'], item['description'], item['cost']])
-    output.seek(0)
-    return Response(
-        output,
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment;filename=history_{asset['name'].replace(' ', '_')}_{asset_id}.csv"}
-    )
+    return streaming_export_response(
+        'SELECT date, description, cost FROM maintenance_history WHERE asset_id = ? ORDER BY date DESC',
+        (asset_id,),
+        [('date', 'Date'), ('description', 'Description'), ('cost', 'Cost')],
+        'csv', False, f"history_{asset['name'].replace(' ', '_')}_{asset_id}")
 
 @app.route('/setup_db')
 def setup_database():
     """Setup database route for development"""
     try:
-        db = get_db()
+        db = get_db(write=True)
         
         # Check if parts table exists and has data
         cursor = db.cursor()
@@ -932,23 +4577,7 @@ def setup_database():
         parts_count = cursor.fetchone()[0]
         
         if parts_count == 0:
-            # Add sample parts data
-            sample_parts = [
-                ('FILTER001', 'กรองอากาศ', 'กรองอากาศสำหรับเครื่องปรับอากาศ', 'ระบบปรับอากาศ', 'ABC Filter Co.', 150.00, 5, 20, 'ชั้น A1', 'บริษัท ฟิลเตอร์ จำกัด', '02-123-4567', 'เปลี่ยนทุก 3 เดือน'),
-                ('BELT002', 'สายพาน V-Belt', 'สายพานสำหรับเครื่องจักร', 'เครื่องจักร', 'Gates Corporation', 350.00, 3, 15, 'ชั้น B2', 'บริษัท เกตส์ ไทย', '02-234-5678', 'ตรวจสอบความตึงเป็นประจำ'),
-                ('OIL003', 'น้ำมันหล่อลื่น', 'น้ำมันหล่อลื่นเกรดอุตสาหกรรม', 'น้ำมันหล่อลื่น', 'Shell', 450.00, 10, 25, 'คลัง C', 'บริษัท เชลล์', '02-345-6789', 'เก็บในที่แห้ง'),
-                ('BEARING004', 'ลูกปืน', 'ลูกปืนขนาด 6203', 'เครื่องจักร', 'SKF', 280.00, 8, 12, 'ชั้น A3', 'บริษัท เอสเคเอฟ', '02-456-7890', 'ใช้จาระบีคุณภาพดี'),
-                ('SCREW005', 'สกรูสแตนเลส', 'สกรูสแตนเลส M6x20', 'ฮาร์ดแวร์', 'Local Supplier', 15.00, 50, 200, 'ชั้น D1', 'ร้านเหล็ก ABC', '02-567-8901', 'สต็อกจำนวนมาก'),
-            ]
-            
-            for part_data in sample_parts:
-                cursor.execute("""
-                    INSERT INTO parts 
-                    (part_number, part_name, description, category, manufacturer, unit_price, 
-                     minimum_stock, current_stock, location, supplier, supplier_contact, notes, created_by) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
-                """, part_data)
-            
+            insert_sample_parts(db)
             db.commit()
             flash('Sample parts data added successfully!', 'success')
         else:
@@ -964,7 +4593,7 @@ def setup_database():
 def create_admin_user():
     """Create admin user route for development"""
     try:
-        db = get_db()
+        db = get_db(write=True)
         username = 'admin'
         password = 'admin123'
         
@@ -979,7 +4608,7 @@ def create_admin_user():
             # Create admin user
             db.execute(
                 "INSERT INTO users (username, password_hash, role) VALUES (?, ?, 'admin')",
-                (username, generate_password_hash(password))
+                (username, hash_password(password))
             )
             db.commit()
             flash(f'Admin user "{username}" created successfully! Password: {password}', 'success')
@@ -990,12 +4619,127 @@ def create_admin_user():
         flash(f'Error creating admin user: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+# --- Production Server ---
+def warm_up_app():
+    """
+    เตรียม app ก่อนรับ request (เรียกครั้งเดียวใน master ก่อน fork)
+    อัปเกรดฐานข้อมูล compile template ทั้งหมด และคำนวณกำหนดการ PM ที่ค้าง คืนค่าจำนวน template
+    """
+    init_database()
+    templates = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+        templates += 1
+    db = sqlite3.connect(DATABASE)
+    try:
+        refresh_pm_schedule(db)
+    finally:
+        db.close()
+    return templates
+
+def warm_up_connections():
+    """
+    เปิด connection ของ pool ให้ครบก่อนรับ request (เรียกในแต่ละ worker หลัง fork)
+    การอ่าน sqlite_master ทำให้ schema ถูก parse ไว้แล้วใน connection
+    """
+    for readonly, size in ((True, app.config['DB_POOL_READERS']), (False, app.config['DB_POOL_WRITERS'])):
+        pool = get_pool(readonly)
+        conns = [pool.acquire() for _ in range(size)]
+        for conn in conns:
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            pool.release(conn)
+
+def _serve_gunicorn(bind, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class PreloadedApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': bind,
+                'workers': workers,
+                'threads': threads,
+                'worker_class': 'gthread' if threads > 1 else 'sync',
+                # โหลด app ครั้งเดียวใน master แล้ว fork (template ที่ compile แล้วใช้ร่วมกันได้)
+                'preload_app': True,
+                'timeout': app.config['SERVE_TIMEOUT'],
+                'graceful_timeout': app.config['SERVE_GRACEFUL_TIMEOUT'],
+                'max_requests': app.config['SERVE_MAX_REQUESTS'],
+                'max_requests_jitter': app.config['SERVE_MAX_REQUESTS'] // 10,
+                'post_fork': lambda server, worker: warm_up_connections(),
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    PreloadedApplication().run()
+
+def _serve_waitress(bind, threads):
+    import waitress
+    warm_up_connections()
+    waitress.serve(app, listen=bind, threads=threads)
+
+def serve_production(bind=None, workers=None, threads=None, server='auto'):
+    """
+    รัน app ด้วย WSGI server สำหรับ production (ไม่มี debugger ไม่เปิด browser)
+    - gunicorn: หลาย process แบบ pre-fork + thread ต่อ process (Linux/macOS)
+    - waitress: process เดียวหลาย thread (Windows หรือเมื่อไม่มี gunicorn)
+    """
+    bind = bind or app.config['SERVE_BIND']
+    workers = max(workers or app.config['SERVE_WORKERS'], 1)
+    threads = max(threads or app.config['SERVE_THREADS'], 1)
+    import importlib.util
+    if server == 'auto':
+        server = 'gunicorn' if importlib.util.find_spec('gunicorn') and os.name != 'nt' else 'waitress'
+    if server == 'waitress' and not importlib.util.find_spec('waitress'):
+        raise click.ClickException("no production server installed: pip install gunicorn (Linux/macOS) or waitress")
+    if app.secret_key == 'a-super-secret-key-that-you-should-change':
+        click.echo("Warning: SECRET_KEY is the default value; set the SECRET_KEY environment variable.", err=True)
+    # ทุก thread ของ worker อาจอ่านพร้อมกัน
+    app.config['DB_POOL_READERS'] = max(app.config['DB_POOL_READERS'], threads)
+    app.debug = False
+    reset_pools()
+    started = time.perf_counter()
+    templates = warm_up_app()
+    click.echo(f"Warmed up in {time.perf_counter() - started:.2f}s ({templates} templates compiled)")
+    if server == 'gunicorn':
+        click.echo(f"Serving on {bind} with gunicorn: {workers} workers x {threads} threads "
+                   "(SIGHUP restarts workers gracefully, SIGTERM stops after current requests)")
+        _serve_gunicorn(bind, workers, threads)
+    else:
+        click.echo(f"Serving on {bind} with waitress: 1 process x {threads} threads")
+        _serve_waitress(bind, threads)
+
+@app.cli.command('serve')
+@click.option('--bind', '-b', default=None, help='host:port to listen on (default SERVE_BIND).')
+@click.option('--workers', '-w', type=int, default=None, help='Worker processes (default SERVE_WORKERS, gunicorn only).')
+@click.option('--threads', '-t', type=int, default=None, help='Threads per worker (default SERVE_THREADS).')
+@click.option('--server', type=click.Choice(['auto', 'gunicorn', 'waitress']), default='auto',
+              help='WSGI server; auto prefers gunicorn and falls back to waitress.')
+def serve_command(bind, workers, threads, server):
+    """Serve the app with a multi-worker production WSGI server after warming it up."""
+    serve_production(bind, workers, threads, server)
+
+
 if __name__ == '__main__':
+    if '--prod' in sys.argv:
+        try:
+            serve_production()
+        except click.ClickException as e:
+            e.show()
+            sys.exit(e.exit_code)
+        sys.exit(0)
+
     with app.app_context():
         init_database()
 
     # ตรวจสอบว่าไม่ได้กำลังรันใน reloader process
     if not os.environ.get('WERKZEUG_RUN_MAIN'):
+        import webbrowser
         webbrowser.open_new('http://127.0.0.1:5000')
+    else:
+        # ตอนพัฒนาให้ process ที่รับ request ทำงานในคิวเองด้วย (production ใช้ flask worker)
+        start_worker_threads(1, threading.Event())
 
     app.run(debug=True)
\ No newline at end of file
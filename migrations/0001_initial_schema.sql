@@ -1,10 +1,8 @@
--- ล้างตารางเก่าทิ้งถ้ามีอยู่ เพื่อป้องกันข้อผิดพลาด
-DROP TABLE IF EXISTS assets;
-DROP TABLE IF EXISTS maintenance_history;
-DROP TABLE IF EXISTS users;
+-- 0001: โครงสร้างตารางเริ่มต้น (เทียบเท่ากับ schema.sql เดิม)
+-- ใช้ IF NOT EXISTS เพื่อให้ฐานข้อมูลที่สร้างจาก schema.sql / update_db.py เดิมผ่าน migration นี้ได้โดยไม่เปลี่ยนแปลง
 
 -- สร้างตารางสำหรับผู้ใช้งาน พร้อมคอลัมน์ role
-CREATE TABLE users (
+CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT UNIQUE NOT NULL,
     password_hash TEXT NOT NULL,
@@ -13,7 +11,7 @@ CREATE TABLE users (
 );
 
 -- สร้างตารางสำหรับสินทรัพย์ พร้อมคอลัมน์สำหรับ PM และผู้รับผิดชอบ
-CREATE TABLE assets (
+CREATE TABLE IF NOT EXISTS assets (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
     location TEXT NOT NULL,
@@ -27,7 +25,7 @@ CREATE TABLE assets (
 );
 
 -- สร้างตารางสำหรับประวัติการซ่อมบำรุง
-CREATE TABLE maintenance_history (
+CREATE TABLE IF NOT EXISTS maintenance_history (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     asset_id INTEGER NOT NULL,
     date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -37,7 +35,7 @@ CREATE TABLE maintenance_history (
 );
 
 -- สร้างตารางสำหรับจุดที่ต้องบำรุงรักษา (Maintenance Points)
-CREATE TABLE maintenance_points (
+CREATE TABLE IF NOT EXISTS maintenance_points (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     asset_id INTEGER NOT NULL,
     point_name TEXT NOT NULL,
@@ -54,7 +52,7 @@ CREATE TABLE maintenance_points (
 );
 
 -- สร้างตารางสำหรับเก็บรูปภาพของจุดบำรุงรักษา
-CREATE TABLE maintenance_point_images (
+CREATE TABLE IF NOT EXISTS maintenance_point_images (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     maintenance_point_id INTEGER NOT NULL,
     image_filename TEXT NOT NULL,
@@ -67,7 +65,7 @@ CREATE TABLE maintenance_point_images (
 );
 
 -- สร้างตารางสำหรับการจัดการอะไหล่ (Parts Stock)
-CREATE TABLE parts (
+CREATE TABLE IF NOT EXISTS parts (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     part_number TEXT UNIQUE NOT NULL,
     part_name TEXT NOT NULL,
@@ -88,7 +86,7 @@ CREATE TABLE parts (
 );
 
 -- สร้างตารางสำหรับประวัติการเคลื่อนไหวของอะไหล่
-CREATE TABLE parts_transactions (
+CREATE TABLE IF NOT EXISTS parts_transactions (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     part_id INTEGER NOT NULL,
     transaction_type TEXT NOT NULL, -- 'in', 'out', 'adjustment'
@@ -104,7 +102,7 @@ CREATE TABLE parts_transactions (
 );
 
 -- สร้างตารางสำหรับเชื่อมโยงอะไหล่กับงานซ่อมบำรุง
-CREATE TABLE maintenance_parts_used (
+CREATE TABLE IF NOT EXISTS maintenance_parts_used (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     maintenance_history_id INTEGER NOT NULL,
     part_id INTEGER NOT NULL,
@@ -113,4 +111,4 @@ CREATE TABLE maintenance_parts_used (
     notes TEXT,
     FOREIGN KEY (maintenance_history_id) REFERENCES maintenance_history (id),
     FOREIGN KEY (part_id) REFERENCES parts (id)
-);
\ No newline at end of file
+);
@@ -0,0 +1,63 @@
+-- 0002: ดัชนีค้นหาข้อความ (FTS5) สำหรับสินทรัพย์และอะไหล่
+-- ใช้ tokenizer แบบ trigram เพราะภาษาไทยไม่มีการเว้นวรรคระหว่างคำ
+-- ตารางถูกอัปเดตอัตโนมัติด้วย trigger และเติมข้อมูลเดิมทั้งหมดตอนท้าย migration
+
+CREATE VIRTUAL TABLE IF NOT EXISTS assets_fts USING fts5(
+    name,
+    location,
+    custom_values, -- เฉพาะค่าใน custom_data ไม่รวม key และเครื่องหมาย JSON
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS assets_fts_ai AFTER INSERT ON assets BEGIN
+    INSERT INTO assets_fts (rowid, name, location, custom_values)
+    VALUES (NEW.id, NEW.name, NEW.location,
+            CASE WHEN json_valid(NEW.custom_data)
+                 THEN (SELECT group_concat(value, ' ') FROM json_each(NEW.custom_data)) END);
+END;
+
+CREATE TRIGGER IF NOT EXISTS assets_fts_au AFTER UPDATE OF name, location, custom_data ON assets BEGIN
+    DELETE FROM assets_fts WHERE rowid = OLD.id;
+    INSERT INTO assets_fts (rowid, name, location, custom_values)
+    VALUES (NEW.id, NEW.name, NEW.location,
+            CASE WHEN json_valid(NEW.custom_data)
+                 THEN (SELECT group_concat(value, ' ') FROM json_each(NEW.custom_data)) END);
+END;
+
+CREATE TRIGGER IF NOT EXISTS assets_fts_ad AFTER DELETE ON assets BEGIN
+    DELETE FROM assets_fts WHERE rowid = OLD.id;
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS parts_fts USING fts5(
+    part_number,
+    part_name,
+    description,
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS parts_fts_ai AFTER INSERT ON parts BEGIN
+    INSERT INTO parts_fts (rowid, part_number, part_name, description)
+    VALUES (NEW.id, NEW.part_number, NEW.part_name, NEW.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS parts_fts_au AFTER UPDATE OF part_number, part_name, description ON parts BEGIN
+    DELETE FROM parts_fts WHERE rowid = OLD.id;
+    INSERT INTO parts_fts (rowid, part_number, part_name, description)
+    VALUES (NEW.id, NEW.part_number, NEW.part_name, NEW.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS parts_fts_ad AFTER DELETE ON parts BEGIN
+    DELETE FROM parts_fts WHERE rowid = OLD.id;
+END;
+
+-- เติมข้อมูลที่มีอยู่แล้วลงในดัชนี
+DELETE FROM assets_fts;
+INSERT INTO assets_fts (rowid, name, location, custom_values)
+SELECT id, name, location,
+       CASE WHEN json_valid(custom_data)
+            THEN (SELECT group_concat(value, ' ') FROM json_each(assets.custom_data)) END
+FROM assets;
+
+DELETE FROM parts_fts;
+INSERT INTO parts_fts (rowid, part_number, part_name, description)
+SELECT id, part_number, part_name, description FROM parts;
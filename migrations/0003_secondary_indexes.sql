@@ -0,0 +1,21 @@
+-- 0003: ดัชนีรองสำหรับคิวรีที่ใช้บ่อย
+-- คอลัมน์ที่ใช้เรียงลำดับถูกรวมไว้ในดัชนีด้วย เพื่อให้ SQLite อ่านตามลำดับได้โดยไม่ต้องใช้ temp b-tree
+
+-- asset_detail: ประวัติการซ่อมของสินทรัพย์เรียงตามวันที่ / reports: รวมค่าใช้จ่ายรายเดือน
+CREATE INDEX IF NOT EXISTS idx_maintenance_history_asset_date ON maintenance_history (asset_id, date);
+CREATE INDEX IF NOT EXISTS idx_maintenance_history_date_cost ON maintenance_history (date, cost);
+
+-- asset_detail / edit_maintenance_point: จุดบำรุงรักษาและรูปภาพ
+CREATE INDEX IF NOT EXISTS idx_maintenance_points_asset_created ON maintenance_points (asset_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_maintenance_point_images_point_date ON maintenance_point_images (maintenance_point_id, upload_date);
+
+-- part_detail: ประวัติการเคลื่อนไหวของอะไหล่
+CREATE INDEX IF NOT EXISTS idx_parts_transactions_part_date ON parts_transactions (part_id, transaction_date);
+
+-- parts_index: เรียงตามชื่อ / กรองตามหมวดหมู่ / แจ้งเตือนสต็อกต่ำ
+CREATE INDEX IF NOT EXISTS idx_parts_name ON parts (part_name);
+CREATE INDEX IF NOT EXISTS idx_parts_category ON parts (category, part_name);
+
+-- delete_part / get_parts_for_maintenance
+CREATE INDEX IF NOT EXISTS idx_maintenance_parts_used_history ON maintenance_parts_used (maintenance_history_id);
+CREATE INDEX IF NOT EXISTS idx_maintenance_parts_used_part ON maintenance_parts_used (part_id);
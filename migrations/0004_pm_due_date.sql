@@ -0,0 +1,11 @@
+-- 0004: คอลัมน์วันครบกำหนด PM ที่ normalize แล้วและทำดัชนีได้
+-- next_pm_date เป็น TEXT ที่อาจเป็นค่าว่าง การกรองด้วย date(next_pm_date) ทำให้ใช้ดัชนีไม่ได้
+-- pm_due_date = date(next_pm_date) เป็น generated column (NULL เมื่อว่างหรือรูปแบบไม่ถูกต้อง)
+
+ALTER TABLE assets ADD COLUMN pm_due_date TEXT GENERATED ALWAYS AS (date(next_pm_date)) VIRTUAL;
+
+-- index(): แผง PM ที่ใกล้ถึงกำหนด / api/pm_events
+CREATE INDEX IF NOT EXISTS idx_assets_pm_due_date ON assets (pm_due_date);
+
+-- my_tasks: งานของช่างแต่ละคน
+CREATE INDEX IF NOT EXISTS idx_assets_technician_due ON assets (technician_id, pm_due_date);
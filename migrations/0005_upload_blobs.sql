@@ -0,0 +1,61 @@
+-- 0005: ที่เก็บไฟล์อัปโหลดแบบอ้างอิงด้วยเนื้อหา (content-addressed)
+-- ไฟล์ใหม่ถูกตั้งชื่อด้วย sha256 ของเนื้อหา ไฟล์ซ้ำจึงถูกเก็บเพียงครั้งเดียว
+-- ref_count = จำนวนแถวใน assets / maintenance_point_images ที่อ้างอิงไฟล์นั้น ดูแลด้วย trigger
+-- ไฟล์เดิมที่ตั้งชื่อแบบเก่าก็ถูกนับด้วย เพื่อให้การลบใช้กฎเดียวกัน
+
+CREATE TABLE IF NOT EXISTS upload_blobs (
+    name TEXT PRIMARY KEY,          -- ชื่อที่เก็บในคอลัมน์ image filename เช่น '<sha256>.jpg'
+    size INTEGER,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- ใช้โดย flask uploads gc
+CREATE INDEX IF NOT EXISTS idx_upload_blobs_unreferenced ON upload_blobs (name) WHERE ref_count <= 0;
+
+INSERT OR IGNORE INTO upload_blobs (name, ref_count)
+SELECT name, COUNT(*) FROM (
+    SELECT asset_image_filename AS name FROM assets
+    WHERE asset_image_filename IS NOT NULL AND asset_image_filename != ''
+    UNION ALL
+    SELECT image_filename FROM maintenance_point_images
+    WHERE image_filename IS NOT NULL AND image_filename != ''
+) GROUP BY name;
+
+CREATE TRIGGER IF NOT EXISTS upload_blobs_asset_ai AFTER INSERT ON assets
+WHEN NEW.asset_image_filename IS NOT NULL AND NEW.asset_image_filename != '' BEGIN
+    INSERT OR IGNORE INTO upload_blobs (name) VALUES (NEW.asset_image_filename);
+    UPDATE upload_blobs SET ref_count = ref_count + 1 WHERE name = NEW.asset_image_filename;
+END;
+
+CREATE TRIGGER IF NOT EXISTS upload_blobs_asset_au AFTER UPDATE OF asset_image_filename ON assets
+WHEN NEW.asset_image_filename IS NOT OLD.asset_image_filename BEGIN
+    UPDATE upload_blobs SET ref_count = ref_count - 1 WHERE name = OLD.asset_image_filename;
+    INSERT OR IGNORE INTO upload_blobs (name)
+    SELECT NEW.asset_image_filename WHERE NEW.asset_image_filename IS NOT NULL AND NEW.asset_image_filename != '';
+    UPDATE upload_blobs SET ref_count = ref_count + 1 WHERE name = NEW.asset_image_filename;
+END;
+
+CREATE TRIGGER IF NOT EXISTS upload_blobs_asset_ad AFTER DELETE ON assets
+WHEN OLD.asset_image_filename IS NOT NULL AND OLD.asset_image_filename != '' BEGIN
+    UPDATE upload_blobs SET ref_count = ref_count - 1 WHERE name = OLD.asset_image_filename;
+END;
+
+CREATE TRIGGER IF NOT EXISTS upload_blobs_point_image_ai AFTER INSERT ON maintenance_point_images
+WHEN NEW.image_filename IS NOT NULL AND NEW.image_filename != '' BEGIN
+    INSERT OR IGNORE INTO upload_blobs (name) VALUES (NEW.image_filename);
+    UPDATE upload_blobs SET ref_count = ref_count + 1 WHERE name = NEW.image_filename;
+END;
+
+CREATE TRIGGER IF NOT EXISTS upload_blobs_point_image_au AFTER UPDATE OF image_filename ON maintenance_point_images
+WHEN NEW.image_filename IS NOT OLD.image_filename BEGIN
+    UPDATE upload_blobs SET ref_count = ref_count - 1 WHERE name = OLD.image_filename;
+    INSERT OR IGNORE INTO upload_blobs (name)
+    SELECT NEW.image_filename WHERE NEW.image_filename IS NOT NULL AND NEW.image_filename != '';
+    UPDATE upload_blobs SET ref_count = ref_count + 1 WHERE name = NEW.image_filename;
+END;
+
+CREATE TRIGGER IF NOT EXISTS upload_blobs_point_image_ad AFTER DELETE ON maintenance_point_images
+WHEN OLD.image_filename IS NOT NULL AND OLD.image_filename != '' BEGIN
+    UPDATE upload_blobs SET ref_count = ref_count - 1 WHERE name = OLD.image_filename;
+END;
@@ -0,0 +1,81 @@
+-- 0006: ตารางสรุปสำหรับหน้ารายงาน (rollup) แทนการ GROUP BY ทั้ง maintenance_history ทุกครั้งที่เปิดหน้า
+-- job_type ถูกเก็บเป็นคอลัมน์จริง ('PM' หรือ 'CM') แทนการตรวจข้อความใน description ตอนแสดงผล
+-- ตารางสรุปถูกอัปเดตด้วย trigger และสร้างใหม่ได้ด้วย flask rebuild-report-rollups
+
+ALTER TABLE maintenance_history ADD COLUMN job_type TEXT NOT NULL DEFAULT 'CM' CHECK (job_type IN ('PM', 'CM'));
+
+-- จัดประเภทประวัติเดิมด้วยกฎเดียวกับที่หน้ารายงานเคยใช้
+UPDATE maintenance_history SET job_type = 'PM'
+WHERE instr(description, 'PM') > 0 OR instr(description, 'บำรุงรักษาเชิงป้องกัน') > 0;
+
+-- ค่าใช้จ่ายและจำนวนงานรายเดือน แยกตามประเภทงาน (month = '' เมื่อ date ไม่ใช่วันที่ที่ถูกต้อง)
+CREATE TABLE IF NOT EXISTS report_monthly_costs (
+    month TEXT NOT NULL,
+    job_type TEXT NOT NULL,
+    job_count INTEGER NOT NULL DEFAULT 0,
+    total_cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, job_type)
+) WITHOUT ROWID;
+
+-- จำนวนงานและค่าใช้จ่ายของแต่ละสินทรัพย์ แยกตามประเภทงาน
+CREATE TABLE IF NOT EXISTS report_asset_job_types (
+    asset_id INTEGER NOT NULL,
+    job_type TEXT NOT NULL,
+    job_count INTEGER NOT NULL DEFAULT 0,
+    total_cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (asset_id, job_type)
+) WITHOUT ROWID;
+
+INSERT INTO report_monthly_costs (month, job_type, job_count, total_cost)
+SELECT COALESCE(strftime('%Y-%m', date), ''), job_type, COUNT(*), COALESCE(SUM(cost), 0)
+FROM maintenance_history GROUP BY 1, 2;
+
+INSERT INTO report_asset_job_types (asset_id, job_type, job_count, total_cost)
+SELECT asset_id, job_type, COUNT(*), COALESCE(SUM(cost), 0)
+FROM maintenance_history GROUP BY 1, 2;
+
+CREATE TRIGGER IF NOT EXISTS report_rollups_ai AFTER INSERT ON maintenance_history BEGIN
+    INSERT INTO report_monthly_costs (month, job_type, job_count, total_cost)
+    VALUES (COALESCE(strftime('%Y-%m', NEW.date), ''), NEW.job_type, 1, COALESCE(NEW.cost, 0))
+    ON CONFLICT (month, job_type) DO UPDATE SET
+        job_count = job_count + 1, total_cost = total_cost + excluded.total_cost;
+    INSERT INTO report_asset_job_types (asset_id, job_type, job_count, total_cost)
+    VALUES (NEW.asset_id, NEW.job_type, 1, COALESCE(NEW.cost, 0))
+    ON CONFLICT (asset_id, job_type) DO UPDATE SET
+        job_count = job_count + 1, total_cost = total_cost + excluded.total_cost;
+END;
+
+CREATE TRIGGER IF NOT EXISTS report_rollups_ad AFTER DELETE ON maintenance_history BEGIN
+    UPDATE report_monthly_costs
+    SET job_count = job_count - 1, total_cost = total_cost - COALESCE(OLD.cost, 0)
+    WHERE month = COALESCE(strftime('%Y-%m', OLD.date), '') AND job_type = OLD.job_type;
+    DELETE FROM report_monthly_costs
+    WHERE month = COALESCE(strftime('%Y-%m', OLD.date), '') AND job_type = OLD.job_type AND job_count <= 0;
+    UPDATE report_asset_job_types
+    SET job_count = job_count - 1, total_cost = total_cost - COALESCE(OLD.cost, 0)
+    WHERE asset_id = OLD.asset_id AND job_type = OLD.job_type;
+    DELETE FROM report_asset_job_types
+    WHERE asset_id = OLD.asset_id AND job_type = OLD.job_type AND job_count <= 0;
+END;
+
+-- การแก้ไขถูกนับเป็นลบแถวเก่าแล้วเพิ่มแถวใหม่
+CREATE TRIGGER IF NOT EXISTS report_rollups_au AFTER UPDATE OF asset_id, date, cost, job_type ON maintenance_history BEGIN
+    UPDATE report_monthly_costs
+    SET job_count = job_count - 1, total_cost = total_cost - COALESCE(OLD.cost, 0)
+    WHERE month = COALESCE(strftime('%Y-%m', OLD.date), '') AND job_type = OLD.job_type;
+    DELETE FROM report_monthly_costs
+    WHERE month = COALESCE(strftime('%Y-%m', OLD.date), '') AND job_type = OLD.job_type AND job_count <= 0;
+    UPDATE report_asset_job_types
+    SET job_count = job_count - 1, total_cost = total_cost - COALESCE(OLD.cost, 0)
+    WHERE asset_id = OLD.asset_id AND job_type = OLD.job_type;
+    DELETE FROM report_asset_job_types
+    WHERE asset_id = OLD.asset_id AND job_type = OLD.job_type AND job_count <= 0;
+    INSERT INTO report_monthly_costs (month, job_type, job_count, total_cost)
+    VALUES (COALESCE(strftime('%Y-%m', NEW.date), ''), NEW.job_type, 1, COALESCE(NEW.cost, 0))
+    ON CONFLICT (month, job_type) DO UPDATE SET
+        job_count = job_count + 1, total_cost = total_cost + excluded.total_cost;
+    INSERT INTO report_asset_job_types (asset_id, job_type, job_count, total_cost)
+    VALUES (NEW.asset_id, NEW.job_type, 1, COALESCE(NEW.cost, 0))
+    ON CONFLICT (asset_id, job_type) DO UPDATE SET
+        job_count = job_count + 1, total_cost = total_cost + excluded.total_cost;
+END;
@@ -0,0 +1,41 @@
+-- 0007: ปฏิทิน PM (/api/pm_events) แบบกรองตามช่วงวันที่และ cache ได้
+-- point_due_date = date(next_check_date) เป็น generated column เช่นเดียวกับ assets.pm_due_date
+-- cache_generations เก็บเลขรุ่นของข้อมูลที่ถูก cache ทุก process อ่านค่านี้เพื่อตรวจว่า cache ยังใช้ได้หรือไม่
+
+ALTER TABLE maintenance_points ADD COLUMN point_due_date TEXT GENERATED ALWAYS AS (date(next_check_date)) VIRTUAL;
+
+CREATE INDEX IF NOT EXISTS idx_maintenance_points_due ON maintenance_points (point_due_date) WHERE status = 'active';
+
+CREATE TABLE IF NOT EXISTS cache_generations (
+    name TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO cache_generations (name) VALUES ('pm_events');
+
+CREATE TRIGGER IF NOT EXISTS pm_events_assets_ai AFTER INSERT ON assets
+WHEN NEW.next_pm_date IS NOT NULL AND NEW.next_pm_date != '' BEGIN
+    UPDATE cache_generations SET generation = generation + 1 WHERE name = 'pm_events';
+END;
+
+CREATE TRIGGER IF NOT EXISTS pm_events_assets_au AFTER UPDATE OF name, next_pm_date ON assets
+WHEN NEW.name IS NOT OLD.name OR NEW.next_pm_date IS NOT OLD.next_pm_date BEGIN
+    UPDATE cache_generations SET generation = generation + 1 WHERE name = 'pm_events';
+END;
+
+CREATE TRIGGER IF NOT EXISTS pm_events_assets_ad AFTER DELETE ON assets BEGIN
+    UPDATE cache_generations SET generation = generation + 1 WHERE name = 'pm_events';
+END;
+
+CREATE TRIGGER IF NOT EXISTS pm_events_points_ai AFTER INSERT ON maintenance_points
+WHEN NEW.next_check_date IS NOT NULL AND NEW.next_check_date != '' BEGIN
+    UPDATE cache_generations SET generation = generation + 1 WHERE name = 'pm_events';
+END;
+
+CREATE TRIGGER IF NOT EXISTS pm_events_points_au AFTER UPDATE OF asset_id, point_name, next_check_date, status ON maintenance_points BEGIN
+    UPDATE cache_generations SET generation = generation + 1 WHERE name = 'pm_events';
+END;
+
+CREATE TRIGGER IF NOT EXISTS pm_events_points_ad AFTER DELETE ON maintenance_points BEGIN
+    UPDATE cache_generations SET generation = generation + 1 WHERE name = 'pm_events';
+END;
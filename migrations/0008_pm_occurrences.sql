@@ -0,0 +1,64 @@
+-- 0008: ตารางกำหนดการ PM ที่คำนวณล่วงหน้า (pm_occurrences) สำหรับสินทรัพย์และจุดบำรุงรักษา
+-- ทุกรอบที่จะถึงภายในช่วง horizon ถูกสร้างด้วยคิวรีเดียว (recursive CTE) ใน refresh_pm_schedule()
+-- trigger บันทึกแหล่งที่เปลี่ยนลง pm_schedule_dirty เพื่อให้คำนวณใหม่เฉพาะส่วนที่เปลี่ยน
+
+CREATE TABLE IF NOT EXISTS pm_occurrences (
+    source_type TEXT NOT NULL CHECK (source_type IN ('asset', 'point')),
+    source_id INTEGER NOT NULL,     -- assets.id หรือ maintenance_points.id
+    seq INTEGER NOT NULL,           -- 0 = รอบถัดไป (อาจเลยกำหนดแล้ว)
+    asset_id INTEGER NOT NULL,
+    technician_id INTEGER,
+    due_date TEXT NOT NULL,
+    PRIMARY KEY (source_type, source_id, seq)
+) WITHOUT ROWID;
+
+-- capacity planning: จำนวนงานตามช่วงวันที่ และตามช่างแต่ละคน
+CREATE INDEX IF NOT EXISTS idx_pm_occurrences_due ON pm_occurrences (due_date, technician_id);
+CREATE INDEX IF NOT EXISTS idx_pm_occurrences_technician_due ON pm_occurrences (technician_id, due_date);
+
+CREATE TABLE IF NOT EXISTS pm_schedule_dirty (
+    source_type TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    PRIMARY KEY (source_type, source_id)
+) WITHOUT ROWID;
+
+-- ช่วงที่คำนวณไว้ล่าสุด (แถวเดียว) ถ้าวันเปลี่ยนหรือ horizon เปลี่ยนจะคำนวณใหม่ทั้งหมด
+CREATE TABLE IF NOT EXISTS pm_schedule_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    projected_from TEXT,
+    projected_until TEXT,
+    refreshed_at TIMESTAMP
+);
+
+INSERT OR IGNORE INTO pm_schedule_state (id) VALUES (1);
+
+CREATE TRIGGER IF NOT EXISTS pm_schedule_assets_ai AFTER INSERT ON assets BEGIN
+    INSERT OR IGNORE INTO pm_schedule_dirty (source_type, source_id) VALUES ('asset', NEW.id);
+END;
+
+-- ช่างของจุดบำรุงรักษาคือช่างของสินทรัพย์ จึงต้องคำนวณจุดของสินทรัพย์นั้นใหม่ด้วย
+CREATE TRIGGER IF NOT EXISTS pm_schedule_assets_au AFTER UPDATE OF next_pm_date, pm_frequency_days, technician_id ON assets BEGIN
+    INSERT OR IGNORE INTO pm_schedule_dirty (source_type, source_id) VALUES ('asset', NEW.id);
+    INSERT OR IGNORE INTO pm_schedule_dirty (source_type, source_id)
+    SELECT 'point', id FROM maintenance_points
+    WHERE asset_id = NEW.id AND NEW.technician_id IS NOT OLD.technician_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS pm_schedule_assets_ad AFTER DELETE ON assets BEGIN
+    DELETE FROM pm_occurrences WHERE source_type = 'asset' AND source_id = OLD.id;
+    DELETE FROM pm_schedule_dirty WHERE source_type = 'asset' AND source_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS pm_schedule_points_ai AFTER INSERT ON maintenance_points BEGIN
+    INSERT OR IGNORE INTO pm_schedule_dirty (source_type, source_id) VALUES ('point', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS pm_schedule_points_au
+AFTER UPDATE OF asset_id, frequency_days, last_checked_date, next_check_date, status ON maintenance_points BEGIN
+    INSERT OR IGNORE INTO pm_schedule_dirty (source_type, source_id) VALUES ('point', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS pm_schedule_points_ad AFTER DELETE ON maintenance_points BEGIN
+    DELETE FROM pm_occurrences WHERE source_type = 'point' AND source_id = OLD.id;
+    DELETE FROM pm_schedule_dirty WHERE source_type = 'point' AND source_id = OLD.id;
+END;
@@ -0,0 +1,15 @@
+-- 0009: บัญชีคุมสต็อก (stock ledger)
+-- balance_after = สต็อกคงเหลือหลังรายการนี้ ถูกเขียนโดย apply_stock_movements() (รายการเก่าเป็น NULL)
+-- trigger ป้องกันสต็อกติดลบจากทุกเส้นทางการเขียน ไม่ใช่เฉพาะจากหน้าเว็บ
+
+ALTER TABLE parts_transactions ADD COLUMN balance_after INTEGER;
+
+CREATE TRIGGER IF NOT EXISTS parts_stock_not_negative BEFORE UPDATE OF current_stock ON parts
+WHEN NEW.current_stock < 0 BEGIN
+    SELECT RAISE(ABORT, 'current_stock cannot be negative');
+END;
+
+CREATE TRIGGER IF NOT EXISTS parts_stock_not_negative_insert BEFORE INSERT ON parts
+WHEN NEW.current_stock < 0 BEGIN
+    SELECT RAISE(ABORT, 'current_stock cannot be negative');
+END;
@@ -0,0 +1,16 @@
+-- 0010: ยอดคงเหลือของอะไหล่ ณ สิ้นวัน (snapshot) สำหรับดูสต็อกย้อนหลังและกระทบยอดกับ current_stock
+-- balance = ยอดหลังรายการ parts_transactions ทุกรายการที่ id <= last_transaction_id
+-- สต็อก ณ วันที่ X = snapshot ล่าสุดที่ไม่เกิน X + รายการหลัง last_transaction_id จนถึงสิ้นวัน X
+-- สร้างด้วย flask stock snapshot (เช่นทุกคืนจาก cron) เฉพาะอะไหล่ที่มีการเคลื่อนไหวตั้งแต่ snapshot ก่อน
+
+CREATE TABLE IF NOT EXISTS parts_stock_snapshots (
+    part_id INTEGER NOT NULL,
+    snapshot_date TEXT NOT NULL,
+    balance INTEGER NOT NULL,
+    last_transaction_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (part_id, snapshot_date)
+) WITHOUT ROWID;
+
+-- ช่วงรายการหลัง snapshot ของอะไหล่หนึ่งชิ้น (part_id = ? AND id > ?)
+CREATE INDEX IF NOT EXISTS idx_parts_transactions_part_id ON parts_transactions (part_id, id);
@@ -0,0 +1,20 @@
+-- 0011: พยากรณ์การสั่งซื้ออะไหล่จากอัตราการใช้จริง (parts_forecast)
+-- คำนวณทุกอะไหล่พร้อมกันในคิวรีเดียวโดย refresh_parts_forecast() (flask stock forecast เช่นทุกคืนจาก cron)
+-- daily_usage = การเบิกที่ไม่ใช่งาน PM ในช่วงย้อนหลัง / จำนวนวัน, pm_demand = ความต้องการจาก PM ที่กำหนดไว้แล้ว
+-- หน้าอะไหล่อ่านตารางนี้แล้วคำนวณจำนวนวันที่สต็อกพอใช้และจำนวนที่ควรสั่งจาก current_stock ตอนแสดงผล
+
+CREATE TABLE IF NOT EXISTS parts_forecast (
+    part_id INTEGER PRIMARY KEY,
+    consumed_qty INTEGER NOT NULL DEFAULT 0,    -- เบิกใช้ทั้งหมดในช่วงย้อนหลัง (รวม PM)
+    daily_usage REAL NOT NULL DEFAULT 0,        -- อัตราการใช้ต่อวันที่ไม่ได้มาจากงาน PM
+    pm_lead_demand REAL NOT NULL DEFAULT 0,     -- ความต้องการจาก PM ที่ถึงกำหนดภายใน lead time
+    pm_demand REAL NOT NULL DEFAULT 0,          -- ความต้องการจาก PM ที่ถึงกำหนดภายใน lead time + review period
+    daily_demand REAL NOT NULL DEFAULT 0,       -- daily_usage + pm_demand เฉลี่ยต่อวัน
+    reorder_point INTEGER NOT NULL DEFAULT 0,   -- สั่งเมื่อ current_stock <= ค่านี้ (รวม minimum_stock เป็น safety stock)
+    target_stock INTEGER NOT NULL DEFAULT 0,    -- จำนวนที่ควรมีหลังสั่ง จำนวนที่ควรสั่ง = target_stock - current_stock
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- การใช้อะไหล่ในงานซ่อมบำรุง (join กับ maintenance_history และการตรวจรายการซ้ำกับ ledger)
+CREATE INDEX IF NOT EXISTS idx_maintenance_parts_used_history ON maintenance_parts_used (maintenance_history_id, part_id);
+CREATE INDEX IF NOT EXISTS idx_parts_transactions_reference ON parts_transactions (reference_type, reference_id);
@@ -0,0 +1,33 @@
+-- 0012: คิวงานเบื้องหลัง (jobs) ที่ request เพิ่มงานแล้วตอบกลับทันที ส่วน flask worker ดึงไปทำ
+-- worker จองงานด้วย UPDATE ... WHERE id = (งานที่พร้อมและ priority สูงสุด) ทีละงาน จึงไม่มีงานถูกทำซ้ำ
+-- งานที่ล้มเหลวถูกตั้ง run_at ใหม่แบบ exponential backoff จนครบ max_attempts แล้วจึงเป็น 'failed'
+-- dedupe_key ป้องกันการเพิ่มงานเดียวกันซ้ำระหว่างที่งานเดิมยังรออยู่หรือกำลังทำ
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',          -- JSON
+    priority INTEGER NOT NULL DEFAULT 0,         -- มากกว่าทำก่อน
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,   -- UTC เหมือน CURRENT_TIMESTAMP
+    dedupe_key TEXT,
+    locked_by TEXT,                              -- '<host>:<pid>:<thread>' ของ worker ที่กำลังทำ
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    result TEXT,                                 -- JSON
+    created_by INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    FOREIGN KEY (created_by) REFERENCES users (id)
+);
+
+-- งานที่พร้อมทำ เรียงตามลำดับที่ worker จอง
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (priority DESC, run_at, id) WHERE status = 'queued';
+-- งานที่ค้างเพราะ worker ตายกลางคัน
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (locked_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_jobs_status_finished ON jobs (status, finished_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key)
+WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running');
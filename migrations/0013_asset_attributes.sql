@@ -0,0 +1,53 @@
+-- 0013: ดัชนีของ custom attribute ของสินทรัพย์ (EAV) สำหรับกรองเช่น voltage > 380 หรือ Brand = ABB
+-- หนึ่งแถวต่อ key ใน assets.custom_data โดย custom_data ยังเป็นข้อมูลหลักที่ใช้แสดงผล
+-- value_num = ตัวเลขที่อ่านได้จากต้นค่า ('380', '380 V', '1,500' -> 380, 380, 1500) หรือ NULL ถ้าไม่ได้ขึ้นต้นด้วยตัวเลข
+-- วันที่แบบ YYYY-MM-DD ไม่ถูกนับเป็นตัวเลข จึงเทียบเป็นข้อความ (เรียงตามวันที่อยู่แล้ว)
+-- ตารางถูกอัปเดตด้วย trigger จากทุกเส้นทางการเขียน (ฟอร์ม, import, seed) และสร้างใหม่ได้ด้วย flask rebuild-search-index
+
+CREATE TABLE IF NOT EXISTS asset_attributes (
+    asset_id INTEGER NOT NULL,
+    attr_key TEXT NOT NULL COLLATE NOCASE,
+    value_text TEXT COLLATE NOCASE,
+    value_num REAL,
+    PRIMARY KEY (asset_id, attr_key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_asset_attributes_text ON asset_attributes (attr_key, value_text);
+CREATE INDEX IF NOT EXISTS idx_asset_attributes_num ON asset_attributes (attr_key, value_num) WHERE value_num IS NOT NULL;
+
+-- แปลง custom_data เป็นแถวของ asset_attributes (ใช้ร่วมกันใน trigger และตอนเติมข้อมูล)
+CREATE VIEW IF NOT EXISTS asset_attribute_source AS
+SELECT a.id AS asset_id,
+       trim(j.key) AS attr_key,
+       trim(j.value) AS value_text,
+       CASE
+           WHEN j.type IN ('integer', 'real') THEN j.value
+           WHEN j.type = 'text' AND (ltrim(replace(j.value, ',', '')) GLOB '[0-9]*'
+                                     OR ltrim(replace(j.value, ',', '')) GLOB '[-+.][0-9]*')
+                                AND NOT ltrim(j.value) GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+               THEN CAST(ltrim(replace(j.value, ',', '')) AS REAL)
+       END AS value_num
+FROM assets a, json_each(CASE WHEN json_valid(a.custom_data) AND json_type(a.custom_data) = 'object'
+                              THEN a.custom_data ELSE '{}' END) j
+WHERE j.type NOT IN ('object', 'array', 'null') AND trim(j.key) != '';
+
+CREATE TRIGGER IF NOT EXISTS asset_attributes_ai AFTER INSERT ON assets BEGIN
+    INSERT OR REPLACE INTO asset_attributes (asset_id, attr_key, value_text, value_num)
+    SELECT asset_id, attr_key, value_text, value_num FROM asset_attribute_source WHERE asset_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS asset_attributes_au AFTER UPDATE OF custom_data ON assets
+WHEN NEW.custom_data IS NOT OLD.custom_data BEGIN
+    DELETE FROM asset_attributes WHERE asset_id = OLD.id;
+    INSERT OR REPLACE INTO asset_attributes (asset_id, attr_key, value_text, value_num)
+    SELECT asset_id, attr_key, value_text, value_num FROM asset_attribute_source WHERE asset_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS asset_attributes_ad AFTER DELETE ON assets BEGIN
+    DELETE FROM asset_attributes WHERE asset_id = OLD.id;
+END;
+
+-- เติมข้อมูลที่มีอยู่แล้วลงในดัชนี
+DELETE FROM asset_attributes;
+INSERT OR REPLACE INTO asset_attributes (asset_id, attr_key, value_text, value_num)
+SELECT asset_id, attr_key, value_text, value_num FROM asset_attribute_source;
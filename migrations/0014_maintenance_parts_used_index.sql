@@ -0,0 +1,6 @@
+-- 0014: ดัชนี (maintenance_history_id, part_id) ของ 0011 ใช้ชื่อซ้ำกับดัชนีคอลัมน์เดียวจาก 0003
+-- CREATE INDEX IF NOT EXISTS จึงข้ามไปและไม่เคยถูกสร้าง ลบดัชนีเดิมแล้วสร้างใหม่ด้วยชื่อของตัวเอง
+-- ดัชนีใหม่ขึ้นต้นด้วย maintenance_history_id จึงใช้แทนดัชนีเดิมได้ทั้งหมด (delete_part, get_parts_for_maintenance)
+
+DROP INDEX IF EXISTS idx_maintenance_parts_used_history;
+CREATE INDEX IF NOT EXISTS idx_maintenance_parts_used_history_part ON maintenance_parts_used (maintenance_history_id, part_id);
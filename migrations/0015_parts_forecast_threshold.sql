@@ -0,0 +1,13 @@
+-- 0015: เก็บจุดสั่งซื้อที่ใช้จริง MAX(minimum_stock, reorder_point) ไว้ใน parts_forecast
+-- หน้าอะไหล่และการแจ้งเตือนสต็อกต่ำกรองด้วย current_stock <= reorder_threshold แทนการคำนวณ MAX ทุกแถวทุกครั้ง
+-- refresh_parts_forecast() เขียนค่านี้ใหม่ทั้งตาราง และ trigger ปรับให้ทันทีเมื่อแก้ minimum_stock (หน้าแก้ไข, import CSV)
+
+ALTER TABLE parts_forecast ADD COLUMN reorder_threshold INTEGER NOT NULL DEFAULT 0;
+
+UPDATE parts_forecast
+SET reorder_threshold = MAX(reorder_point, COALESCE((SELECT minimum_stock FROM parts WHERE parts.id = parts_forecast.part_id), 0));
+
+CREATE TRIGGER IF NOT EXISTS parts_forecast_threshold_au AFTER UPDATE OF minimum_stock ON parts BEGIN
+    UPDATE parts_forecast SET reorder_threshold = MAX(reorder_point, COALESCE(new.minimum_stock, 0))
+    WHERE part_id = new.id;
+END;
@@ -10,7 +10,8 @@ call .\.venv\Scripts\activate
 REM --- Run the Flask Application ---
 echo Starting Flask server. The page will load shortly.
 echo (Press CTRL+C in this window to stop the server)
-python app.py
+REM -m uses the cached bytecode of app.py; running the file directly recompiles it on every launch
+python -m app
 
 echo ===================================================
 echo  Server has been stopped.
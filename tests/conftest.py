@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+# ค่าที่ต้องตั้งก่อน import app: ไม่เขียน cache/log ลงโฟลเดอร์ instance ของโปรเจกต์ และ hash รหัสผ่านแบบเร็ว
+_session_dir = tempfile.mkdtemp(prefix='maintenance-tests-')
+os.environ.setdefault('JINJA_CACHE_FOLDER', '')
+os.environ.setdefault('SLOW_QUERY_LOG', os.path.join(_session_dir, 'slow_queries.jsonl'))
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as maintenance  # noqa: E402
+
+ADMIN_USERNAME = 'admin'
+ADMIN_PASSWORD = 'admin-password'
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """แอปที่ใช้ฐานข้อมูลและโฟลเดอร์อัปโหลดชั่วคราว พร้อมผู้ใช้ admin"""
+    flask_app = maintenance.app
+    database = str(tmp_path / 'maintenance.db')
+    upload_folder = tmp_path / 'uploads'
+    upload_folder.mkdir()
+    monkeypatch.setattr(maintenance, 'DATABASE', database)
+    monkeypatch.setitem(flask_app.config, 'DATABASE', database)
+    monkeypatch.setitem(flask_app.config, 'TESTING', True)
+    monkeypatch.setitem(flask_app.config, 'UPLOAD_FOLDER', str(upload_folder))
+    monkeypatch.setitem(flask_app.config, 'BLOB_FOLDER', str(upload_folder / 'blobs'))
+    monkeypatch.setitem(flask_app.config, 'RENDITION_FOLDER', str(upload_folder / 'renditions'))
+    monkeypatch.setitem(flask_app.config, 'EXPORT_FOLDER', str(tmp_path / 'exports'))
+    monkeypatch.setitem(flask_app.config, 'DB_POOL_TIMEOUT', 2.0)
+    maintenance.reset_pools()
+    # cache ระดับ process อ้างอิงฐานข้อมูลของเทสต์ก่อนหน้า
+    maintenance.invalidate_count_cache()
+    maintenance._pm_events_cache.clear()
+    runner = flask_app.test_cli_runner()
+    result = runner.invoke(args=['init-db'])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(args=['create-admin', ADMIN_USERNAME, ADMIN_PASSWORD])
+    assert result.exit_code == 0, result.output
+    yield flask_app
+    for pool in list(maintenance._pools.values()):
+        pool.close_all()
+    maintenance.reset_pools()
+
+
+@pytest.fixture
+def runner(app):
+    return app.test_cli_runner()
+
+
+@pytest.fixture
+def client(app):
+    """client ที่เข้าสู่ระบบเป็น admin แล้ว"""
+    client = app.test_client()
+    response = client.post('/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def db(app):
+    """connection แยกจาก pool ของแอป สำหรับเตรียมและตรวจข้อมูลในเทสต์"""
+    conn = sqlite3.connect(maintenance.DATABASE)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
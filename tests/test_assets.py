@@ -0,0 +1,33 @@
+import app as maintenance
+
+
+def add_asset(db, name='Pump', points=0, images_per_point=0):
+    asset_id = db.execute("INSERT INTO assets (name, location) VALUES (?, 'Line 1')", (name,)).lastrowid
+    for n in range(points):
+        point_id = db.execute("INSERT INTO maintenance_points (asset_id, point_name, frequency_days) VALUES (?, ?, 7)",
+                              (asset_id, f'Point {n}')).lastrowid
+        db.executemany("INSERT INTO maintenance_point_images (maintenance_point_id, image_filename) VALUES (?, ?)",
+                       [(point_id, f'{point_id}-{i}.png') for i in range(images_per_point)])
+    db.execute("INSERT INTO maintenance_history (asset_id, description, date) VALUES (?, 'PM', '2025-01-01')", (asset_id,))
+    db.commit()
+    return asset_id
+
+
+def queries_for(client, url):
+    before = maintenance.metrics.queries.get('asset_detail', [0, 0])[-2]
+    response = client.get(url)
+    assert response.status_code == 200
+    return maintenance.metrics.queries['asset_detail'][-2] - before
+
+
+def test_asset_detail_query_count_does_not_grow_with_points(client, db):
+    small = add_asset(db, 'Small', points=1, images_per_point=1)
+    large = add_asset(db, 'Large', points=8, images_per_point=3)
+    small_queries = queries_for(client, f'/asset/{small}')
+    assert 0 < small_queries == queries_for(client, f'/asset/{large}')
+    body = client.get(f'/asset/{large}').get_data(as_text=True)
+    assert all(f'Point {n}' in body for n in range(8))
+
+
+def test_asset_detail_missing_asset(client):
+    assert client.get('/asset/999').status_code == 404
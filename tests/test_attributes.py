@@ -0,0 +1,56 @@
+import pytest
+
+import app as maintenance
+
+
+@pytest.fixture
+def assets(db):
+    db.executemany("INSERT INTO assets (name, location, custom_data) VALUES (?, 'Line 1', ?)", [
+        ('Motor A', '{"voltage": 380, "Brand": "ABB", "Serial": "SN-1200"}'),
+        ('Motor B', '{"voltage": "400", "Brand": "abb"}'),
+        ('Motor C', '{"voltage": "1,000", "Brand": "Siemens"}'),
+        ('Fan', '{}'),
+    ])
+    db.commit()
+
+
+def names(client, *filters):
+    response = client.get('/api/assets', query_string=[('attr', f) for f in filters])
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return sorted(item['name'] for item in response.get_json()['items'])
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('voltage>380', ('voltage', '>', 380.0)),
+    ('Brand = ABB', ('Brand', '=', 'ABB')),
+    ('Serial ~ 12', ('Serial', '~', '12')),
+    ('voltage >= 1,000', ('voltage', '>=', 1000.0)),
+])
+def test_parse_attribute_filter(expression, expected):
+    assert maintenance.parse_attribute_filter(expression) == expected
+
+
+def test_attribute_filters(client, assets):
+    assert names(client, 'voltage>380') == ['Motor B', 'Motor C']
+    assert names(client, 'Brand=abb') == ['Motor A', 'Motor B']
+    assert names(client, 'Brand=ABB', 'voltage>=400') == ['Motor B']
+    assert names(client, 'Serial~1200') == ['Motor A']
+    assert names(client, 'Brand!=ABB') == ['Fan', 'Motor C']
+
+
+@pytest.mark.parametrize('expression', ['voltage', 'voltage >', '> 5', ''])
+def test_invalid_attribute_filter_is_400(client, expression):
+    response = client.get('/api/assets', query_string={'attr': expression})
+    assert response.status_code == 400 and 'invalid attribute filter' in response.get_json()['error']
+
+
+def test_attribute_index_follows_custom_data(client, db, assets):
+    keys = {row['key']: row for row in client.get('/api/asset_attributes').get_json()}
+    assert (keys['voltage']['assets'], keys['voltage']['numeric']) == (3, 3)
+    assert (keys['Brand']['assets'], keys['Brand']['numeric']) == (3, 0)
+    db.execute("""UPDATE assets SET custom_data = '{"voltage": 220}' WHERE name = 'Motor C'""")
+    db.execute("DELETE FROM assets WHERE name = 'Motor B'")
+    db.commit()
+    assert names(client, 'voltage<300') == ['Motor C']
+    keys = {row['key']: row['assets'] for row in client.get('/api/asset_attributes').get_json()}
+    assert keys == {'voltage': 2, 'Brand': 1, 'Serial': 1}
@@ -0,0 +1,80 @@
+from werkzeug.security import generate_password_hash
+
+import app as maintenance
+
+
+def add_user(db, username, password, method='pbkdf2:sha256:500'):
+    db.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+               (username, generate_password_hash(password, method=method)))
+    db.commit()
+
+
+def password_hash(db, username):
+    return db.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+
+def test_login_and_logout(app):
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin-password'})
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert session['username'] == 'admin' and session['role'] == 'admin'
+    assert client.get('/logout').status_code == 302
+    with client.session_transaction() as session:
+        assert 'user_id' not in session
+
+
+def test_login_rejects_wrong_password(app):
+    response = app.test_client().post('/login', data={'username': 'admin', 'password': 'nope'})
+    assert response.status_code == 200
+    assert 'ชื่อผู้ใช้หรือรหัสผ่านไม่ถูกต้อง' in response.get_data(as_text=True)
+
+
+def test_login_rehashes_outdated_hash(app, db):
+    add_user(db, 'old', 'secret')
+    response = app.test_client().post('/login', data={'username': 'old', 'password': 'secret'})
+    assert response.status_code == 302
+    assert password_hash(db, 'old').startswith('pbkdf2:sha256:1000$')
+
+
+def test_login_skips_rehash_when_writer_is_busy(app, db, monkeypatch):
+    add_user(db, 'old', 'secret')
+    monkeypatch.setitem(app.config, 'DB_POOL_TIMEOUT', 0.2)
+    maintenance.reset_pools()
+    pool = maintenance.get_pool(readonly=False)
+    writer = pool.acquire()
+    try:
+        response = app.test_client().post('/login', data={'username': 'old', 'password': 'secret'})
+    finally:
+        pool.release(writer)
+    assert response.status_code == 302
+    assert password_hash(db, 'old').startswith('pbkdf2:sha256:500$')
+
+
+def test_login_returns_503_when_hash_queue_is_full(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_QUEUE', 0)
+    maintenance.reset_password_pool()
+    try:
+        response = app.test_client().post('/login', data={'username': 'admin', 'password': 'admin-password'})
+    finally:
+        maintenance.reset_password_pool()
+    assert response.status_code == 503
+
+
+def test_register_creates_user(app, db):
+    client = app.test_client()
+    response = client.post('/register', data={'username': 'new', 'password': 'pw'})
+    assert response.status_code == 302
+    assert password_hash(db, 'new').startswith('pbkdf2:sha256:1000$')
+    response = client.post('/register', data={'username': 'new', 'password': 'pw'})
+    assert 'already registered' in response.get_data(as_text=True)
+
+
+def test_bench_login_command(runner):
+    result = runner.invoke(args=['bench-login', '-n', '6', '--clients', '3',
+                                 '--method', 'pbkdf2:sha256:1000', '--method', 'pbkdf2:sha256:2000'])
+    assert result.exit_code == 0, result.output
+    assert '6 logins from 3 concurrent clients' in result.output
+    assert 'pbkdf2:sha256:1000' in result.output and 'pbkdf2:sha256:2000' in result.output
+    result = runner.invoke(args=['bench-login', '-n', '1', '--method', 'nosuch:1'])
+    assert result.exit_code == 2 and "Invalid hash method 'nosuch'" in result.output
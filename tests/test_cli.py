@@ -0,0 +1,102 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import app as maintenance
+
+SEED_ARGS = ['--technicians', '2', '--assets', '20', '--points', '1', '--history', '50',
+             '--parts', '5', '--transactions', '40']
+
+
+def add_asset_through_pool(app):
+    with app.app_context():
+        db = maintenance.get_db()
+        db.execute("INSERT INTO assets (name, location) VALUES ('Leftover', 'Line 1')")
+        db.commit()
+        maintenance.release_db()
+
+
+def test_init_db_closes_pools_and_removes_wal(app, runner):
+    add_asset_through_pool(app)
+    assert os.path.exists(maintenance.DATABASE + '-wal')
+    result = runner.invoke(args=['init-db'])
+    assert result.exit_code == 0, result.output
+    assert not maintenance._pools
+    with app.app_context():
+        db = maintenance.get_db()
+        assert db.execute("SELECT COUNT(*) FROM assets").fetchone()[0] == 0
+        assert db.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+
+
+def test_seed_reset(app, runner, db):
+    add_asset_through_pool(app)
+    result = runner.invoke(args=['seed', '--reset', *SEED_ARGS])
+    assert result.exit_code == 0, result.output
+    assert 'Seeded in' in result.output and not maintenance._pools
+    with app.app_context():
+        counts = maintenance.get_db().execute(
+            "SELECT (SELECT COUNT(*) FROM assets), (SELECT COUNT(*) FROM assets WHERE name = 'Leftover')").fetchone()
+    assert tuple(counts) == (20, 0)
+
+
+def test_bench_saves_then_compares_baseline(runner, tmp_path):
+    assert runner.invoke(args=['seed', '--reset', *SEED_ARGS]).exit_code == 0
+    baseline = str(tmp_path / 'baseline.json')
+    args = ['bench', '-n', '2', '--warmup', '0', '--route', 'index', '--route', 'parts_index', '--baseline', baseline]
+    result = runner.invoke(args=args)
+    assert result.exit_code == 0, result.output
+    assert f'Saved baseline to {baseline}' in result.output
+    with open(baseline, encoding='utf-8') as f:
+        assert set(json.load(f)['routes']) == {'index', 'parts_index'}
+    result = runner.invoke(args=[*args, '--tolerance', '1000'])
+    assert result.exit_code == 0, result.output
+    assert 'Compared with' in result.output and 'REGRESSION' not in result.output
+
+
+def test_bench_startup_baseline_and_regression(runner, tmp_path, monkeypatch):
+    # วัดด้วย process ใหม่จะใช้ฐานข้อมูลจริงของโปรเจกต์ จึงแทนที่ด้วยเวลาที่กำหนดไว้
+    first_request_ms = iter([100.0, 104.0, 102.0, 200.0])
+    monkeypatch.setattr(maintenance, 'measure_startup', lambda clear_cache=False: {
+        'import_ms': 50.0, 'schema_check_ms': 5.0, 'render_ms': 10.0, 'first_request_ms': next(first_request_ms)})
+    baseline = str(tmp_path / 'startup.json')
+    result = runner.invoke(args=['bench-startup', '-n', '3', '--baseline', baseline])
+    assert result.exit_code == 0 and f'Saved baseline to {baseline}' in result.output
+    with open(baseline, encoding='utf-8') as f:
+        assert json.load(f)['median_ms']['first_request_ms'] == 102.0
+    result = runner.invoke(args=['bench-startup', '-n', '1', '--baseline', baseline])
+    assert result.exit_code == 1 and 'Time to first request: 102.0 -> 200.0 ms (+96%)' in result.output
+    assert 'regressed beyond 25%' in result.output
+
+
+def test_import_time_profile_lists_direct_imports():
+    own_ms, modules = maintenance.import_time_profile(top=5)
+    assert own_ms > 0 and 0 < len(modules) <= 5
+    assert all(ms >= 0 for _, ms in modules)
+
+
+def test_seed_is_reproducible(runner):
+    def fingerprint():
+        # --reset สร้างไฟล์ใหม่ จึงต้องเปิด connection ใหม่ทุกครั้ง
+        with closing(sqlite3.connect(maintenance.DATABASE)) as db:
+            return [db.execute(
+                "SELECT a.name, a.location, a.custom_data, a.next_pm_date, "
+                "(SELECT GROUP_CONCAT(h.date) FROM maintenance_history h WHERE h.asset_id = a.id) "
+                "FROM assets a ORDER BY a.id").fetchall(),
+                db.execute("SELECT last_checked_date, next_check_date FROM maintenance_points ORDER BY id").fetchall(),
+                db.execute("SELECT part_id, quantity, transaction_date FROM parts_transactions ORDER BY id").fetchall()]
+
+    seed = ['seed', '--reset', '--as-of', '2025-01-01', *SEED_ARGS]
+    result = runner.invoke(args=[*seed, '--seed', '7'])
+    assert result.exit_code == 0
+    assert 'as of 2025-01-01' in result.output
+    first = fingerprint()
+    assert all(first)
+    assert runner.invoke(args=[*seed, '--seed', '7']).exit_code == 0
+    assert fingerprint() == first
+    assert runner.invoke(args=[*seed, '--seed', '8']).exit_code == 0
+    assert fingerprint() != first
+    # วันที่ทั้งหมดนับจาก --as-of จึงไม่มีเหตุการณ์ใดเกิดหลังวันนั้น
+    assert max(row[2] for row in first[2]) < '2025-01-01'
+    assert runner.invoke(args=['seed', '--reset', '--as-of', '2025-06-01', '--seed', '7', *SEED_ARGS]).exit_code == 0
+    assert fingerprint() != first
@@ -0,0 +1,78 @@
+import pytest
+
+import app as maintenance
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT * FROM assets", True),
+    ("  -- comment\n  select 1", True),
+    ("/* hint */ VALUES (1)", True),
+    ("WITH x AS (SELECT 1) SELECT * FROM x", True),
+    ("WITH x AS (SELECT 1) INSERT INTO t SELECT * FROM x", False),
+    ("INSERT INTO assets (name) VALUES ('a')", False),
+    ("BEGIN IMMEDIATE", False),
+    ("PRAGMA optimize", False),
+])
+def test_is_read_statement(sql, expected):
+    assert maintenance.is_read_statement(sql) is expected
+
+
+@pytest.fixture
+def short_timeout(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'DB_POOL_TIMEOUT', 0.2)
+    maintenance.reset_pools()
+
+
+def test_writer_is_released_at_commit(app):
+    pool = maintenance.get_pool(readonly=False)
+    with app.test_request_context('/register', method='POST'):
+        db = maintenance.get_db()
+        assert db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+        assert pool.stats()['in_use'] == 0
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('u1', 'x')")
+        assert db.in_transaction and pool.stats()['in_use'] == 1
+        # อ่านระหว่างถือ writer ต้องเห็นแถวที่ยังไม่ commit
+        assert db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 2
+        db.commit()
+        assert not db.in_transaction and pool.stats()['in_use'] == 0
+        assert db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 2
+
+
+def test_read_only_post_does_not_wait_for_writer(app, short_timeout):
+    client = app.test_client()
+    pool = maintenance.get_pool(readonly=False)
+    writer = pool.acquire()
+    try:
+        response = client.post('/login', data={'username': 'admin', 'password': 'wrong'})
+        assert response.status_code == 200
+    finally:
+        pool.release(writer)
+
+
+def test_exhausted_pool_returns_503(app, short_timeout):
+    client = app.test_client()
+    pool = maintenance.get_pool(readonly=False)
+    writer = pool.acquire()
+    try:
+        response = client.post('/register', data={'username': 'someone', 'password': 'pw'})
+    finally:
+        pool.release(writer)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert pool.stats()['timeouts'] == 1
+    response = client.post('/register', data={'username': 'someone', 'password': 'pw'})
+    assert response.status_code == 302
+
+
+def test_db_pool_stats_is_admin_only(app, client):
+    client.get('/')
+    stats = client.get('/api/db_pool_stats').get_json()
+    assert stats['pragma_profile'] == app.config['SQLITE_PRAGMA_PROFILE']
+    readers = [pool for pool in stats['pools'] if pool['readonly']]
+    assert readers and readers[0]['checkouts'] >= 1 and readers[0]['in_use'] == 0
+
+    technician = app.test_client()
+    technician.post('/register', data={'username': 'tech', 'password': 'pw'})
+    technician.post('/login', data={'username': 'tech', 'password': 'pw'})
+    response = technician.get('/api/db_pool_stats')
+    assert response.status_code == 302 and 'pools' not in response.get_data(as_text=True)
@@ -0,0 +1,52 @@
+import csv
+import gzip
+import io
+import json
+
+
+def add_history(db):
+    db.execute("INSERT INTO assets (id, name, location, technician_id) VALUES (1, 'Pump', 'Line 1', 1)")
+    db.execute("INSERT INTO assets (id, name, location) VALUES (2, 'Fan', 'Line 2')")
+    db.executemany("INSERT INTO maintenance_history (asset_id, date, description, cost) VALUES (?, ?, ?, ?)", [
+        (1, '2025-01-01 08:00:00', 'PM, "yearly"', 100.0),
+        (1, '2025-01-31 23:59:59', 'เปลี่ยนสายพาน', 50.5),
+        (2, '2025-02-01 00:00:00', 'CM', None),
+    ])
+    db.commit()
+
+
+def test_export_csv_with_date_filter(client, db):
+    add_history(db)
+    response = client.get('/export/maintenance_history?start=2025-01-01&end=2025-01-31')
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    assert 'maintenance_history_2025-01-01_2025-01-31.csv' in response.headers['Content-Disposition']
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip('\ufeff'))))
+    assert rows[0] == ['ID', 'Asset ID', 'Asset', 'Location', 'Technician', 'Date', 'Description', 'Cost']
+    assert [row[6] for row in rows[1:]] == ['PM, "yearly"', 'เปลี่ยนสายพาน']
+    assert rows[1][4] == 'admin'
+
+
+def test_export_jsonl_gzip_with_filters(client, db):
+    add_history(db)
+    response = client.get('/export/maintenance_history?format=jsonl&gzip=1&location=Line+2')
+    assert response.mimetype == 'application/gzip'
+    assert 'maintenance_history.jsonl.gz' in response.headers['Content-Disposition']
+    lines = gzip.decompress(response.data).decode('utf-8').splitlines()
+    assert [json.loads(line)['asset_name'] for line in lines] == ['Fan']
+    response = client.get('/export/maintenance_history?format=jsonl&technician_id=1&asset_id=1')
+    assert len(response.get_data(as_text=True).splitlines()) == 2
+
+
+def test_export_rejects_bad_format_and_dates(client):
+    response = client.get('/export/maintenance_history?format=xml', follow_redirects=True)
+    assert 'รูปแบบไฟล์ไม่ถูกต้อง' in response.get_data(as_text=True)
+    response = client.get('/export/maintenance_history?start=2025-02-30', follow_redirects=True)
+    assert 'รูปแบบวันที่ไม่ถูกต้อง' in response.get_data(as_text=True)
+
+
+def test_export_asset_history(client, db):
+    add_history(db)
+    response = client.get('/export_asset_history/1')
+    assert 'history_Pump_1.csv' in response.headers['Content-Disposition']
+    assert len(response.get_data(as_text=True).strip().splitlines()) == 3
+    assert client.get('/export_asset_history/999').status_code == 302
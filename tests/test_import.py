@@ -0,0 +1,92 @@
+import pytest
+
+
+def write_csv(tmp_path, text, name='import.csv'):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def run_import(runner, kind, path, *args):
+    result = runner.invoke(args=['import', kind, path, *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_import_assets_with_custom_columns(runner, db, tmp_path):
+    path = write_csv(tmp_path, 'name,location,pm_frequency_days,technician,Brand\n'
+                               'Pump 1,Line 1,30,admin,ABB\n'
+                               'Pump 2,Line 1,x,,\n'
+                               'Pump 3,Line 1,30,ghost,\n')
+    output = run_import(runner, 'assets', path)
+    assert 'inserted 1, updated 0, errors 2' in output
+    assert 'line 3: pm_frequency_days must be a number' in output
+    assert "line 4: unknown technician 'ghost'" in output
+    row = db.execute("SELECT custom_data, technician_id FROM assets WHERE name = 'Pump 1'").fetchone()
+    assert row['custom_data'] == '{"Brand": "ABB"}' and row['technician_id'] == 1
+
+
+@pytest.mark.parametrize('custom_data', ['[1, 2]', '"text"', '5', 'not json'])
+def test_custom_data_must_be_an_object(runner, db, tmp_path, custom_data):
+    path = write_csv(tmp_path, 'name,location,custom_data\n'
+                               'Good,Line 1,"{""a"": 1}"\n'
+                               'Bad,Line 1,"' + custom_data.replace('"', '""') + '"\n')
+    output = run_import(runner, 'assets', path)
+    assert 'inserted 1, updated 0, errors 1' in output
+    assert 'line 3: custom_data must be a JSON object' in output
+    assert db.execute("SELECT custom_data FROM assets WHERE name = 'Good'").fetchone()[0] == '{"a": 1}'
+
+
+@pytest.mark.parametrize('value', ['1e400', '99999999999999999999', '-inf', 'nan'])
+def test_out_of_range_numbers_are_row_errors(runner, db, tmp_path, value):
+    path = write_csv(tmp_path, 'part_number,part_name,unit_price,minimum_stock\n'
+                               'P-1,Good,10,1\n'
+                               f'P-2,Bad,10,{value}\n')
+    output = run_import(runner, 'parts', path)
+    assert 'inserted 1, updated 0, errors 1' in output and 'line 3: minimum_stock' in output
+    assert db.execute("SELECT COUNT(*) FROM parts WHERE part_number LIKE 'P-%'").fetchone()[0] == 1
+
+
+@pytest.mark.parametrize('value', ['1e400', '-inf', 'nan'])
+def test_non_finite_prices_are_row_errors(runner, tmp_path, value):
+    path = write_csv(tmp_path, f'part_number,part_name,unit_price\nP-1,Bad,{value}\n')
+    assert 'line 2: unit_price must be a finite number' in run_import(runner, 'parts', path)
+
+
+def test_dry_run_and_error_report(runner, db, tmp_path):
+    path = write_csv(tmp_path, 'name,location,next_pm_date\nPump 1,Line 1,2025-13-01\nPump 2,Line 1,2025-01-01\n')
+    errors_path = str(tmp_path / 'errors.csv')
+    output = run_import(runner, 'assets', path, '--dry-run', '--errors', errors_path)
+    assert output.startswith('[dry-run] assets: read 2, inserted 1')
+    assert db.execute("SELECT COUNT(*) FROM assets").fetchone()[0] == 0
+    with open(errors_path, encoding='utf-8') as f:
+        assert f.read().splitlines() == ['line,error', '2,"next_pm_date must be YYYY-MM-DD, got \'2025-13-01\'"']
+
+
+def test_update_writes_only_columns_in_header(runner, db, tmp_path):
+    before = dict(db.execute("SELECT * FROM parts WHERE part_number = 'FILTER001'").fetchone())
+    path = write_csv(tmp_path, 'part_number,part_name,unit_price\nFILTER001,กรองอากาศ,199\nNEW001,New part,5\n')
+    assert 'inserted 1, updated 1, errors 0' in run_import(runner, 'parts', path)
+    after = dict(db.execute("SELECT * FROM parts WHERE part_number = 'FILTER001'").fetchone())
+    assert after['unit_price'] == 199
+    assert {k: v for k, v in after.items() if k != 'unit_price'} == {k: v for k, v in before.items() if k != 'unit_price'}
+    new = db.execute("SELECT minimum_stock, current_stock FROM parts WHERE part_number = 'NEW001'").fetchone()
+    assert tuple(new) == (0, 0)
+
+
+def test_asset_and_point_updates_keep_missing_columns(runner, db, tmp_path):
+    path = write_csv(tmp_path, 'name,location,pm_frequency_days,technician,Brand\nPump,Line 1,30,admin,ABB\n', 'a.csv')
+    run_import(runner, 'assets', path)
+    path = write_csv(tmp_path, 'name,location,next_pm_date\nPump,Line 1,2030-01-01\n', 'b.csv')
+    assert 'updated 1' in run_import(runner, 'assets', path)
+    row = db.execute("SELECT * FROM assets WHERE name = 'Pump'").fetchone()
+    assert (row['next_pm_date'], row['pm_frequency_days'], row['technician_id'], row['custom_data']) == \
+        ('2030-01-01', 30, 1, '{"Brand": "ABB"}')
+
+    path = write_csv(tmp_path, 'asset_name,asset_location,point_name,status,frequency_days\n'
+                               'Pump,Line 1,Bearing,inactive,7\n', 'c.csv')
+    run_import(runner, 'points', path)
+    path = write_csv(tmp_path, f"asset_id,point_name,description\n{row['id']},Bearing,Grease\n", 'd.csv')
+    assert 'updated 1' in run_import(runner, 'points', path)
+    point = db.execute("SELECT * FROM maintenance_points WHERE point_name = 'Bearing'").fetchone()
+    assert (point['description'], point['status'], point['frequency_days']) == ('Grease', 'inactive', 7)
@@ -0,0 +1,145 @@
+import os
+import threading
+
+import pytest
+
+import app as maintenance
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """ลงทะเบียนงานสำหรับเทสต์: probe บันทึกจำนวน writer ที่ถูกยืมอยู่ตอนงานทำงาน, boom ล้มเหลวเสมอ"""
+    seen = []
+
+    def probe(payload):
+        seen.append(maintenance.get_pool(readonly=False).stats()['in_use'])
+        return {'echo': payload.get('value')}
+
+    def boom(payload):
+        raise RuntimeError('boom')
+
+    monkeypatch.setitem(maintenance.JOB_HANDLERS, 'probe', probe)
+    monkeypatch.setitem(maintenance.JOB_HANDLERS, 'boom', boom)
+    return seen
+
+
+def enqueue(app, kind, payload=None):
+    with app.app_context():
+        job_id = maintenance.enqueue_job(maintenance.get_db(), kind, payload)
+        maintenance.release_db()
+    return job_id
+
+
+def job_row(db, job_id):
+    return db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def test_worker_does_not_hold_writer_while_job_runs(app, db, handlers):
+    job_id = enqueue(app, 'probe', {'value': 7})
+    maintenance.work_jobs('test:0', threading.Event(), once=True)
+    assert handlers == [0]
+    row = job_row(db, job_id)
+    assert row['status'] == 'done' and row['result'] == '{"echo": 7}'
+
+
+def test_failed_job_is_queued_again(app, db, handlers):
+    job_id = enqueue(app, 'boom')
+    maintenance.work_jobs('test:0', threading.Event(), once=True)
+    row = job_row(db, job_id)
+    assert row['status'] == 'queued' and row['attempts'] == 1
+    assert row['last_error'] == 'RuntimeError: boom'
+
+
+def test_worker_survives_database_errors(app, db, handlers, monkeypatch, capsys):
+    monkeypatch.setitem(app.config, 'JOB_POLL_INTERVAL', 0.01)
+    job_id = enqueue(app, 'probe')
+    claim_job = maintenance.claim_job
+    calls = []
+
+    def flaky_claim(db, worker_id):
+        calls.append(worker_id)
+        if len(calls) == 1:
+            raise maintenance.sqlite3.OperationalError('database is locked')
+        return claim_job(db, worker_id)
+
+    monkeypatch.setattr(maintenance, 'claim_job', flaky_claim)
+    maintenance.work_jobs('test:0', threading.Event(), once=True)
+    assert job_row(db, job_id)['status'] == 'done'
+    assert 'Worker test:0 error (OperationalError: database is locked)' in capsys.readouterr().out
+
+
+def test_jobs_cli(app, runner, db, handlers):
+    result = runner.invoke(args=['jobs', 'enqueue', 'nope'])
+    assert result.exit_code != 0 and 'choose from' in result.output
+    result = runner.invoke(args=['jobs', 'enqueue', 'probe', '--payload', '{"value": 1}'])
+    assert result.exit_code == 0 and 'Queued job #1 (probe)' in result.output
+    result = runner.invoke(args=['worker', '--once', '-c', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'Jobs: done 1' in result.output
+    assert 'probe [done]' in runner.invoke(args=['jobs', 'list']).output
+
+
+def test_jobs_api(app, client, handlers):
+    job_id = enqueue(app, 'probe')
+    response = client.get('/api/jobs')
+    assert response.status_code == 200
+    assert response.get_json()['counts'] == {'queued': 1}
+    assert client.get(f'/api/jobs/{job_id}').get_json()['status'] == 'queued'
+    assert client.get('/api/jobs/999').status_code == 404
+
+
+def test_async_export_download_and_visibility(app, client, db):
+    db.execute("INSERT INTO assets (id, name, location) VALUES (1, 'Pump', 'Line 1')")
+    db.execute("INSERT INTO maintenance_history (asset_id, date, description, cost) VALUES (1, '2025-01-05', 'PM', 10)")
+    db.commit()
+    response = client.get('/export/maintenance_history?async=1&format=jsonl&start=2025-01-01')
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert response.headers['Location'] == f'/api/jobs/{job_id}'
+    assert client.get(f'/jobs/{job_id}/download').status_code == 404  # ยังไม่เสร็จ
+
+    maintenance.work_jobs('test:0', threading.Event(), once=True)
+    response = client.get(f'/jobs/{job_id}/download')
+    assert response.status_code == 200
+    assert 'maintenance_history_2025-01-01_now.jsonl' in response.headers['Content-Disposition']
+    assert b'"description": "PM"' in response.data
+
+    technician = app.test_client()
+    technician.post('/register', data={'username': 'tech', 'password': 'pw'})
+    technician.post('/login', data={'username': 'tech', 'password': 'pw'})
+    assert technician.get(f'/api/jobs/{job_id}').status_code == 404
+    assert technician.get(f'/jobs/{job_id}/download').status_code == 404
+    assert technician.get('/api/jobs').status_code == 302
+
+
+def test_jobs_api_filters_and_limit(app, client, handlers):
+    for kind in ('probe', 'boom', 'probe'):
+        enqueue(app, kind)
+    assert [job['kind'] for job in client.get('/api/jobs?kind=boom').get_json()['jobs']] == ['boom']
+    assert len(client.get('/api/jobs?limit=1').get_json()['jobs']) == 1
+    assert len(client.get('/api/jobs?limit=-1').get_json()['jobs']) == 1
+    assert client.get('/api/jobs?status=done').get_json()['jobs'] == []
+
+
+def test_jobs_retry_and_prune(app, runner, db, handlers):
+    job_id = enqueue(app, 'boom')
+    db.execute("UPDATE jobs SET max_attempts = 1 WHERE id = ?", (job_id,))
+    db.commit()
+    assert 'is not a failed job' in runner.invoke(args=['jobs', 'retry', str(job_id)]).output
+    maintenance.work_jobs('test:0', threading.Event(), once=True)
+    assert job_row(db, job_id)['status'] == 'failed'
+    assert f'Job #{job_id} queued again' in runner.invoke(args=['jobs', 'retry', str(job_id)]).output
+    row = job_row(db, job_id)
+    assert (row['status'], row['attempts']) == ('queued', 0)
+
+    export_folder = app.config['EXPORT_FOLDER']
+    os.makedirs(export_folder, exist_ok=True)
+    with open(os.path.join(export_folder, 'old.csv'), 'w') as f:
+        f.write('x')
+    db.execute("""INSERT INTO jobs (kind, status, result, finished_at)
+                  VALUES ('export_history', 'done', '{"file": "old.csv"}', datetime('now', '-8 days')),
+                         ('probe', 'done', NULL, datetime('now', '-1 day'))""")
+    db.commit()
+    assert 'Deleted 1 finished jobs' in runner.invoke(args=['jobs', 'prune', '--days', '7']).output
+    assert not os.path.exists(os.path.join(export_folder, 'old.csv'))
+    assert db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 2
@@ -0,0 +1,58 @@
+import re
+
+import app as maintenance
+
+
+def sample(text, name, **labels):
+    """ค่าของ series เดียวจากผลของ /metrics (0 ถ้ายังไม่มี)"""
+    match = re.search(rf'^{re.escape(name + maintenance.prometheus_labels(**labels))} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0
+
+
+def test_metrics_count_requests_queries_and_pools(client):
+    before = client.get('/metrics').get_data(as_text=True)
+    assert client.get('/parts').status_code == 200
+    assert client.get('/no-such-page').status_code == 404
+    after = client.get('/metrics').get_data(as_text=True)
+    for labels in ({'endpoint': 'parts_index', 'method': 'GET', 'status': 200},
+                   {'endpoint': 'unmatched', 'method': 'GET', 'status': 404}):
+        assert sample(after, 'http_requests_total', **labels) == sample(before, 'http_requests_total', **labels) + 1
+    queries = sample(after, 'http_request_sql_queries_sum', endpoint='parts_index') \
+        - sample(before, 'http_request_sql_queries_sum', endpoint='parts_index')
+    assert queries >= 2
+    assert sample(after, 'http_request_sql_rows_total', endpoint='parts_index') > 0
+    assert sample(after, 'http_request_template_seconds_total', endpoint='parts_index') > 0
+    assert 'sqlite_pool_checkouts_total{pool="read"}' in after
+    assert 'http_request_duration_seconds_bucket{endpoint="parts_index",method="GET",le="+Inf"}' in after
+
+
+def test_metrics_token_and_disabled_collection(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 's3cret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    headers = {'Authorization': 'Bearer s3cret'}
+    before = client.get('/metrics', headers=headers).get_data(as_text=True)
+
+    monkeypatch.setitem(app.config, 'METRICS_ENABLED', False)
+    client.get('/parts')
+    after = client.get('/metrics', headers=headers).get_data(as_text=True)
+    labels = {'endpoint': 'parts_index', 'method': 'GET', 'status': 200}
+    assert sample(after, 'http_requests_total', **labels) == sample(before, 'http_requests_total', **labels)
+
+
+def test_metrics_refuse_other_networks_without_token(app, client, monkeypatch):
+    remote = {'REMOTE_ADDR': '10.1.2.3'}
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/metrics', environ_base=remote).status_code == 403
+    monkeypatch.setitem(app.config, 'METRICS_ALLOW', '10.0.0.0/8')
+    assert client.get('/metrics', environ_base=remote).status_code == 200
+    assert client.get('/metrics').status_code == 403
+    # เมื่อตั้ง token แล้ว เครือข่ายที่อนุญาตก็ยังต้องส่ง token
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 's3cret')
+    assert client.get('/metrics', environ_base=remote).status_code == 401
+    assert client.get('/metrics', environ_base={**remote, 'REMOTE_ADDR': '192.0.2.1'},
+                      headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_prometheus_labels_are_escaped():
+    assert maintenance.prometheus_labels(path='a"b\\c\nd') == '{path="a\\"b\\\\c\\nd"}'
@@ -0,0 +1,45 @@
+import app as maintenance
+
+
+def index_columns(db, name):
+    db.execute("SELECT 1 FROM sqlite_master LIMIT 1")  # ให้ connection โหลด schema ที่ connection อื่นแก้ไปแล้ว
+    return [row['name'] for row in db.execute(f"PRAGMA index_info({name})")]
+
+
+def test_fresh_database_has_composite_parts_used_index(db):
+    assert index_columns(db, 'idx_maintenance_parts_used_history_part') == ['maintenance_history_id', 'part_id']
+    assert index_columns(db, 'idx_maintenance_parts_used_history') == []
+
+
+def test_upgrade_replaces_colliding_parts_used_index(runner, db):
+    # สภาพของฐานข้อมูลที่ apply ถึง 0013 แล้ว: ยังมีดัชนีคอลัมน์เดียวของ 0003 อยู่
+    db.executescript("""
+        DROP INDEX idx_maintenance_parts_used_history_part;
+        CREATE INDEX idx_maintenance_parts_used_history ON maintenance_parts_used (maintenance_history_id);
+        DROP TRIGGER parts_forecast_threshold_au;
+        ALTER TABLE parts_forecast DROP COLUMN reorder_threshold;
+        DELETE FROM schema_migrations WHERE version >= 14;
+        PRAGMA user_version = 13;
+    """)
+    result = runner.invoke(args=['db', 'upgrade', '--no-explain'])
+    assert result.exit_code == 0, result.output
+    assert 'Applied 0014_maintenance_parts_used_index' in result.output
+    assert 'Applied 0015_parts_forecast_threshold' in result.output
+    assert index_columns(db, 'idx_maintenance_parts_used_history_part') == ['maintenance_history_id', 'part_id']
+    assert index_columns(db, 'idx_maintenance_parts_used_history') == []
+    assert db.execute("PRAGMA user_version").fetchone()[0] == 15
+
+
+def test_db_status_and_up_to_date_upgrade(runner):
+    assert '[x] 0015_parts_forecast_threshold' in runner.invoke(args=['db', 'status']).output
+    assert 'Database is up to date (version 15).' in runner.invoke(args=['db', 'upgrade', '--no-explain']).output
+
+
+def test_db_explain_covers_every_hot_query(runner):
+    result = runner.invoke(args=['db', 'explain'])
+    assert result.exit_code == 0, result.output
+    assert 'ใช้ไม่ได้กับ schema นี้' not in result.output
+    for label, _, _ in maintenance.HOT_QUERIES:
+        assert f'  {label}\n' in result.output
+    history = result.output.split('  asset_detail: history\n')[1].splitlines()[0]
+    assert 'USING INDEX' in history and '!!' not in history
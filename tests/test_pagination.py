@@ -0,0 +1,64 @@
+import pytest
+
+import app as maintenance
+
+
+def add_assets(db, count):
+    db.executemany("INSERT INTO assets (name, location) VALUES (?, ?)",
+                   [(f'Asset {i}', 'Line 1') for i in range(count)])
+    db.commit()
+
+
+@pytest.mark.parametrize('values', [[5], [None, 'x', 1.5], ['2025-01-01', 7]])
+def test_cursor_round_trip(values):
+    assert maintenance.decode_cursor(maintenance.encode_cursor(values)) == values
+
+
+@pytest.mark.parametrize('values', [[[1]], [{'a': 1}], [2 ** 64], {'id': 1}, 'text'])
+def test_cursor_rejects_non_scalar_values(values):
+    assert maintenance.decode_cursor(maintenance.encode_cursor(values)) is None
+
+
+@pytest.mark.parametrize('cursor', ['', '!!!', 'bm90IGpzb24'])
+def test_cursor_rejects_garbage(cursor):
+    assert maintenance.decode_cursor(cursor) is None
+
+
+def test_index_pages_with_cursor(client, db):
+    add_assets(db, 5)
+    response = client.get('/api/assets?per_page=2')
+    page = response.get_json()
+    assert [item['name'] for item in page['items']] == ['Asset 4', 'Asset 3'] and page['total'] == 5
+    page = client.get(f"/api/assets?per_page=2&after={page['next_cursor']}").get_json()
+    assert [item['name'] for item in page['items']] == ['Asset 2', 'Asset 1']
+    assert client.get(f"/?per_page=2&after={page['next_cursor']}").status_code == 200
+
+
+@pytest.mark.parametrize('url', ['/', '/api/assets', '/parts/1'])
+def test_malformed_cursor_is_ignored(client, db, url):
+    add_assets(db, 3)
+    nested = maintenance.encode_cursor([[1, 2]])
+    response = client.get(f'{url}?after={nested}&before={nested}')
+    assert response.status_code == 200
+
+
+def test_count_cache_is_bounded_lru_with_ttl(app, db, monkeypatch):
+    add_assets(db, 3)
+    monkeypatch.setitem(app.config, 'COUNT_CACHE_SIZE', 2)
+    maintenance.invalidate_count_cache()
+    sql = "SELECT COUNT(*) FROM assets WHERE id > ?"
+    with app.test_request_context('/'):
+        assert maintenance.cached_count(sql, (0,)) == 3
+        assert maintenance.cached_count(sql, (1,)) == 2
+        assert maintenance.cached_count(sql, (0,)) == 3  # ใช้ล่าสุด จึงไม่ถูกทิ้ง
+        assert maintenance.cached_count(sql, (2,)) == 1
+        assert list(maintenance._count_cache) == [(sql, (0,)), (sql, (2,))]
+
+        add_assets(db, 1)
+        assert maintenance.cached_count(sql, (0,)) == 3  # ยังไม่หมดอายุ
+        monkeypatch.setitem(app.config, 'COUNT_CACHE_TTL', 0)
+        assert maintenance.cached_count(sql, (3,)) == 1
+        add_assets(db, 1)
+        assert maintenance.cached_count(sql, (3,)) == 2  # หมดอายุทันทีจึงนับใหม่
+    maintenance.invalidate_count_cache()
+    assert not maintenance._count_cache
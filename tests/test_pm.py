@@ -0,0 +1,144 @@
+import pytest
+
+
+def add_asset(db, name='Pump', frequency=30):
+    asset_id = db.execute("INSERT INTO assets (name, location, pm_frequency_days) VALUES (?, 'Line 1', ?)",
+                          (name, frequency)).lastrowid
+    db.commit()
+    return asset_id
+
+
+def test_pm_batch_json(client, db):
+    asset_id = add_asset(db)
+    no_frequency = add_asset(db, 'Fan', None)
+    response = client.post('/perform_pm_batch', json={'asset_ids': [asset_id, no_frequency, 999], 'date': '2025-01-01'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['summary'] == {'done': 1, 'no_frequency': 1, 'not_found': 1}
+    assert db.execute("SELECT next_pm_date FROM assets WHERE id = ?", (asset_id,)).fetchone()[0] == '2025-01-31'
+
+
+@pytest.mark.parametrize('body', [
+    [1, 2],
+    'text',
+    {'asset_ids': '12'},
+    {'asset_ids': {'1': 1}},
+    {'point_ids': 5},
+    {'asset_ids': [True]},
+    {'asset_ids': [1.5]},
+    {'asset_ids': ['x']},
+    {'asset_ids': [[1]]},
+    {'asset_ids': [2 ** 70]},
+    {'asset_ids': [1], 'date': '2025-13-01'},
+    {'asset_ids': [1], 'date': 20250101},
+])
+def test_pm_batch_rejects_malformed_json(client, db, body):
+    add_asset(db)
+    response = client.post('/perform_pm_batch', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+    assert db.execute("SELECT COUNT(*) FROM maintenance_history").fetchone()[0] == 0
+
+
+def test_pm_batch_invalid_json_body(client):
+    response = client.post('/perform_pm_batch', data='{not json', content_type='application/json')
+    assert response.status_code == 400
+
+
+def test_pm_batch_form(client, db):
+    asset_id = add_asset(db)
+    response = client.post('/perform_pm_batch', data={'asset_ids': [str(asset_id)]}, follow_redirects=True)
+    assert 'บันทึกการทำ PM เรียบร้อยแล้ว 1 รายการ' in response.get_data(as_text=True)
+    response = client.post('/perform_pm_batch', data={'asset_ids': ['abc']}, follow_redirects=True)
+    assert 'ข้อมูลที่ส่งมาไม่ถูกต้อง' in response.get_data(as_text=True)
+
+
+def project(runner):
+    result = runner.invoke(args=['pm', 'project'])
+    assert result.exit_code == 0, result.output
+
+
+def queued_projections(db):
+    return db.execute("SELECT COUNT(*) FROM jobs WHERE kind = 'pm_project' AND status = 'queued'").fetchone()[0]
+
+
+def test_pm_capacity_recomputes_few_dirty_assets_inline(client, runner, db):
+    project(runner)
+    asset_id = add_asset(db)
+    db.execute("UPDATE assets SET next_pm_date = date('now', '+1 day') WHERE id = ?", (asset_id,))
+    db.commit()
+    response = client.get('/api/pm_capacity?period=month')
+    assert response.status_code == 200 and response.headers['X-PM-Schedule'] == 'current'
+    assert sum(row['asset_pm'] for row in response.get_json()) == 13  # วันพรุ่งนี้ + ทุก 30 วันใน 365 วัน
+    assert not db.execute("SELECT COUNT(*) FROM pm_schedule_dirty").fetchone()[0]
+    assert queued_projections(db) == 0
+
+
+def test_pm_capacity_queues_full_refresh_and_serves_last_projection(app, client, runner, db, monkeypatch):
+    project(runner)
+    db.execute("UPDATE pm_schedule_state SET projected_from = '2000-01-01' WHERE id = 1")
+    db.commit()
+    add_asset(db)
+    for _ in range(2):
+        response = client.get('/api/pm_capacity')
+        assert response.status_code == 200 and response.headers['X-PM-Schedule'] == 'stale'
+    assert queued_projections(db) == 1
+    assert db.execute("SELECT COUNT(*) FROM pm_schedule_dirty").fetchone()[0] == 1
+
+    monkeypatch.setitem(app.config, 'PM_SCHEDULE_INLINE_MAX', 0)
+    project(runner)
+    add_asset(db, 'Fan')
+    assert client.get('/api/pm_capacity').headers['X-PM-Schedule'] == 'stale'
+
+
+def test_pm_capacity_rejects_bad_period(client):
+    assert client.get('/api/pm_capacity?period=year').status_code == 400
+
+
+def test_pm_events_window_etag_and_invalidation(client, db):
+    asset_id = add_asset(db)
+    db.execute("UPDATE assets SET next_pm_date = '2025-03-10' WHERE id = ?", (asset_id,))
+    db.execute("INSERT INTO maintenance_points (asset_id, point_name, frequency_days, next_check_date) "
+               "VALUES (?, 'Bearing', 7, '2025-04-02')", (asset_id,))
+    db.commit()
+    url = '/api/pm_events?start=2025-03-01T00:00:00+07:00&end=2025-04-01'
+    response = client.get(url)
+    assert [event['start'] for event in response.get_json()] == ['2025-03-10']
+    assert response.get_json()[0]['url'] == f'/asset/{asset_id}'
+    etag = response.headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    db.execute("UPDATE assets SET next_pm_date = '2025-03-11' WHERE id = ?", (asset_id,))
+    db.commit()
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.get_json()[0]['start'] == '2025-03-11'
+    events = client.get('/api/pm_events?start=garbage&end=').get_json()
+    assert sorted(event['start'] for event in events) == ['2025-03-11', '2025-04-02']
+    assert events[[event['start'] for event in events].index('2025-04-02')]['color'] == '#198754'
+
+
+def test_pm_perform_command(runner, db, tmp_path):
+    asset_id = add_asset(db)
+    point_id = db.execute("INSERT INTO maintenance_points (asset_id, point_name, frequency_days) VALUES (?, 'Belt', 7)",
+                          (asset_id,)).lastrowid
+    db.commit()
+    ids_file = tmp_path / 'ids.csv'
+    ids_file.write_text(f'type,id\npoint,{point_id}\npoint,x\nasset,999\n', encoding='utf-8')
+    result = runner.invoke(args=['pm', 'perform', '--asset', str(asset_id), '--file', str(ids_file), '--date', '2025-01-01'])
+    assert result.exit_code == 0, result.output
+    assert 'asset 999: not_found' in result.output and 'Done 2, no frequency 0, not found 1' in result.output
+    assert db.execute("SELECT next_check_date FROM maintenance_points WHERE id = ?", (point_id,)).fetchone()[0] == '2025-01-08'
+
+    result = runner.invoke(args=['pm', 'perform', '--asset', str(asset_id), '--date', '2025-02-30'])
+    assert result.exit_code == 2 and "expected YYYY-MM-DD, got '2025-02-30'" in result.output
+    assert db.execute("SELECT COUNT(*) FROM maintenance_history").fetchone()[0] == 2  # จากรอบแรกเท่านั้น
+
+
+def test_pm_project_command_modes(runner, db):
+    asset_id = add_asset(db)
+    db.execute("UPDATE assets SET next_pm_date = date('now') WHERE id = ?", (asset_id,))
+    db.commit()
+    result = runner.invoke(args=['pm', 'project', '--horizon', '30'])
+    assert result.exit_code == 0 and 'PM schedule full: 2 occurrences written' in result.output
+    assert 'PM schedule current: 0 occurrences written' in runner.invoke(args=['pm', 'project', '--horizon', '30']).output
+    assert 'PM schedule full: 2' in runner.invoke(args=['pm', 'project', '--horizon', '30', '--full']).output
@@ -0,0 +1,42 @@
+import app as maintenance
+
+
+def rollups(db):
+    return {table: sorted(tuple(row) for row in db.execute(f"SELECT * FROM {table}"))
+            for table in maintenance.REPORT_ROLLUP_SOURCES}
+
+
+def test_triggers_keep_rollups_equal_to_a_rebuild(runner, db):
+    db.execute("INSERT INTO assets (id, name, location) VALUES (1, 'Pump', 'Line 1'), (2, 'Fan', 'Line 2')")
+    db.executemany("INSERT INTO maintenance_history (asset_id, date, description, cost, job_type) VALUES (?, ?, ?, ?, ?)", [
+        (1, '2025-01-05', 'PM รายเดือน', 100, 'PM'),
+        (1, '2025-01-20', 'ซ่อมปั๊ม', 40, 'CM'),
+        (2, '2025-02-01', 'PM', None, 'PM'),
+    ])
+    db.execute("UPDATE maintenance_history SET cost = 60, date = '2025-02-10' WHERE description = 'ซ่อมปั๊ม'")
+    db.execute("DELETE FROM maintenance_history WHERE asset_id = 2")
+    db.commit()
+    incremental = rollups(db)
+    assert ('2025-02', 'CM', 1, 60) in [row[:4] for row in incremental['report_monthly_costs']]
+
+    result = runner.invoke(args=['rebuild-report-rollups'])
+    assert result.exit_code == 0 and 'Report rollups rebuilt: 2 months, 1 assets.' in result.output
+    assert rollups(db) == incremental
+
+
+def test_rebuild_reclassifies_job_types(runner, db):
+    db.execute("INSERT INTO assets (id, name, location) VALUES (1, 'Pump', 'Line 1')")
+    db.execute("INSERT INTO maintenance_history (asset_id, date, description, cost, job_type) "
+               "VALUES (1, '2025-01-05', 'บำรุงรักษาเชิงป้องกัน', 10, 'CM')")
+    db.commit()
+    assert runner.invoke(args=['rebuild-report-rollups', '--reclassify']).exit_code == 0
+    assert db.execute("SELECT job_type FROM maintenance_history").fetchone()[0] == 'PM'
+    assert [tuple(row) for row in db.execute("SELECT job_type, job_count FROM report_asset_job_types")] == [('PM', 1)]
+
+
+def test_reports_page(client, db):
+    db.execute("INSERT INTO assets (id, name, location) VALUES (1, 'Pump', 'Line 1')")
+    db.execute("INSERT INTO maintenance_history (asset_id, date, description, cost) VALUES (1, '2025-03-01', 'PM', 1234.5)")
+    db.commit()
+    body = client.get('/reports').get_data(as_text=True)
+    assert 'Mar 2025' in body and '1,234.50' in body
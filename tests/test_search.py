@@ -0,0 +1,51 @@
+import pytest
+
+import app as maintenance
+
+
+def add_assets(db, *rows):
+    db.executemany("INSERT INTO assets (name, location, custom_data) VALUES (?, ?, ?)", rows)
+    db.commit()
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('pump', '"pump"'),
+    ('ปั๊มน้ำ line', '"ปั๊มน้ำ" AND "line"'),
+    ('say "hi"', '"say" AND """hi"""'),
+    ('"quoted"', '"""quoted"""'),
+    ('ab', None),
+    ('   ', None),
+])
+def test_fts_match_expression(query, expected):
+    assert maintenance.fts_match_expression(query) == expected
+
+
+def test_asset_search_by_trigram_and_short_terms(app, db):
+    add_assets(db, ('Water Pump', 'Line 1', '{"Brand": "Grundfos"}'),
+               ('ปั๊มน้ำหลัก', 'อาคาร B', '{}'),
+               ('Fan', 'Line 2', '{}'))
+    with app.test_request_context('/'):
+        names = lambda query: {row['name'] for row in maintenance.search_assets(query)[0]['items']}
+        assert names('pump') == {'Water Pump'}
+        assert names('grundfos') == {'Water Pump'}
+        assert names('ปั๊มน้ำ') == {'ปั๊มน้ำหลัก'}
+        assert names('B') == {'ปั๊มน้ำหลัก'}
+        assert names('Brand') == set()  # ค้นเฉพาะค่า ไม่ใช่ key ของ custom_data
+        assert maintenance.search_assets('line')[1] == 2
+
+
+@pytest.mark.parametrize('query', ['pump', 'ab', '"', 'a" OR "b', '*'])
+def test_search_pages_accept_any_query(client, db, query):
+    add_assets(db, ('Water Pump', 'Line 1', '{}'))
+    assert client.get('/', query_string={'q': query}).status_code == 200
+    assert client.get('/parts', query_string={'q': query}).status_code == 200
+
+
+def test_rebuild_search_index_command(runner, db):
+    add_assets(db, ('Water Pump', 'Line 1', '{"voltage": 380}'))
+    db.execute("DELETE FROM assets_fts")
+    db.commit()
+    result = runner.invoke(args=['rebuild-search-index'])
+    assert result.exit_code == 0, result.output
+    assert 'Search index rebuilt: 1 assets, 5 parts, 1 asset attributes.' in result.output
+    assert db.execute("SELECT rowid FROM assets_fts WHERE assets_fts MATCH '\"pump\"'").fetchall()
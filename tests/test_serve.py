@@ -0,0 +1,43 @@
+import importlib.util
+
+import pytest
+
+import app as maintenance
+
+
+@pytest.fixture
+def servers(app, monkeypatch):
+    """แทนที่ WSGI server จริงด้วยตัวบันทึกอาร์กิวเมนต์ (ค่า config ที่ serve แก้จะถูกคืนหลังเทสต์)"""
+    calls = []
+    monkeypatch.setitem(app.config, 'DB_POOL_READERS', 2)
+    monkeypatch.setattr(app, 'debug', app.debug)
+    # init_database ใช้โฟลเดอร์ instance ของโปรแกรมเสมอ ส่วนฐานข้อมูลของเทสต์ถูกสร้างไว้แล้ว
+    monkeypatch.setattr(maintenance, 'init_database', lambda: None)
+    monkeypatch.setattr(maintenance, '_serve_gunicorn', lambda *args: calls.append(('gunicorn', *args)))
+    monkeypatch.setattr(maintenance, '_serve_waitress', lambda *args: calls.append(('waitress', *args)))
+    return calls
+
+
+def test_serve_warms_up_then_starts_gunicorn(app, runner, db, servers):
+    result = runner.invoke(args=['serve', '--server', 'gunicorn', '-b', '127.0.0.1:9000', '-w', '3', '-t', '6'])
+    assert result.exit_code == 0, result.output
+    assert 'Warmed up in' in result.output and 'gunicorn: 3 workers x 6 threads' in result.output
+    assert servers == [('gunicorn', '127.0.0.1:9000', 3, 6)]
+    assert app.config['DB_POOL_READERS'] == 6 and not app.debug
+    assert db.execute("SELECT projected_from FROM pm_schedule_state").fetchone()[0] is not None
+
+
+def test_serve_without_waitress_is_an_error(runner, servers, monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name, *args: None if name == 'waitress' else find_spec(name, *args))
+    result = runner.invoke(args=['serve', '--server', 'waitress'])
+    assert result.exit_code == 1 and 'no production server installed' in result.output
+    assert servers == []
+
+
+def test_warm_up_connections_fills_pools(app):
+    maintenance.reset_pools()
+    maintenance.warm_up_connections()
+    readers = maintenance.get_pool(readonly=True).stats()
+    assert readers['open'] == readers['idle'] == app.config['DB_POOL_READERS']
+    assert maintenance.get_pool(readonly=False).stats()['open'] == app.config['DB_POOL_WRITERS']
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+import app as maintenance
+
+
+@pytest.fixture
+def slow_log(app, tmp_path, monkeypatch):
+    path = tmp_path / 'slow.jsonl'
+    monkeypatch.setitem(app.config, 'SLOW_QUERY_LOG', str(path))
+    monkeypatch.setitem(app.config, 'SLOW_QUERY_MS', 0.000001)  # บันทึกทุกคิวรี
+    return path
+
+
+def entries(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT * FROM parts WHERE id = 12 AND name = 'x'", "SELECT * FROM parts WHERE id = ? AND name = ?"),
+    ("SELECT * FROM parts\n  WHERE id IN (1, 2, 3)", "SELECT * FROM parts WHERE id IN (?...)"),
+    ("SELECT * FROM parts WHERE id IN (?, ?)", "SELECT * FROM parts WHERE id IN (?...)"),
+])
+def test_normalize_sql(sql, expected):
+    assert maintenance.normalize_sql(sql) == expected
+
+
+def test_parameter_shape_hides_values():
+    assert maintenance.parameter_shape((1, 'secret', None)) == ['int', 'str', 'NoneType']
+    assert maintenance.parameter_shape({'start': '2025'}) == {'start': 'str'}
+    assert maintenance.parameter_shape(list(range(12))) == ['int x12']
+
+
+def test_request_queries_are_logged_with_plan(client, slow_log):
+    client.get('/parts?category=Filter')
+    logged = [entry for entry in entries(slow_log) if entry['source'] == 'parts_index']
+    by_category = [entry for entry in logged if 'p.category = ?' in entry['sql']]
+    assert by_category and by_category[0]['params'] == ['str']
+    assert any('idx_parts_category' in detail for detail in by_category[0]['plan'])
+    assert 'Filter' not in slow_log.read_text(encoding='utf-8')
+
+
+def test_slow_queries_command(runner, slow_log):
+    assert 'No slow queries logged' in runner.invoke(args=['db', 'slow-queries']).output
+    lines = [
+        {'at': '2025-01-01T00:00:00', 'fingerprint': 'aaa', 'sql': 'SELECT a', 'params': [], 'ms': 500, 'rows': 1,
+         'source': 'index', 'plan': ['SCAN assets']},
+        {'at': '2025-02-01T00:00:00', 'fingerprint': 'bbb', 'sql': 'SELECT b', 'params': ['int'], 'ms': 300, 'rows': 2,
+         'source': 'reports', 'plan': []},
+        {'at': '2025-02-02T00:00:00', 'fingerprint': 'bbb', 'sql': 'SELECT b', 'params': ['int'], 'ms': 300, 'rows': 4,
+         'source': 'reports', 'plan': []},
+    ]
+    slow_log.write_text('\n'.join(json.dumps(line) for line in lines) + '\n{"truncated', encoding='utf-8')
+
+    output = runner.invoke(args=['db', 'slow-queries']).output
+    assert '3 slow queries in 2 query types' in output
+    assert output.index('[bbb]') < output.index('[aaa]') and '!! SCAN assets' in output
+    output = runner.invoke(args=['db', 'slow-queries', '--sort', 'max', '--top', '1']).output
+    assert '[aaa]' in output and '[bbb]' not in output
+    output = runner.invoke(args=['db', 'slow-queries', '--since', '2025-02-02', '--clear']).output
+    assert '1 slow queries in 1 query types' in output and 'Slow query log cleared.' in output
+    assert slow_log.read_text(encoding='utf-8') == ''
+
+
+def test_unwritable_log_does_not_fail_bulk_writes(app, client, db, tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(app.config, 'SLOW_QUERY_LOG', str(tmp_path / 'missing' / 'slow.jsonl'))
+    monkeypatch.setitem(app.config, 'SLOW_QUERY_MS', 0.000001)
+    response = client.post('/parts/stock/batch', json={'lines': [{'part_id': 1, 'type': 'in', 'quantity': 2}]})
+    assert response.status_code == 200
+    with app.app_context():
+        conn = maintenance.get_db()
+        conn.executemany("INSERT INTO assets (name, location) VALUES (?, 'Line 1')", [('A',), ('B',)])
+        conn.commit()
+        # ข้อผิดพลาดของ SQL ต้องไม่ถูกแทนที่ด้วยข้อผิดพลาดของ log
+        with pytest.raises(maintenance.sqlite3.OperationalError, match='no such table'):
+            conn.executemany("INSERT INTO nope VALUES (?)", [(1,)])
+    assert db.execute("SELECT COUNT(*) FROM assets").fetchone()[0] == 2
+    assert 'Error writing slow query log' in capsys.readouterr().out
@@ -0,0 +1,195 @@
+import sqlite3
+import threading
+
+import pytest
+
+import app as maintenance
+
+
+def stock(db, part_id):
+    return db.execute("SELECT current_stock FROM parts WHERE id = ?", (part_id,)).fetchone()[0]
+
+
+def test_adjust_stock_form(client, db):
+    before = stock(db, 1)
+    response = client.post('/parts/1/stock', data={'transaction_type': 'out', 'quantity': '2'})
+    assert response.status_code == 302
+    assert stock(db, 1) == before - 2
+    response = client.post('/parts/1/stock', data={'transaction_type': 'out', 'quantity': '9999'}, follow_redirects=True)
+    assert 'ไม่สามารถอัปเดตสต็อกได้' in response.get_data(as_text=True)
+    assert stock(db, 1) == before - 2
+
+
+def test_snapshot_uses_ledger_clock_and_reconcile(client, runner, db):
+    client.post('/parts/1/stock', data={'transaction_type': 'in', 'quantity': '3'})
+    result = runner.invoke(args=['stock', 'snapshot'])
+    assert result.exit_code == 0 and 'Wrote 5 snapshots' in result.output
+    utc_today = db.execute("SELECT date('now')").fetchone()[0]
+    assert {row[0] for row in db.execute("SELECT snapshot_date FROM parts_stock_snapshots")} == {utc_today}
+
+    client.post('/parts/1/stock', data={'transaction_type': 'out', 'quantity': '1'})
+    assert 'All parts match the ledger' in runner.invoke(args=['stock', 'reconcile']).output
+    db.execute("UPDATE parts SET current_stock = current_stock + 1 WHERE id = 2")
+    db.commit()
+    output = runner.invoke(args=['stock', 'reconcile']).output
+    assert '1 parts do not match the ledger' in output and 'BELT002' in output
+
+
+def test_movements_since_reads_only_after_snapshot(app, client, runner, db):
+    runner.invoke(args=['stock', 'snapshot'])
+    client.post('/parts/3/stock', data={'transaction_type': 'in', 'quantity': '4'})
+    with app.app_context():
+        movements = maintenance._movements_since(maintenance.get_db())
+    assert list(movements) == [3] and [m[1:] for m in movements[3]] == [('in', 4)]
+
+
+def test_part_detail_stock_as_of(client, db):
+    utc_today = db.execute("SELECT date('now')").fetchone()[0]
+    response = client.get(f'/parts/1?as_of={utc_today}')
+    assert response.status_code == 200
+    assert client.get('/parts/9999').status_code == 302
+
+
+def test_stock_batch_posts_lines(client, db):
+    response = client.post('/parts/stock/batch', json={
+        'reference_type': 'purchase', 'reference_id': 12,
+        'lines': [{'part_number': 'FILTER001', 'type': 'in', 'quantity': 5},
+                  {'part_id': 2, 'type': 'out', 'quantity': 3, 'unit_cost': 1.5, 'notes': 'pick'}]})
+    assert response.status_code == 200
+    assert response.get_json() == {'posted': 2, 'balances': {'1': 25, '2': 12}}
+    row = db.execute("SELECT reference_type, reference_id, balance_after FROM parts_transactions "
+                     "WHERE part_id = 2 ORDER BY id DESC LIMIT 1").fetchone()
+    assert tuple(row) == ('purchase', 12, 12)
+
+
+@pytest.mark.parametrize('body', [
+    [{'part_id': 1, 'type': 'in', 'quantity': 1}],
+    {'lines': []},
+    {'lines': {'part_id': 1}},
+    {'lines': [1]},
+    {'lines': [{'part_id': 1, 'type': 'in', 'quantity': 1}], 'reference_id': 'x'},
+    {'lines': [{'part_id': 1, 'type': 'in', 'quantity': 1}], 'reference_type': ['a']},
+])
+def test_stock_batch_rejects_malformed_body(client, body):
+    assert client.post('/parts/stock/batch', json=body).status_code == 400
+
+
+@pytest.mark.parametrize('line, error', [
+    ({'part_id': True, 'type': 'in', 'quantity': 1}, 'part_id must be an integer'),
+    ({'part_id': '1', 'type': 'in', 'quantity': 1}, 'part_id must be an integer'),
+    ({'part_id': 2 ** 64, 'type': 'in', 'quantity': 1}, 'part_id must be an integer'),
+    ({'part_number': ['FILTER001'], 'type': 'in', 'quantity': 1}, 'part_number must be a string'),
+    ({'part_number': {'a': 1}, 'type': 'in', 'quantity': 1}, 'part_number must be a string'),
+    ({'part_number': 'NOPE', 'type': 'in', 'quantity': 1}, "unknown part 'NOPE'"),
+    ({'part_id': 1, 'type': 'in', 'quantity': 1, 'unit_cost': 'cheap'}, 'unit_cost must be a number'),
+    ({'part_id': 1, 'type': 'in', 'quantity': 2 ** 64}, 'quantity must be a positive integer'),
+    ({'part_id': 1, 'type': 'in', 'quantity': True}, 'quantity must be a positive integer'),
+    ({'part_id': 1, 'type': 'move', 'quantity': 1}, 'type must be one of'),
+    ({'part_id': 999, 'type': 'in', 'quantity': 1}, 'part 999 not found'),
+    ({'part_id': 1, 'type': 'out', 'quantity': 999}, 'cannot issue 999'),
+])
+def test_stock_batch_line_errors(client, db, line, error):
+    before = db.execute("SELECT COUNT(*) FROM parts_transactions").fetchone()[0]
+    response = client.post('/parts/stock/batch', json={'lines': [{'part_id': 3, 'type': 'in', 'quantity': 1}, line]})
+    assert response.status_code == 409
+    errors = response.get_json()['errors']
+    assert len(errors) == 1 and errors[0]['line'] == 2 and error in errors[0]['error']
+    assert db.execute("SELECT COUNT(*) FROM parts_transactions").fetchone()[0] == before
+
+
+def test_concurrent_stock_batches_keep_ledger_consistent(app, db, monkeypatch):
+    monkeypatch.setitem(app.config, 'DB_POOL_TIMEOUT', 30.0)
+    maintenance.reset_pools()
+    start_filter, start_belt = stock(db, 1), stock(db, 2)
+    statuses = []
+
+    def post_batches():
+        client = app.test_client()
+        client.post('/login', data={'username': 'admin', 'password': 'admin-password'})
+        for _ in range(6):
+            response = client.post('/parts/stock/batch', json={'lines': [
+                {'part_id': 1, 'type': 'out', 'quantity': 1},
+                {'part_number': 'BELT002', 'type': 'in', 'quantity': 2},
+            ]})
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=post_batches) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    posted = statuses.count(200)
+    assert posted == start_filter and statuses.count(409) == len(statuses) - posted
+    assert stock(db, 1) == 0 and stock(db, 2) == start_belt + 2 * posted
+    for part_id in (1, 2):
+        ledger = db.execute("""
+            SELECT SUM(CASE transaction_type WHEN 'in' THEN quantity ELSE -quantity END) FROM parts_transactions
+            WHERE part_id = ?
+        """, (part_id,)).fetchone()[0]
+        last_balance = db.execute("SELECT balance_after FROM parts_transactions WHERE part_id = ? ORDER BY id DESC LIMIT 1",
+                                  (part_id,)).fetchone()[0]
+        assert ledger == last_balance == stock(db, part_id)
+    assert not db.execute("SELECT COUNT(*) FROM parts_transactions WHERE balance_after < 0").fetchone()[0]
+    with pytest.raises(sqlite3.IntegrityError, match='current_stock cannot be negative'):
+        db.execute("UPDATE parts SET current_stock = current_stock - 1 WHERE id = 1")
+    db.rollback()
+
+
+def test_stock_forecast_command_and_parts_search(client, runner, db):
+    for _ in range(3):
+        client.post('/parts/1/stock', data={'transaction_type': 'out', 'quantity': '5'})
+    result = runner.invoke(args=['stock', 'forecast', '--window', '30', '--lead-time', '60', '--review', '30'])
+    assert result.exit_code == 0, result.output
+    assert 'Forecast 5 parts' in result.output and 'FILTER001: stock 5' in result.output
+    row = db.execute("SELECT daily_demand, reorder_point, reorder_threshold FROM parts_forecast WHERE part_id = 1").fetchone()
+    assert row['daily_demand'] == pytest.approx(0.5) and row['reorder_point'] >= 30
+    assert row['reorder_threshold'] == row['reorder_point']
+    # ค้นหาอะไหล่ต้อง join ดัชนีค้นหาได้พร้อมกับ parts_forecast
+    for query in ('FILTER001', 'FI'):
+        body = client.get('/parts', query_string={'q': query}).get_data(as_text=True)
+        assert 'FILTER001' in body and 'BELT002' not in body
+
+
+def test_low_stock_threshold_follows_minimum_stock(app, runner, db):
+    def low_stock_ids():
+        with app.app_context():
+            return [part['id'] for part in maintenance.get_parts_low_stock()]
+
+    assert runner.invoke(args=['stock', 'forecast']).exit_code == 0
+    assert 2 not in low_stock_ids()
+    # แก้ minimum_stock หลังพยากรณ์แล้ว จุดสั่งซื้อที่เก็บไว้ต้องตามทันโดยไม่ต้องรัน forecast ใหม่
+    minimum = stock(db, 2) + 5
+    db.execute("UPDATE parts SET minimum_stock = ? WHERE id = 2", (minimum,))
+    db.commit()
+    assert db.execute("SELECT reorder_threshold FROM parts_forecast WHERE part_id = 2").fetchone()[0] == minimum
+    assert 2 in low_stock_ids()
+
+
+def test_stock_bench_command(runner, monkeypatch):
+    result = runner.invoke(args=['stock', 'bench', '--threads', '3', '--batches', '10', '--lines', '5', '--parts', '4'])
+    assert result.exit_code == 0, result.output
+    assert '3 writers: ' in result.output and '-> OK' in result.output
+
+    # ตรวจว่าถ้า ledger ไม่ตรงกับสต็อก คำสั่งจบด้วยสถานะผิดพลาด
+    def skip_ledger(db, movements, reference_type=None, **kwargs):
+        db.execute("UPDATE parts SET current_stock = current_stock + 1 WHERE id = ?", (movements[0]['part_id'],))
+        db.commit()
+
+    monkeypatch.setattr(maintenance, 'apply_stock_movements', skip_ledger)
+    result = runner.invoke(args=['stock', 'bench', '--threads', '1', '--batches', '1', '--lines', '1', '--parts', '1'])
+    assert result.exit_code == 1 and 'stock ledger invariants failed' in result.output
+
+
+def test_snapshot_for_a_past_date_and_bad_date(client, runner, db):
+    client.post('/parts/1/stock', data={'transaction_type': 'in', 'quantity': '3'})
+    db.execute("UPDATE parts_transactions SET transaction_date = '2025-01-01 10:00:00'")
+    db.commit()
+    result = runner.invoke(args=['stock', 'snapshot', '--date', '2024-12-31'])
+    assert result.exit_code == 0 and 'Wrote 0 snapshots' in result.output
+    result = runner.invoke(args=['stock', 'snapshot', '--date', '2025-01-01'])
+    assert result.exit_code == 0 and 'Wrote 5 snapshots' in result.output
+    result = runner.invoke(args=['stock', 'snapshot', '--date', 'garbage'])
+    assert result.exit_code == 2 and "expected YYYY-MM-DD, got 'garbage'" in result.output
+    assert {row[0] for row in db.execute("SELECT snapshot_date FROM parts_stock_snapshots")} == {'2025-01-01'}
+    assert client.get('/parts/1?as_of=garbage').status_code == 200
@@ -0,0 +1,182 @@
+import io
+import os
+import threading
+
+import app as maintenance
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+def blob(db, name):
+    return db.execute("SELECT ref_count FROM upload_blobs WHERE name = ?", (name,)).fetchone()
+
+
+def real_image(size=(1200, 800)):
+    from PIL import Image
+    image = io.BytesIO()
+    Image.new('RGB', size, 'red').save(image, 'PNG')
+    return image.getvalue()
+
+
+def add_asset_with_image(client, content=PNG, name='Pump'):
+    response = client.post('/add_asset', data={'name': name, 'location': 'Line 1',
+                                               'asset_image': (io.BytesIO(content), 'photo.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+
+
+def test_upload_is_content_addressed_and_served(app, client, db):
+    add_asset_with_image(client)
+    add_asset_with_image(client, name='Pump 2')
+    names = {row[0] for row in db.execute("SELECT asset_image_filename FROM assets")}
+    assert len(names) == 1
+    name = names.pop()
+    assert maintenance.BLOB_NAME_RE.match(name) and blob(db, name)['ref_count'] == 2
+    response = client.get(f'/uploads/{name}')
+    assert response.status_code == 200 and response.data == PNG
+    assert 'immutable' in response.headers['Cache-Control']
+    assert client.get('/uploads/0000.png').status_code == 404
+    assert client.get(f'/uploads/huge/{name}').status_code == 404
+
+
+def test_deleting_last_reference_purges_file(app, client, db):
+    add_asset_with_image(client)
+    asset_id, name = db.execute("SELECT id, asset_image_filename FROM assets").fetchone()
+    with app.app_context():
+        path = maintenance.upload_path(name)
+    assert os.path.isfile(path)
+    assert client.post(f'/delete_asset/{asset_id}').status_code == 302
+    maintenance.work_jobs('test:0', threading.Event(), once=True)
+    assert blob(db, name) is None and not os.path.exists(path)
+
+
+def test_purge_does_not_remove_blob_reused_by_concurrent_upload(app, db, monkeypatch):
+    # writer หลายตัวเหมือนมีหลาย process จึงต้องพึ่ง write lock ของ SQLite ไม่ใช่ pool
+    monkeypatch.setitem(app.config, 'DB_POOL_WRITERS', 4)
+    monkeypatch.setitem(app.config, 'DB_POOL_TIMEOUT', 30.0)
+    maintenance.reset_pools()
+    for round_no in range(20):
+        content = PNG + round_no.to_bytes(2, 'big')
+        with app.test_request_context('/add_asset', method='POST'):
+            name = maintenance.store_upload(io.BytesIO(content), 'photo.png')
+            maintenance.get_db().commit()  # ไฟล์ที่ไม่มีแถวอ้างอิง (ref_count 0) รอถูก purge
+            path = maintenance.upload_path(name)
+        done = threading.Event()
+
+        def purge():
+            while not done.is_set():
+                with app.app_context():
+                    maintenance.purge_unreferenced_uploads(maintenance.get_db(), [name])
+
+        purger = threading.Thread(target=purge)
+        purger.start()
+        try:
+            with app.test_request_context('/add_asset', method='POST'):
+                db_conn = maintenance.get_db()
+                reused = maintenance.store_upload(io.BytesIO(content), 'photo.png')
+                db_conn.execute("INSERT INTO assets (name, location, asset_image_filename) VALUES (?, 'Line 1', ?)",
+                                (f'Asset {round_no}', reused))
+                db_conn.commit()
+        finally:
+            done.set()
+            purger.join()
+        assert blob(db, name)['ref_count'] == 1
+        assert os.path.isfile(path), f'round {round_no}: referenced blob was deleted'
+
+
+def test_uploads_gc_command(app, runner, db):
+    with app.test_request_context('/add_asset', method='POST'):
+        name = maintenance.store_upload(io.BytesIO(PNG), 'photo.png')
+        maintenance.get_db().commit()
+        path = maintenance.upload_path(name)
+    stale = os.path.join(app.config['BLOB_FOLDER'], 'tmp', 'leftover')
+    with open(stale, 'wb') as f:
+        f.write(b'x')
+    os.utime(stale, (0, 0))
+    result = runner.invoke(args=['uploads', 'gc'])
+    assert 'Removed 1 unreferenced files and 1 stale temporary files.' in result.output
+    assert not os.path.exists(path) and not os.path.exists(stale) and blob(db, name) is None
+
+
+def test_images_backfill_command(app, runner, monkeypatch):
+    with app.test_request_context('/add_asset', method='POST'):
+        db = maintenance.get_db()
+        name = maintenance.store_upload(io.BytesIO(real_image()), 'photo.png')
+        db.execute("INSERT INTO assets (name, location, asset_image_filename) VALUES ('Pump', 'Line 1', ?)", (name,))
+        db.commit()
+    result = runner.invoke(args=['images', 'backfill', '--workers', '1', '--force'])
+    assert result.exit_code == 0, result.output
+    assert 'Processing 1 images' in result.output and ', 0 failed' in result.output
+
+    import importlib.util
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name, *args: None if name == 'PIL' else find_spec(name, *args))
+    assert 'Pillow is not installed' in runner.invoke(args=['images', 'backfill']).output
+
+
+def test_rendition_falls_back_to_original_until_generated(client, db):
+    content = real_image()
+    add_asset_with_image(client, content)
+    name = db.execute("SELECT asset_image_filename FROM assets").fetchone()[0]
+    db.execute("DELETE FROM jobs")  # ให้ route เป็นผู้เพิ่มงานเอง
+    db.commit()
+    maintenance._recent_renditions.clear()
+    assert client.get(f'/uploads/huge/{name}').status_code == 404
+
+    response = client.get(f'/uploads/thumb/{name}')
+    assert response.status_code == 200 and response.data == content
+    assert response.headers['Cache-Control'].startswith('no-cache')
+    assert [tuple(row) for row in db.execute("SELECT kind, priority FROM jobs")] == [('renditions', 10)]
+
+    maintenance.work_jobs('test:0', threading.Event(), once=True)
+    response = client.get(f'/uploads/thumb/{name}')
+    assert response.mimetype == 'image/jpeg' and 'max-age=' in response.headers['Cache-Control']
+    from PIL import Image
+    assert max(Image.open(io.BytesIO(response.data)).size) == maintenance.IMAGE_RENDITIONS['thumb']
+
+
+def test_upload_conditional_and_range_requests(app, client, db, monkeypatch):
+    add_asset_with_image(client)
+    name = db.execute("SELECT asset_image_filename FROM assets").fetchone()[0]
+    response = client.get(f'/uploads/{name}')
+    etag = response.headers['ETag']
+    assert etag == f'"{name.split(".")[0]}"'
+    assert client.get(f'/uploads/{name}', headers={'If-None-Match': etag}).status_code == 304
+    response = client.get(f'/uploads/{name}', headers={'Range': 'bytes=0-7'})
+    assert response.status_code == 206 and response.data == PNG[:8]
+    assert response.headers['Content-Range'] == f'bytes 0-7/{len(PNG)}'
+    assert client.get(f'/uploads/{name}', headers={'Range': 'bytes=9999-'}).status_code == 416
+    assert app.test_client().get(f'/uploads/{name}').status_code == 302  # ต้อง login
+
+    # ไฟล์ชื่อเดิมก่อนใช้ hash ยังเปลี่ยนได้ จึงต้องตรวจกับ server ทุกครั้ง
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'legacy.png'), 'wb') as f:
+        f.write(PNG)
+    response = client.get('/uploads/legacy.png')
+    assert response.status_code == 200 and 'no-cache' in response.headers['Cache-Control']
+
+    monkeypatch.setitem(app.config, 'UPLOAD_SENDFILE', 'x-accel-redirect')
+    response = client.get(f'/uploads/{name}')
+    assert response.headers['X-Accel-Redirect'].startswith(app.config['UPLOAD_ACCEL_PREFIX'].rstrip('/') + '/')
+    assert response.headers['X-Accel-Redirect'].endswith(name) and not response.data
+
+
+def test_uploads_migrate_moves_legacy_files(app, runner, db):
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'legacy.png'), 'wb') as f:
+        f.write(PNG)
+    db.execute("INSERT INTO assets (name, location, asset_image_filename) VALUES ('Pump', 'Line 1', 'legacy.png')")
+    db.execute("INSERT INTO assets (name, location, asset_image_filename) VALUES ('Fan', 'Line 1', 'gone.png')")
+    point_id = db.execute("INSERT INTO maintenance_points (asset_id, point_name) VALUES (1, 'Belt')").lastrowid
+    db.execute("INSERT INTO maintenance_point_images (maintenance_point_id, image_filename) VALUES (?, 'legacy.png')",
+               (point_id,))
+    db.commit()
+    result = runner.invoke(args=['uploads', 'migrate'])
+    assert result.exit_code == 0, result.output
+    assert 'Moved 1 files, 1 missing or not images.' in result.output
+    name = db.execute("SELECT asset_image_filename FROM assets WHERE name = 'Pump'").fetchone()[0]
+    assert maintenance.BLOB_NAME_RE.match(name) and blob(db, name)['ref_count'] == 2
+    assert db.execute("SELECT image_filename FROM maintenance_point_images").fetchone()[0] == name
+    assert blob(db, 'legacy.png') is None
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'legacy.png'))
+    with app.app_context():
+        assert os.path.isfile(maintenance.upload_path(name))
+    assert 'Moved 0 files, 1 missing' in runner.invoke(args=['uploads', 'migrate']).output